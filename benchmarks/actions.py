@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""actions.py - Per-production overhead of LLParser on the expression grammar
+
+Parses a long expression with the grammar from ``pcc/ll_test.py``, both
+end-to-end and from a pre-lexed list of lexemes (which leaves only the
+table driver, the reductions and the semantic actions), and compares the
+latter with the cost of calling the same actions directly.
+
+Run from the project root::
+
+    $ python3 benchmarks/actions.py [--terms N] [--repeat R]
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+import pcc.ll as ll
+from pcc.symbols import Lexeme, EOF
+from threads import expression_parser
+
+def best(function,repeat):
+    "Best wall clock time of `repeat` calls of `function`."
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    options = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    options.add_argument('--terms',type=int,default=2000,
+                         help='terms in the parsed expression')
+    options.add_argument('--repeat',type=int,default=5)
+    args = options.parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(),10 * args.terms))
+
+    parser = expression_parser()
+    parser.finalize()
+    input = "+".join("({}*2+3)".format(i % 10) for i in range(args.terms))
+    lexemes = list(parser.lexer.lex(input)) + [Lexeme(EOF,"EOF",-1,-1)]
+
+    # Record every action call (with its real arguments) to replay them
+    tree = parser.parsetree(input)
+    reductions = len(tree)
+    calls = []
+    def recorder(action):
+        def record(values):
+            calls.append((action,list(values)))
+            return action(values)
+        return record
+    tree.productions = [(symbol,rule,recorder(action))
+                        for symbol, rule, action in tree.productions]
+    tree.fold()
+    def actions_only():
+        for action, values in calls:
+            action(values)
+
+    def parse_lexed():
+        parser._parse_lexemes(ll._ListLexemeIterator(lexemes))
+
+    full = best(lambda: parser.parse(input),args.repeat)
+    driver = best(parse_lexed,args.repeat)
+    actions = best(actions_only,args.repeat)
+    print('{} lexemes, {} reductions'.format(len(lexemes),reductions))
+    print('parse (with lexing):   {:8.2f} ms'.format(full * 1000))
+    print('parse (pre-lexed):     {:8.2f} ms  ({:.0f} ns/reduction)'.format(
+          driver * 1000, driver / reductions * 1e9))
+    print('actions alone:         {:8.2f} ms  ({:.0f} ns/reduction)'.format(
+          actions * 1000, actions / reductions * 1e9))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""grammars.py - Grammars and input corpora for the benchmark suite
+
+Every grammar is built by a function taking a parser class (and keyword
+arguments for it) and returning an unfinalized parser. Each comes with a
+``*_corpus(rng, docs)`` function returning a list of inputs for it, and (for
+grammars with nesting) a ``*_nested(depth)`` function returning one input
+nested `depth` levels deep.
+
+Nothing here is random unless given a seeded ``random.Random``, so that
+results can be checked against ``baselines.json`` (see ``suite.py``.)
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from pcc.lexer import Lexer
+from pcc.ll import LLParser
+
+## Expressions
+
+def expression_grammar(parser_class=LLParser,**options):
+    "Grammar 4.28 in Aho, Ullman et al (except NUM instead of id)"
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = parser_class(lexer,**options)
+    p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+    p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+    p.ap('EP',"", lambda x: 0)
+    p.ap('T',"F TP", lambda x: x[0] * x[1])
+    p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+    p.ap('TP',"", lambda x: 1)
+    p.ap('F',"'(' E ')'", lambda x: x[1])
+    p.ap('F',"NUM", lambda x: int(x[0]))
+    return p
+
+def operator_grammar(parser_class=LLParser,**options):
+    """``expression_grammar`` with ``LLParser.addexpression``: the same
+    language and values, parsed by operator precedence."""
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = parser_class(lexer,**options)
+    p.ap('S','E', lambda x: x[0], start_production=True)
+    p.addexpression('E','F',[("'+'",1,'left',lambda x: x[0] + x[2]),
+                             ("'*'",2,'left',lambda x: x[0] * x[2])])
+    p.ap('F',"'(' E ')'", lambda x: x[1])
+    p.ap('F',"NUM", lambda x: int(x[0]))
+    return p
+
+def expression_corpus(rng,docs):
+    return [_expression(rng,3) for i in range(docs)]
+
+def _expression(rng,depth):
+    terms = []
+    for i in range(rng.randint(1,4)):
+        factors = []
+        for j in range(rng.randint(1,3)):
+            if depth and rng.random() < 0.3:
+                factors.append('(' + _expression(rng,depth - 1) + ')')
+            else:
+                factors.append(str(rng.randint(0,99)))
+        terms.append('*'.join(factors))
+    return ' + '.join(terms)
+
+def expression_nested(depth):
+    return '(' * depth + '1' + ')' * depth
+
+## JSON
+
+def json_grammar(parser_class=LLParser,**options):
+    "RFC 8259 JSON, building the same values as ``json.loads``."
+    lexer = Lexer()
+    lexer.addtoken(name='STRING',
+                   rule=r'"(?:[^"\\]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"')
+    lexer.addtoken(name='NUMBER',
+                   rule=r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?')
+    lexer.addtoken(name='TRUE',rule=r'true')
+    lexer.addtoken(name='FALSE',rule=r'false')
+    lexer.addtoken(name='NULL',rule=r'null')
+    p = parser_class(lexer,**options)
+    p.ap('DOC',"VALUE", lambda x: x[0], start_production=True)
+    p.ap('VALUE',"OBJECT", lambda x: x[0])
+    p.ap('VALUE',"ARRAY", lambda x: x[0])
+    p.ap('VALUE',"STRING", lambda x: json.loads(x[0]))
+    p.ap('VALUE',"NUMBER", lambda x: json.loads(x[0]))
+    p.ap('VALUE',"TRUE", True)
+    p.ap('VALUE',"FALSE", False)
+    p.ap('VALUE',"NULL", None)
+    p.ap('OBJECT',"'{' MEMBERS '}'", lambda x: dict(x[1]))
+    p.ap('MEMBERS',"PAIR MOREPAIRS", lambda x: [x[0]] + x[1])
+    p.ap('MEMBERS',"", lambda x: [])
+    p.ap('MOREPAIRS',"',' PAIR MOREPAIRS", lambda x: [x[1]] + x[2])
+    p.ap('MOREPAIRS',"", lambda x: [])
+    p.ap('PAIR',"STRING ':' VALUE", lambda x: (json.loads(x[0]),x[2]))
+    p.ap('ARRAY',"'[' ELEMENTS ']'", lambda x: x[1])
+    p.ap('ELEMENTS',"VALUE MORE", lambda x: [x[0]] + x[1])
+    p.ap('ELEMENTS',"", lambda x: [])
+    p.ap('MORE',"',' VALUE MORE", lambda x: [x[1]] + x[2])
+    p.ap('MORE',"", lambda x: [])
+    return p
+
+def json_corpus(rng,docs):
+    return [json.dumps(_json_value(rng,4),indent=1) for i in range(docs)]
+
+def _json_value(rng,depth):
+    kind = rng.random()
+    if depth and kind < 0.25:
+        return {'k{}'.format(rng.randint(0,999)): _json_value(rng,depth - 1)
+                for i in range(rng.randint(0,6))}
+    if depth and kind < 0.45:
+        return [_json_value(rng,depth - 1) for i in range(rng.randint(0,8))]
+    if kind < 0.65:
+        return rng.choice(['', 'abc', 'with "quotes"', 'tab\there', 'x' * 20])
+    if kind < 0.8:
+        return rng.randint(-10**6,10**6)
+    if kind < 0.9:
+        return round(rng.uniform(-1000,1000),3)
+    return rng.choice([True,False,None])
+
+def json_nested(depth):
+    return '[' * depth + ']' * depth
+
+## SQL
+
+_SQL_KEYWORDS = ('SELECT','FROM','WHERE','AND','OR','ORDER','BY','INSERT',
+                 'INTO','VALUES','UPDATE','SET','DELETE')
+
+def sql_grammar(parser_class=LLParser,**options):
+    "A subset of SQL: SELECT, INSERT, UPDATE and DELETE, building tuples."
+    lexer = Lexer()
+    for keyword in _SQL_KEYWORDS:
+        lexer.addtoken(name=keyword,rule=keyword)
+    lexer.addtoken(name='NAME',rule=r'[A-Za-z_][A-Za-z_0-9]*')
+    lexer.addtoken(name='NUMBER',rule=r'[0-9]+')
+    lexer.addtoken(name='STRING',rule=r"'[^']*'")
+    p = parser_class(lexer,**options)
+    p.ap('SCRIPT',"STMTS", lambda x: x[0], start_production=True)
+    p.ap('STMTS',"STMT ';' STMTS", lambda x: [x[0]] + x[2])
+    p.ap('STMTS',"", lambda x: [])
+    p.ap('STMT',"SELECT COLUMNS FROM NAME WHERE_OPT ORDER_OPT",
+         lambda x: ('select',x[1],x[3],x[4],x[5]))
+    p.ap('STMT',"INSERT INTO NAME '(' NAMES ')' VALUES '(' EXPRS ')'",
+         lambda x: ('insert',x[2],x[4],x[8]))
+    p.ap('STMT',"UPDATE NAME SET ASSIGNS WHERE_OPT",
+         lambda x: ('update',x[1],x[3],x[4]))
+    p.ap('STMT',"DELETE FROM NAME WHERE_OPT",
+         lambda x: ('delete',x[2],x[3]))
+    p.ap('COLUMNS',"'*'", lambda x: '*')
+    p.ap('COLUMNS',"EXPRS", lambda x: x[0])
+    p.ap('EXPRS',"EXPR MOREEXPRS", lambda x: [x[0]] + x[1])
+    p.ap('MOREEXPRS',"',' EXPR MOREEXPRS", lambda x: [x[1]] + x[2])
+    p.ap('MOREEXPRS',"", lambda x: [])
+    p.ap('NAMES',"NAME MORENAMES", lambda x: [x[0]] + x[1])
+    p.ap('MORENAMES',"',' NAME MORENAMES", lambda x: [x[1]] + x[2])
+    p.ap('MORENAMES',"", lambda x: [])
+    p.ap('ASSIGNS',"ASSIGN MOREASSIGNS", lambda x: [x[0]] + x[1])
+    p.ap('MOREASSIGNS',"',' ASSIGN MOREASSIGNS", lambda x: [x[1]] + x[2])
+    p.ap('MOREASSIGNS',"", lambda x: [])
+    p.ap('ASSIGN',"NAME '=' EXPR", lambda x: (x[0],x[2]))
+    p.ap('WHERE_OPT',"WHERE COND", lambda x: x[1])
+    p.ap('WHERE_OPT',"", lambda x: None)
+    p.ap('ORDER_OPT',"ORDER BY NAME", lambda x: x[2])
+    p.ap('ORDER_OPT',"", lambda x: None)
+    p.ap('COND',"CMP MORECMPS", lambda x: _fold(x[0],x[1]))
+    p.ap('MORECMPS',"AND CMP MORECMPS", lambda x: [('and',x[1])] + x[2])
+    p.ap('MORECMPS',"OR CMP MORECMPS", lambda x: [('or',x[1])] + x[2])
+    p.ap('MORECMPS',"", lambda x: [])
+    p.ap('CMP',"EXPR OP EXPR", lambda x: (x[1],x[0],x[2]))
+    p.ap('OP',"'='", '=')
+    p.ap('OP',"'<'", '<')
+    p.ap('OP',"'>'", '>')
+    p.ap('EXPR',"TERM MORETERMS", lambda x: _fold(x[0],x[1]))
+    p.ap('MORETERMS',"'+' TERM MORETERMS", lambda x: [('+',x[1])] + x[2])
+    p.ap('MORETERMS',"'-' TERM MORETERMS", lambda x: [('-',x[1])] + x[2])
+    p.ap('MORETERMS',"", lambda x: [])
+    p.ap('TERM',"NAME", lambda x: x[0])
+    p.ap('TERM',"NUMBER", lambda x: int(x[0]))
+    p.ap('TERM',"STRING", lambda x: x[0][1:-1])
+    p.ap('TERM',"'(' EXPR ')'", lambda x: x[1])
+    return p
+
+def _fold(first,rest):
+    "Left-associate `first` and the ``(operator, operand)`` pairs `rest`."
+    for operator, operand in rest:
+        first = (operator,first,operand)
+    return first
+
+def sql_corpus(rng,docs):
+    return [' '.join(_sql_statement(rng) + ';' for i in range(20))
+            for j in range(docs)]
+
+def _sql_statement(rng):
+    table = rng.choice(['users','orders','items','events'])
+    names = ['id','name','total','created','status','owner_id']
+    where = ''
+    if rng.random() < 0.7:
+        where = ' WHERE ' + ' AND '.join(
+            '{} {} {}'.format(rng.choice(names),rng.choice('=<>'),
+                              _sql_expression(rng,2))
+            for i in range(rng.randint(1,3)))
+    kind = rng.randrange(4)
+    if kind == 0:
+        columns = '*' if rng.random() < 0.3 else ', '.join(
+            rng.sample(names,rng.randint(1,4)))
+        order = ' ORDER BY ' + rng.choice(names) if rng.random() < 0.4 else ''
+        return 'SELECT {} FROM {}{}{}'.format(columns,table,where,order)
+    if kind == 1:
+        columns = rng.sample(names,rng.randint(1,5))
+        return 'INSERT INTO {} ({}) VALUES ({})'.format(table,
+            ', '.join(columns),', '.join(_sql_expression(rng,1)
+                                         for c in columns))
+    if kind == 2:
+        return 'UPDATE {} SET {}{}'.format(table,', '.join(
+            '{} = {}'.format(name,_sql_expression(rng,2))
+            for name in rng.sample(names,rng.randint(1,3))),where)
+    return 'DELETE FROM {}{}'.format(table,where)
+
+def _sql_expression(rng,depth):
+    kind = rng.random()
+    if depth and kind < 0.2:
+        return '({} + {})'.format(_sql_expression(rng,depth - 1),
+                                  _sql_expression(rng,depth - 1))
+    if kind < 0.5:
+        return str(rng.randint(0,10000))
+    if kind < 0.7:
+        return "'{}'".format(rng.choice(['open','closed','x','a b c']))
+    return rng.choice(['id','total','owner_id'])
+
+def sql_nested(depth):
+    return 'SELECT {}1{} FROM t;'.format('(' * depth,')' * depth)
+
+## Synthetic grammars
+
+def synthetic_grammar(productions,rng,parser_class=LLParser,tokens=64,
+                      **options):
+    """An LL(1) grammar of exactly `productions` productions, over `tokens`
+    named tokens ``w0``, ``w1``, ...
+
+    Nonterminal ``N0`` is repeated at the top level, and every nonterminal
+    ``Ni`` has two or three productions, each starting with a different
+    token. The first is a lone token, and the others follow their token with
+    one or two of the nonterminals after ``Ni`` (or with a second token, for
+    the last nonterminal), so that every derivation ends. The value of every
+    production is the number of tokens it spans.
+    """
+    if productions < 5:
+        raise ValueError('A synthetic grammar has at least 5 productions')
+    lexer = Lexer()
+    words = ['w{}'.format(i) for i in range(tokens)]
+    for word in words:
+        lexer.addtoken(name=word.upper(),rule=word)
+    p = parser_class(lexer,**options)
+    p.ap('S',"ITEMS", _count, start_production=True)
+    p.ap('ITEMS',"N0 ITEMS", _count)
+    p.ap('ITEMS',"", 0)
+
+    counts = []
+    remaining = productions - 3
+    while remaining:
+        count = 2 if remaining in (2,4) else 3
+        counts.append(count)
+        remaining -= count
+    for index, count in enumerate(counts):
+        symbol = 'N{}'.format(index)
+        starts = rng.sample(words,count)
+        p.ap(symbol,starts[0].upper(),_count)
+        for start in starts[1:]:
+            if index + 1 == len(counts):
+                rest = [rng.choice(words).upper()]
+            else:
+                rest = ['N{}'.format(rng.randrange(index + 1,len(counts)))
+                        for i in range(rng.randint(1,2))]
+            p.ap(symbol," ".join([start.upper()] + rest),_count)
+    return p
+
+def _count(values):
+    return sum(1 if isinstance(value,str) else value for value in values)
+
+def synthetic_corpus(parser,rng,docs,size=300,depth=40):
+    """Inputs for a ``synthetic_grammar`` of about `size` tokens each, with
+    derivations at most `depth` deep (below the top level)."""
+    productions = {}
+    for symbol, rules in parser.productions.items():
+        productions[symbol.name] = [[s.rule.pattern if s.terminal() else
+                                     s.name for s in rule]
+                                    for rule,action in rules]
+    result = []
+    for i in range(docs):
+        words = []
+        while len(words) < size:
+            _derive(productions,'N0',rng,depth,words)
+        result.append(' '.join(words))
+    return result
+
+def _derive(productions,symbol,rng,depth,words):
+    rules = productions[symbol]
+    # The first rule of each symbol is a single token
+    rule = rules[0] if depth == 0 else rng.choice(rules)
+    for item in rule:
+        if item in productions:
+            _derive(productions,item,rng,depth - 1,words)
+        else:
+            words.append(item)
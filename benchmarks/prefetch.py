@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""prefetch.py - LLParser.parse with and without a lexing thread
+
+Parses the same input with ``parse(input)`` and with ``parse(input,
+prefetch=N)`` for a few batch sizes, in three workloads: one where lexing
+is most of the work (long string and comment tokens, many token rules),
+one where it is about half, and one where the semantic actions are most of
+it. ``lex share`` is the part of a plain parse spent lexing, which bounds
+what overlapping the two can save: at best a parse takes as long as the
+larger of the two parts.
+
+Python's regular expressions don't release the GIL, so on a standard build
+the lexing thread only takes turns with the parser: what the parser saves
+by taking lexemes from a list instead of a generator about pays for the
+switching between the threads, and prefetching comes out even, give or take
+the noise. It pays off on a free-threaded build with a spare core, and the
+more so the closer the lex share is to a half. Run from the project root::
+
+    $ python3 benchmarks/prefetch.py [--tokens N] [--batches 16,256,4096]
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from pcc.lexer import Lexer
+from pcc.ll import LLParser
+
+def lexing_parser():
+    """Statements of a keyword and a string, with comments in between: few
+    tokens, each of them slow to match."""
+    lexer = Lexer()
+    lexer.addtoken(name='COMMENT',rule=r'/\*([^*]|\*+[^*/])*\*+/',
+                   silent=True)
+    lexer.addtoken(name='STRING',rule=r'"(\\.|[^"\\])*"')
+    for index in range(20):
+        lexer.addtoken(name='KW{}'.format(index),
+                       rule=r'(?i)keyword{}\b'.format(index))
+    lexer.addtoken(name='NAME',rule=r'[a-z_][a-z_0-9]*')
+    p = LLParser(lexer)
+    p.ap('S',"STMT*",lambda x: len(x[0]),start_production=True)
+    p.ap('STMT',"NAME STRING ';'",None)
+    def text(count):
+        stmt = ('value_{0} "a string with \\"escapes\\" in it, {0} times" '
+                '/* and a comment ** about it */; ')
+        return "".join(stmt.format(i) for i in range(count // 3))
+    return p, text
+
+def balanced_parser():
+    "Arithmetic expressions, with actions that compute the result."
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = LLParser(lexer)
+    p.ap('S',"(E ';')*",lambda x: sum(e[0] for e in x[0]),
+         start_production=True)
+    p.addexpression('E',"F",[
+        ("'+'",1,'left',lambda x: x[0] + x[2]),
+        ("'*'",2,'left',lambda x: x[0] * x[2])])
+    p.ap('F',"NUM",lambda x: int(x[0]))
+    p.ap('F',"'(' E ')'",lambda x: x[1])
+    def text(count):
+        expr = "({0}+{1})*{0} + {1}*({0}+2*{1}); "
+        return "".join(expr.format(i % 97,i % 89) for i in range(count // 19))
+    return p, text
+
+def parsing_parser():
+    "Lists of numbers, with an action that does some work for each one."
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = LLParser(lexer)
+    def work(x):
+        n = int(x[0])
+        return sum((n * i) % 7 for i in range(20))
+    p.ap('S',"ITEM*",lambda x: sum(x[0]),start_production=True)
+    p.ap('ITEM',"NUM",work)
+    def text(count):
+        return " ".join(str(i) for i in range(count))
+    return p, text
+
+WORKLOADS = [('lexing',lexing_parser),('balanced',balanced_parser),
+             ('actions',parsing_parser)]
+
+def best(functions,repeat):
+    """The shortest of `repeat` timings of each of `functions`, and their
+    results. The functions take turns, so that a machine that is busy for a
+    while slows them all down alike."""
+    times = [[] for function in functions]
+    results = [None] * len(functions)
+    for i in range(repeat):
+        for index, function in enumerate(functions):
+            start = time.perf_counter()
+            results[index] = function()
+            times[index].append(time.perf_counter() - start)
+    return [min(t) for t in times], results
+
+def main():
+    options = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    options.add_argument('--tokens',type=int,default=30000,
+                         help='about how many tokens to parse')
+    options.add_argument('--batches',default='16,256,4096',
+                         help='comma separated prefetch batch sizes')
+    options.add_argument('--repeat',type=int,default=5,
+                         help='timings to take the best of')
+    args = options.parse_args()
+
+    gil = getattr(sys,'_is_gil_enabled',lambda: True)()
+    print('Python {} ({}, {} CPUs)'.format(sys.version.split()[0],
+          'GIL enabled' if gil else 'free-threaded',os.cpu_count()))
+    batches = [int(x) for x in args.batches.split(',')]
+
+    print('{:10s} {:>9s} {:>10s}'.format('workload','lex share','plain') +
+          ''.join(' {:>14s}'.format('prefetch={}'.format(b))
+                  for b in batches))
+    for name, make in WORKLOADS:
+        parser, text = make()
+        parser.finalize()
+        input = text(args.tokens)
+        tokens = sum(1 for lexeme in parser.lexer.lex(input))
+        functions = [lambda: sum(1 for lexeme in parser.lexer.lex(input)),
+                     lambda: parser.parse(input)]
+        for size in batches:
+            functions.append(lambda size=size: parser.parse(input,
+                                                            prefetch=size))
+        times, results = best(functions,args.repeat)
+        lex_time, plain = times[:2]
+        row = '{:10s} {:8.0f}% {:10.0f}'.format(name,100 * lex_time / plain,
+                                                tokens / plain)
+        for size, elapsed, result in zip(batches,times[2:],results[2:]):
+            if result != results[1]:
+                sys.exit('{}: prefetch={} gave a different result'.format(
+                         name,size))
+            row += ' {:8.0f} {:4.2f}x'.format(tokens / elapsed,
+                                              plain / elapsed)
+        print(row)
+    print('(tokens per second, and the speedup over the plain parse)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""suite.py - End-to-end LLParser benchmarks, checked against baselines
+
+Builds (with ``addproduction``), finalizes and parses with every grammar of
+``grammars.py`` - expressions, JSON, a subset of SQL, and synthetic grammars
+of 10 to 10,000 productions - and measures:
+
+* ``build_ms`` - creating the lexer and parser and adding the productions
+* ``finalize_ms`` - ``finalize``
+* ``table_kb`` - memory allocated (and kept) by ``finalize``
+* ``lexemes_per_s`` - ``parse`` throughput over a generated corpus
+* ``validate_per_s`` - ``validate`` throughput over the same corpus
+* ``max_depth`` - the deepest nesting that parses at the default recursion
+  limit (for the grammars that have nesting)
+* ``reference_per_s`` - the speed of the machine, on a fixed workload that
+  doesn't use pcc (see ``reference``), measured along with the others
+
+The results are compared with ``baselines.json``: the outputs of the parses
+(and the sizes of grammars and corpora) must match exactly, ``max_depth``
+must not drop, and ``table_kb`` must be within a factor of ``--tolerance``
+of its baseline. Exits with status 1 if anything doesn't. The timings
+can't be reproduced from one machine (or one moment) to the next, so they
+are only reported: as a ratio to their baseline, scaled by how fast the
+machine ran the reference workload in this run compared to the baseline
+run. Run from the project root::
+
+    $ python3 benchmarks/suite.py [--only json,synthetic-1000] [--update]
+
+``--update`` writes the new results to ``baselines.json`` instead of
+checking them.
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+import grammars
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines.json')
+
+# Timings, which are only reported, and whether bigger is better
+TIMINGS = {'build_ms': False, 'finalize_ms': False, 'lexemes_per_s': True,
+           'validate_per_s': True}
+# Results that must match exactly
+EXACT = ('productions','docs','lexemes','output')
+
+# The input of the reference workload
+_REFERENCE_TEXT = ('select name, count(*) from t where x = 1 and y = "a b";\n'
+                   * 200)
+_REFERENCE_TOKEN = re.compile(r'\s*(?:(\w+)|("[^"]*")|(.))')
+
+def benchmarks():
+    """Return ``{name: (build, corpus, nested)}``: a function building an
+    unfinalized parser, a function of the finalized parser returning the
+    corpus, and a function returning an input nested n levels deep (or
+    None)."""
+    result = {
+        'expression': (grammars.expression_grammar,
+                       lambda p: grammars.expression_corpus(_rng(),500),
+                       grammars.expression_nested),
+        'expression-operators': (grammars.operator_grammar,
+                                 lambda p: grammars.expression_corpus(_rng(),
+                                                                      500),
+                                 grammars.expression_nested),
+        'json': (grammars.json_grammar,
+                 lambda p: grammars.json_corpus(_rng(),200),
+                 grammars.json_nested),
+        'sql': (grammars.sql_grammar,
+                lambda p: grammars.sql_corpus(_rng(),50),
+                grammars.sql_nested),
+    }
+    for size in (10,100,1000,10000):
+        result['synthetic-{}'.format(size)] = (
+            lambda size=size: grammars.synthetic_grammar(size,_rng()),
+            lambda p: grammars.synthetic_corpus(p,_rng(),20),
+            None)
+    return result
+
+def _rng():
+    return random.Random(1234)
+
+def best(function,repeat):
+    "Best wall clock time of `repeat` calls of `function`, and its result."
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def reference():
+    """A fixed workload of the same kind as parsing (regular expressions,
+    small objects and dictionary lookups) but without pcc, to tell how fast
+    the machine is running. Returns the number of tokens."""
+    counts = {}
+    items = []
+    for m in _REFERENCE_TOKEN.finditer(_REFERENCE_TEXT):
+        kind = m.lastindex
+        counts[kind] = counts.get(kind,0) + 1
+        items.append((kind,m.group(kind)))
+    return len(items)
+
+def measure(build,corpus,nested,repeat):
+    "Run one benchmark, returning a dictionary of results."
+    result = {}
+    reference_time, tokens = best(reference,repeat)
+    result['reference_per_s'] = tokens / reference_time
+    build_time, parser = best(build,repeat)
+    result['build_ms'] = build_time * 1000
+    result['productions'] = sum(len(rules) for rules
+                                in parser.productions.values())
+
+    finalize_times = []
+    for i in range(repeat):
+        parser = build()
+        start = time.perf_counter()
+        parser.finalize()
+        finalize_times.append(time.perf_counter() - start)
+    result['finalize_ms'] = min(finalize_times) * 1000
+
+    parser = build()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parser.finalize()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result['table_kb'] = (after - before) / 1024
+
+    inputs = corpus(parser)
+    lexemes = sum(len(list(parser.lexer.lex(input))) for input in inputs)
+    parse_time, outputs = best(lambda: [parser.parse(input)
+                                        for input in inputs],repeat)
+    result['docs'] = len(inputs)
+    result['lexemes'] = lexemes
+    result['lexemes_per_s'] = lexemes / parse_time
+    result['output'] = hashlib.sha1(repr(outputs).encode()).hexdigest()[:16]
+    validate_time, errors = best(lambda: [parser.validate(input)
+                                          for input in inputs],repeat)
+    if any(errors):
+        raise AssertionError('validate rejects the corpus: {}'.format(
+                             next(filter(None,errors))))
+    result['validate_per_s'] = lexemes / validate_time
+
+    if nested is not None:
+        result['max_depth'] = max_depth(parser,nested)
+    return result
+
+def max_depth(parser,nested,limit=100000):
+    "The deepest `nested` input (up to `limit`) that `parser` can parse."
+    def parses(depth):
+        try:
+            parser.parse(nested(depth))
+            return True
+        except RecursionError:
+            return False
+    low, high = 0, 1
+    while high <= limit and parses(high):
+        low, high = high, high * 2
+    high = min(high,limit + 1)
+    # parses(low) and not parses(high)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if parses(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+def compare(name,result,baseline,tolerance):
+    "Return a list of complaints about `result` given its `baseline`."
+    problems = []
+    for key in EXACT:
+        if result.get(key) != baseline.get(key):
+            problems.append('{}: {} is {}, expected {}'.format(name,key,
+                            result.get(key),baseline.get(key)))
+    if result.get('max_depth',0) < baseline.get('max_depth',0):
+        problems.append('{}: max_depth dropped to {} from {}'.format(name,
+                        result['max_depth'],baseline['max_depth']))
+    if result['table_kb'] > baseline['table_kb'] * tolerance:
+        problems.append('{}: table_kb grew to {:.1f} from {:.1f}'.format(
+                        name,result['table_kb'],baseline['table_kb']))
+    return problems
+
+def speeds(result,baseline):
+    """The speed of each of the ``TIMINGS`` of `result` as a ratio to its
+    `baseline` (above 1 is faster), allowing for the speed of the machine
+    in either run."""
+    machine = result['reference_per_s'] / baseline.get('reference_per_s',
+                                                       result['reference_per_s'])
+    ratios = {}
+    for key, bigger_is_better in TIMINGS.items():
+        if key not in baseline:
+            continue
+        ratio = result[key] / baseline[key]
+        ratios[key] = (ratio if bigger_is_better else 1 / ratio) / machine
+    return ratios
+
+def main():
+    options = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    options.add_argument('--only',
+                         help='comma separated benchmarks to run')
+    options.add_argument('--repeat',type=int,default=3)
+    options.add_argument('--tolerance',type=float,default=1.5,
+                         help='allowed growth factor of table_kb from the '
+                         'baselines')
+    options.add_argument('--update',action='store_true',
+                         help='record the results as the new baselines')
+    args = options.parse_args()
+
+    all_benchmarks = benchmarks()
+    names = args.only.split(',') if args.only else list(all_benchmarks)
+    for name in names:
+        if name not in all_benchmarks:
+            options.error('Unknown benchmark: {}'.format(name))
+
+    try:
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {'benchmarks': {}}
+
+    print('{:18} {:>7} {:>10} {:>11} {:>10} {:>13} {:>13} {:>9}'.format(
+          'benchmark','prods','build ms','finalize ms','table kB',
+          'lexemes/s','validated/s','max depth'))
+    problems = []
+    ratios = {}
+    for name in names:
+        result = measure(*all_benchmarks[name],repeat=args.repeat)
+        print('{:18} {:7d} {:10.1f} {:11.1f} {:10.0f} {:13.0f} {:13.0f} '
+              '{:>9}'.format(name,result['productions'],result['build_ms'],
+              result['finalize_ms'],result['table_kb'],
+              result['lexemes_per_s'],result['validate_per_s'],
+              result.get('max_depth','-')))
+        if args.update:
+            baselines['benchmarks'][name] = {key: round(value,1)
+                if isinstance(value,float) else value
+                for key, value in result.items()}
+        elif name in baselines['benchmarks']:
+            baseline = baselines['benchmarks'][name]
+            problems += compare(name,result,baseline,args.tolerance)
+            ratios[name] = speeds(result,baseline)
+        else:
+            problems.append('{}: no baseline'.format(name))
+
+    if args.update:
+        baselines['python'] = platform.python_version()
+        baselines['machine'] = platform.machine()
+        with open(BASELINES,'w') as f:
+            json.dump(baselines,f,indent=2,sort_keys=True)
+            f.write('\n')
+        print('Baselines written to {}'.format(BASELINES))
+        return 0
+
+    if ratios:
+        print()
+        print('Speed against the baselines, allowing for the machine (not '
+              'checked):')
+        for name, speed in ratios.items():
+            print('{:18} '.format(name) + ' '.join('{} {:.2f}x'.format(key,
+                  value) for key, value in speed.items()))
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""threads.py - Throughput of one LLParser shared by several threads
+
+Every thread parses the same number of expressions with one shared,
+already-finalized parser, and the total throughput is reported for each
+thread count. On a free-threaded build of Python the throughput should grow
+with the number of threads; on a standard build (with the GIL) it should
+stay level - sharing the parser must not make things *slower*.
+
+Run from the project root::
+
+    $ python3 benchmarks/threads.py [--docs N] [--threads 1,2,4,8]
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),'..'))
+
+from pcc.lexer import Lexer
+from pcc.ll import LLParser
+
+def expression_parser():
+    "Grammar 4.28 in Aho, Ullman et al (except NUM instead of id)"
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = LLParser(lexer)
+    p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+    p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+    p.ap('EP',"", lambda x: 0)
+    p.ap('T',"F TP", lambda x: x[0] * x[1])
+    p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+    p.ap('TP',"", lambda x: 1)
+    p.ap('F',"'(' E ')'", lambda x: x[1])
+    p.ap('F',"NUM", lambda x: int(x[0]))
+    return p
+
+def run(parser,inputs,threads):
+    "Parse all `inputs` in each of `threads` threads; return docs/second."
+    barrier = threading.Barrier(threads + 1)
+    def work():
+        barrier.wait()
+        for input in inputs:
+            parser.parse(input)
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for worker in workers:
+        worker.join()
+    return len(inputs) * threads / (time.perf_counter() - start)
+
+def main():
+    options = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    options.add_argument('--docs',type=int,default=200,
+                         help='expressions parsed by each thread')
+    options.add_argument('--threads',default='1,2,4,8',
+                         help='comma separated thread counts')
+    args = options.parse_args()
+
+    gil = getattr(sys,'_is_gil_enabled',lambda: True)()
+    print('Python {} ({})'.format(sys.version.split()[0],
+          'GIL enabled' if gil else 'free-threaded'))
+
+    parser = expression_parser()
+    parser.finalize()
+    inputs = ["({0}+{1})*{0} + {1}*({0}+{1}*{0})".format(i,i+1)
+              for i in range(args.docs)]
+
+    run(parser,inputs,1) # warm up
+    baseline = None
+    for threads in (int(x) for x in args.threads.split(',')):
+        rate = run(parser,inputs,threads)
+        if baseline is None:
+            baseline = rate
+        print('{:3d} threads: {:10.0f} docs/s  ({:.2f}x)'.format(
+              threads,rate,rate / baseline))
+
+if __name__ == '__main__':
+    main()
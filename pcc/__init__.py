@@ -23,7 +23,20 @@
 See ``pcc.lexer`` for a lexical analyzer/tokenizer class.
 
 See ``pcc.parser`` for several implementations of CFG parser generators that
-utilize the ``Lexer`` class from ``pcc.lexer``.
+utilize the ``Lexer`` class from ``pcc.lexer``: ``pcc.ll`` for LL(1)
+parsing, and ``pcc.peg`` for packrat parsing of PEG-style grammars.
+
+See ``pcc.profiler`` to find out where the time goes when parsing.
+
+See ``pcc.generate`` for random sentences of a grammar, to test parsers with.
+
+See ``pcc.cache`` to reuse the lexemes and results of repeated inputs.
+
+See ``pcc.registry`` to keep the parsers of many grammars within a memory
+budget.
+
+See ``pcc.limits`` to bound the time, tokens, nesting and memory of a parse
+of untrusted input.
 
 """
 
@@ -0,0 +1,311 @@
+"""cache.py - Reuse the results of lexing and parsing identical inputs
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import hashlib
+import sys
+import threading
+import types
+import weakref
+
+from pcc.symbols import Symbol, Lexeme
+
+# Returned by ResultCache._get for keys that are not cached
+_MISSING = object()
+
+class ResultCache:
+    """An LRU cache of lexed and parsed inputs, for ``Lexer.lex(input,
+    cache=...)`` and the ``parse(input, cache=...)`` method of parsers.
+
+    Entries are keyed by a hash of the input and a fingerprint of the lexer
+    (its tokens) or the parser (its tokens, productions, actions and
+    options), so one cache can be shared by any number of lexers and
+    parsers, and a parser whose grammar changes simply stops finding its old
+    entries. Actions are told apart by their name and code, the globals
+    their code refers to, and the values they close over or take as
+    defaults (simple values by value, others by identity.)
+
+    The lexemes of an input are always cached (which only saves lexing), but
+    the results of parsing only if `immutable_results` is True - in which
+    case the same result object is returned for every parse of the same
+    input, and must not be modified by the caller. Without it, parsers use
+    the cached lexemes and run the semantic actions again, so that each call
+    gets results of its own.
+
+    The cache holds at most about `max_bytes` of lexemes and results (as
+    estimated from ``sys.getsizeof``), evicting the least recently used
+    entries to make room. ``hits`` and ``misses`` count lookups by kind
+    (``'lex'`` or ``'parse'``), and ``evictions`` and ``size`` the entries
+    evicted so far and the bytes in use. The cache may be shared between
+    threads.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM S", lambda x: [int(x[0])] + x[1], start_production=True)
+    >>> p.ap('S', "", lambda x: [])
+    >>> cache = ResultCache(immutable_results=True)
+    >>> p.parse("1 2 3", cache=cache)
+    [1, 2, 3]
+    >>> p.parse("1 2 3", cache=cache) is p.parse("1 2 3", cache=cache)
+    True
+    >>> cache.hits['parse'], cache.misses['parse'], cache.misses['lex']
+    (2, 1, 1)
+    """
+
+    def __init__(self, max_bytes=64 << 20, immutable_results=False):
+        if max_bytes < 0:
+            raise ValueError('max_bytes must not be negative')
+        self.max_bytes = max_bytes
+        self.immutable_results = immutable_results
+        self.hits = {'lex': 0, 'parse': 0}
+        self.misses = {'lex': 0, 'parse': 0}
+        self.evictions = 0
+        self.size = 0
+        # key -> (value, size), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # object -> (marker, fingerprint), see fingerprint()
+        self._fingerprints = weakref.WeakKeyDictionary()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        "Remove every entry (but keep the statistics)."
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        "Return the statistics of the cache as a dictionary."
+        with self._lock:
+            return {'hits': dict(self.hits), 'misses': dict(self.misses),
+                    'evictions': self.evictions, 'entries': len(self._entries),
+                    'size': self.size, 'max_bytes': self.max_bytes}
+
+    def lex(self,lexer,input,digest=None):
+        """Return the tuple of lexemes of `input` for `lexer`, lexing it only
+        if it is not cached (in which case errors are raised at once, rather
+        than when the lexemes are reached.)"""
+        key = ('lex',self.fingerprint(lexer),digest or _digest(input))
+        lexemes = self._get(key,'lex')
+        if lexemes is _MISSING:
+            lexemes = tuple(lexer._lex(input,0,1,1))
+            self._put(key,lexemes,_sizeof_lexemes(lexemes))
+        return lexemes
+
+    def parse(self,parser,input,parse_lexemes=None):
+        """Return the result of parsing `input` with `parser`, from the cache
+        if results are immutable. `parse_lexemes`, if given, parses a tuple
+        of lexemes (the cached ones) instead of the input - otherwise the
+        input is parsed with ``parser.parse``."""
+        digest = _digest(input)
+        if self.immutable_results:
+            key = ('parse',self.fingerprint(parser),digest)
+            result = self._get(key,'parse')
+            if result is not _MISSING:
+                return result
+        if parse_lexemes is None:
+            result = parser.parse(input)
+        else:
+            result = parse_lexemes(self.lex(parser.lexer,input,digest))
+        if self.immutable_results:
+            self._put(key,result)
+        return result
+
+    def fingerprint(self,obj):
+        """The fingerprint (a ``bytes`` digest) of a lexer or a parser.
+
+        It is remembered for as long as `obj` lives, and worked out again
+        whenever a token is added to a lexer, or a parser is finalized or
+        updated (a parser that is not finalized yet is fingerprinted every
+        time.)"""
+        if hasattr(obj,'productions'):
+            if not obj.finalized:
+                return _fingerprint(obj)
+            marker = (getattr(obj,'version',0),
+                      self.fingerprint(obj.lexer))
+        else:
+            marker = (len(obj.tokens),len(obj.literals))
+        try:
+            known = self._fingerprints.get(obj)
+        except TypeError: # Not weakly referenceable
+            return _fingerprint(obj)
+        if known is not None and known[0] == marker:
+            return known[1]
+        fingerprint = _fingerprint(obj)
+        self._fingerprints[obj] = (marker,fingerprint)
+        return fingerprint
+
+    def _get(self,key,kind):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses[kind] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits[kind] += 1
+            return entry[0]
+
+    def _put(self,key,value,size=None):
+        if size is None:
+            size = _sizeof(value)
+        size += sys.getsizeof(key) + 64
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key,None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value,size)
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted_key, (evicted, evicted_size) = \
+                    self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+def _digest(input):
+    "The hash of the input string `input`."
+    return hashlib.blake2b(input.encode('utf-8','surrogatepass'),
+                           digest_size=16).digest()
+
+def _fingerprint(obj):
+    "Work out the fingerprint of the lexer or parser `obj`."
+    h = hashlib.blake2b(digest_size=16)
+    def add(*parts):
+        h.update(repr(parts).encode('utf-8','surrogatepass'))
+    if hasattr(obj,'productions'):
+        parser = obj
+        add(type(parser).__module__,type(parser).__qualname__)
+        for option in ('adaptive','k','context_lexing','lazy','memo_size',
+                       'eviction'):
+            add(option,getattr(parser,option,None))
+        h.update(_fingerprint(parser.lexer))
+        for symbol, rules in parser.productions.items():
+            for rule,action in rules:
+                add(symbol.name,_rule_key(rule),_action_key(action))
+        if parser.start is not None:
+            symbol, rule, action = parser.start
+            add('start',symbol.name,_rule_key(rule),_action_key(action))
+    else:
+        lexer = obj
+        add(lexer.report_literals)
+        for token in lexer.tokens.values():
+            add(token.name,token.rule.pattern,token.rule.flags,token.silent)
+    return h.digest()
+
+def _rule_key(rule):
+    return tuple((s.name,s.rule.pattern) if s.terminal() else s.name
+                 for s in rule)
+
+# Values used by actions that are part of their fingerprint by value
+_SIMPLE = (int,float,str,bytes,bool,type(None))
+
+def _action_key(action):
+    "What tells actions apart for ``_fingerprint``."
+    if not hasattr(action,'__call__'):
+        return ('constant',type(action).__qualname__,repr(action))
+    code = getattr(action,'__code__',None)
+    if code is None:
+        slots = getattr(type(action),'__slots__',None)
+        if slots:
+            # Such as the actions that parsers wrap around those of the
+            # grammar - told apart by what they wrap
+            return ('wrapper',type(action).__qualname__,
+                    tuple(_action_key(getattr(action,name,None))
+                          for name in slots))
+        return ('callable',getattr(action,'__module__',None),
+                getattr(action,'__qualname__',repr(action)))
+    cells = []
+    for cell in action.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError: # Empty cell
+            value = None
+        cells.append(_value_key(value))
+    # The globals (or builtins) that the names of the code refer to - the
+    # names of attributes only find nothing
+    namespace = getattr(action,'__globals__',{})
+    builtins = namespace.get('__builtins__',{})
+    if not isinstance(builtins,dict):
+        builtins = builtins.__dict__
+    names = []
+    for name in code.co_names:
+        if name in namespace:
+            names.append((name,_value_key(namespace[name])))
+        elif name in builtins:
+            names.append((name,_value_key(builtins[name])))
+        else:
+            names.append((name,))
+    defaults = tuple(_value_key(value)
+                     for value in getattr(action,'__defaults__',None) or ())
+    kwdefaults = getattr(action,'__kwdefaults__',None) or {}
+    kwdefaults = tuple((name,_value_key(value))
+                       for name, value in kwdefaults.items())
+    return ('function',action.__module__,action.__qualname__,code.co_code,
+            repr(code.co_consts),tuple(names),code.co_freevars,tuple(cells),
+            defaults,kwdefaults)
+
+def _value_key(value):
+    "What tells a value that an action uses apart: its repr, or identity."
+    return repr(value) if isinstance(value,_SIMPLE) else id(value)
+
+def _sizeof_lexemes(lexemes):
+    "A quicker ``_sizeof`` for a tuple of lexemes."
+    if not lexemes:
+        return sys.getsizeof(lexemes)
+    sample = lexemes[0]
+    each = (sys.getsizeof(sample) + sys.getsizeof(sample.__dict__) +
+            sys.getsizeof(''))
+    return (sys.getsizeof(lexemes) + each * len(lexemes) +
+            sum(len(lexeme.match) for lexeme in lexemes))
+
+def _sizeof(obj):
+    """Estimate the bytes of memory held by `obj` and everything it refers
+    to (except for grammar symbols, which belong to the lexer, and classes
+    and modules.)"""
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item,Symbol):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item,(tuple,list,set,frozenset)):
+            stack.extend(item)
+        elif isinstance(item,dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item,Lexeme):
+            size += sys.getsizeof(item.__dict__)
+            stack.append(item.match)
+        elif not isinstance(item,(type,types.ModuleType)):
+            if hasattr(item,'__dict__'):
+                stack.append(item.__dict__)
+            for name in getattr(type(item),'__slots__',()):
+                stack.append(getattr(item,name,None))
+    return size
@@ -0,0 +1,183 @@
+# cache_test.py - unit tests for cache.py
+
+"""This module provides unit tests for the ``pcc.cache``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import threading
+import unittest
+
+import pcc.ll as ll
+import pcc.peg as peg
+from pcc.cache import ResultCache
+from pcc.lexer import Lexer
+
+class CacheTester(unittest.TestCase):
+    """Test harness for ``pcc.cache.ResultCache`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.lexer = Lexer()
+        self.lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        self.calls = []
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def _grammar(self,p):
+        def number(x):
+            self.calls.append(x[0])
+            return int(x[0])
+        p.ap('S',"L",lambda x: x[0],start_production=True)
+        p.ap('L',"N L",lambda x: [x[0]] + x[1])
+        p.ap('L',"",lambda x: [])
+        p.ap('N',"NUM",number)
+        return p
+
+    def test_lex(self):
+        """cache.py: Test caching lexemes"""
+        cache = ResultCache()
+        first = list(self.lexer.lex("1 2 3",cache=cache))
+        second = list(self.lexer.lex("1 2 3",cache=cache))
+        self.assertEqual([l.match for l in first],['1','2','3'])
+        self.assertEqual(first,second)
+        self.assertEqual((cache.hits['lex'],cache.misses['lex']),(1,1))
+
+        # Another lexer doesn't see them, nor does this one with a new token
+        other = Lexer(report_literals=False)
+        other.addtoken(name='NUM',rule=r'[0-9]')
+        self.assertEqual(len(list(other.lex("12",cache=cache))),2)
+        self.lexer.addtoken(name='X',rule='x')
+        self.lexer.lex("1 2 3",cache=cache)
+        self.assertEqual(cache.misses['lex'],3)
+
+        # Errors are raised at once
+        with self.assertRaises(ValueError):
+            other.lex("1 ~ 2",cache=cache)
+
+    def test_parse(self):
+        """cache.py: Test caching parse results"""
+        p = self._grammar(ll.LLParser(self.lexer))
+        cache = ResultCache()
+        self.assertEqual(p.parse("1 2",cache=cache),[1,2])
+        result = p.parse("1 2",cache=cache)
+        self.assertEqual(result,[1,2])
+        # Mutable results: the actions run every time, on cached lexemes
+        self.assertEqual(self.calls,['1','2','1','2'])
+        self.assertEqual(cache.hits,{'lex': 1, 'parse': 0})
+        result.append(3)
+        self.assertEqual(p.parse("1 2",cache=cache),[1,2])
+
+        cache = ResultCache(immutable_results=True)
+        self.calls = []
+        result = p.parse("3 4",cache=cache)
+        self.assertIs(p.parse("3 4",cache=cache),result)
+        self.assertEqual(self.calls,['3','4'])
+        self.assertEqual(cache.hits,{'lex': 0, 'parse': 1})
+
+        # An edit of the grammar changes the fingerprint
+        p.update(add=[('N',"'-' NUM",lambda x: -int(x[1]))])
+        self.assertIsNot(p.parse("3 4",cache=cache),result)
+        self.assertEqual(p.parse("- 3 4",cache=cache),[-3,4])
+
+        # A parser with different actions doesn't share the results...
+        q = ll.LLParser(self.lexer)
+        q.ap('S',"L",lambda x: x[0],start_production=True)
+        q.ap('L',"N L",lambda x: [x[0]] + x[1])
+        q.ap('L',"",lambda x: [])
+        q.ap('N',"NUM",lambda x: x[0])
+        self.assertEqual(q.parse("3 4",cache=cache),['3','4'])
+        # ...while one with the same grammar does
+        r = self._grammar(ll.LLParser(self.lexer))
+        self.assertIs(r.parse("3 4",cache=cache),result)
+
+        with self.assertRaises(ll.ParsingError):
+            p.parse("3 +",cache=cache)
+
+        # Nor do grammars whose actions differ only inside repetitions
+        a = ll.LLParser(self.lexer)
+        a.ap('S',"NUM*",lambda x: x[0],start_production=True)
+        b = ll.LLParser(self.lexer)
+        b.ap('S',"NUM*",lambda x: len(x[0]),start_production=True)
+        self.assertEqual(a.parse("7 8",cache=cache),['7','8'])
+        self.assertEqual(b.parse("7 8",cache=cache),2)
+
+        # Nor do actions that differ only in the global they call, the
+        # defaults of their arguments, or the lazy option
+        a = ll.LLParser(self.lexer)
+        a.ap('S',"NUM",lambda x: int(x[0]),start_production=True)
+        b = ll.LLParser(self.lexer)
+        b.ap('S',"NUM",lambda x: float(x[0]),start_production=True)
+        self.assertIs(type(a.parse("5",cache=cache)),int)
+        self.assertIs(type(b.parse("5",cache=cache)),float)
+        a = ll.LLParser(self.lexer)
+        a.ap('S',"NUM",lambda x, f=int: f(x[0]),start_production=True)
+        b = ll.LLParser(self.lexer)
+        b.ap('S',"NUM",lambda x, f=float: f(x[0]),start_production=True)
+        self.assertIs(type(a.parse("6",cache=cache)),int)
+        self.assertIs(type(b.parse("6",cache=cache)),float)
+        self.assertNotEqual(cache.fingerprint(self._grammar(
+                                ll.LLParser(self.lexer))),
+                            cache.fingerprint(self._grammar(
+                                ll.LLParser(self.lexer,lazy=True))))
+
+        for q in (self._grammar(ll.LLParser(self.lexer,k=2)),
+                  self._grammar(ll.LLParser(self.lexer,context_lexing=True)),
+                  self._grammar(peg.PEGParser(self.lexer))):
+            cache = ResultCache()
+            self.assertEqual(q.parse("5 6",cache=cache),[5,6])
+            self.assertEqual(q.parse("5 6",cache=cache),[5,6])
+
+    def test_eviction(self):
+        """cache.py: Test the byte budget of the cache"""
+        cache = ResultCache(max_bytes=5000)
+        inputs = [" ".join(str(i) for i in range(n,n + 10))
+                  for n in range(50)]
+        for input in inputs:
+            self.lexer.lex(input,cache=cache)
+            self.assertLessEqual(cache.size,5000)
+        self.assertGreater(cache.evictions,0)
+        self.assertLess(len(cache),len(inputs))
+
+        # The most recently used entries are kept
+        self.lexer.lex(inputs[-1],cache=cache)
+        self.assertEqual(cache.hits['lex'],1)
+        self.lexer.lex(inputs[0],cache=cache)
+        self.assertEqual(cache.hits['lex'],1)
+
+        # Entries bigger than the whole budget are never stored
+        self.lexer.lex("1 " * 5000,cache=cache)
+        self.assertLessEqual(cache.size,5000)
+        stats = cache.stats()
+        self.assertEqual(stats['entries'],len(cache))
+
+        cache.clear()
+        self.assertEqual((len(cache),cache.size),(0,0))
+
+    def test_threads(self):
+        """cache.py: Test sharing a cache between threads"""
+        p = self._grammar(ll.LLParser(self.lexer))
+        p.finalize()
+        cache = ResultCache(max_bytes=20000,immutable_results=True)
+        inputs = [" ".join(str(i) for i in range(n % 20,n % 20 + 5))
+                  for n in range(200)]
+        errors = []
+        def work():
+            for input in inputs:
+                if p.parse(input,cache=cache) != [int(x) for x
+                                                  in input.split()]:
+                    errors.append(input)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors,[])
+        self.assertEqual(cache.hits['parse'] + cache.misses['parse'],800)
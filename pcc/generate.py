@@ -0,0 +1,405 @@
+"""generate.py - Random sentences of a grammar, for benchmarks and stress tests
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import random
+import string
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError: # Before Python 3.11
+    import sre_parse
+    import sre_constants
+
+from pcc.parser import _make_symbol
+from pcc.symbols import EOF, EPSILON, SymbolString
+
+INFINITY = float('inf')
+
+# Characters drawn for '.', negated classes and categories
+_ALPHABET = string.ascii_letters + string.digits + string.punctuation + ' '
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: lambda c: c.isdigit(),
+    sre_constants.CATEGORY_NOT_DIGIT: lambda c: not c.isdigit(),
+    sre_constants.CATEGORY_WORD: lambda c: c.isalnum() or c == '_',
+    sre_constants.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == '_'),
+    sre_constants.CATEGORY_SPACE: lambda c: c.isspace(),
+    sre_constants.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+}
+
+class Generator:
+    """Random sentences of the grammar of `parser` (any ``pcc.parser.Parser``
+    with its productions added - it needn't be finalized.)
+
+    ``sentence`` returns one sentence as a string, ``lexemes`` yields the
+    text of its lexemes one at a time, and ``write`` streams it to a file,
+    so that inputs far bigger than memory can be produced. The derivation is
+    iterative, so the nesting of the sentences is only limited by
+    `max_depth`.
+
+    Each production is chosen with a probability proportional to its weight
+    in `weights`, a dictionary keyed by ``(symbol, rule)`` pairs (as given to
+    ``addproduction``) - the weight of the others is 1, and a weight of 0
+    leaves a production out unless there is no other way to finish. Shortest
+    derivations are worked out beforehand: once a sentence has reached its
+    target size, or a derivation its maximum depth, the generator picks the
+    productions that finish it soonest.
+
+    The text of a token is drawn from its regular expression, and checked to
+    lex back to the same token; `variety` different texts are kept for each
+    token. Lexemes are separated by spaces if the lexer ignores them, and
+    are otherwise run together. The same `seed` always gives the same
+    sentences.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM L", lambda x: [int(x[0])] + x[1], start_production=True)
+    >>> p.ap('L', "',' NUM L", lambda x: [int(x[1])] + x[2])
+    >>> p.ap('L', "", lambda x: [])
+    >>> g = Generator(p, seed=1)
+    >>> text = g.sentence(size=20)
+    >>> len(p.parse(text))
+    11
+    >>> Generator(p, seed=1).sentence(size=20) == text
+    True
+    >>> g = Generator(p, seed=1, weights={('L', "',' NUM L"): 0})
+    >>> len(p.parse(g.sentence(size=20)))
+    1
+    """
+
+    def __init__(self, parser, weights=None, seed=None, variety=64,
+                 separator=None):
+        self.lexer = parser.lexer
+        self.productions = parser.productions
+        if parser.start is None:
+            raise ValueError('The grammar has no start production.')
+        self.start = SymbolString([s for s in parser.start[1] if s != EOF])
+        self.random = random.Random(seed)
+        self.variety = variety
+        if separator is None:
+            match = self.lexer._match(' ',0)
+            separator = ' ' if match is not None and match[0].silent else ''
+        self.separator = separator
+
+        self.weights = {}
+        for (symbol, rule), weight in (weights or {}).items():
+            key = self._production(symbol,rule)
+            if weight < 0:
+                raise ValueError('Negative weight for {} -> {}'.format(
+                                 symbol,rule))
+            self.weights[key] = weight
+
+        self._texts = {}
+        self._compile()
+
+    def sentence(self,size=0,max_depth=None):
+        "Return a sentence of about `size` lexemes, as a string."
+        return self.separator.join(self.lexemes(size,max_depth))
+
+    def write(self,file,size=0,max_depth=None,chunk=1<<16):
+        """Write a sentence of about `size` lexemes to the open text file
+        `file`, `chunk` lexemes at a time. Returns the number of characters
+        written."""
+        written = 0
+        batch = []
+        separator = self.separator
+        for text in self.lexemes(size,max_depth):
+            batch.append(text)
+            if len(batch) == chunk:
+                data = separator.join(batch) + separator
+                file.write(data)
+                written += len(data)
+                batch = []
+        data = separator.join(batch)
+        file.write(data)
+        return written + len(data)
+
+    def lexemes(self,size=0,max_depth=None):
+        """Yield the text of every lexeme of a random sentence.
+
+        The sentence keeps growing until it has at least `size` lexemes (or
+        the grammar, or `max_depth`, doesn't let it), and its derivation is
+        no deeper than `max_depth` productions (if the grammar allows.) The
+        depth counts every production, so each element of a right-recursive
+        list is one level deeper than the one before.
+        """
+        if max_depth is None:
+            max_depth = INFINITY
+        rand = self.random.random
+        choose = self.random.choices
+
+        # (node, depth) pairs of the rest of the derivation, last first
+        stack = [(node,0) for node in self._start]
+        # The fewest lexemes the stack can still derive, and its number of
+        # nonterminals
+        pending = sum(node.length for node,depth in stack)
+        nonterminals = sum(1 for node,depth in stack if not node.terminal)
+        emitted = 0
+
+        while stack:
+            node, depth = stack.pop()
+            if node.terminal:
+                pending -= 1
+                emitted += 1
+                texts = node.texts
+                if texts is None:
+                    texts = node.texts = self._texts_of(node.symbol)
+                yield texts[int(rand() * len(texts))]
+                continue
+            nonterminals -= 1
+
+            alternatives = node.alternatives
+            if depth + node.height > max_depth:
+                alternatives = [a for a in alternatives
+                                if depth + a.height <= max_depth] or \
+                               node.lowest
+            if node.weighted:
+                alternatives = [a for a in alternatives if a.weight] or \
+                               alternatives
+
+            if emitted + pending >= size:
+                # Finish as soon as possible
+                best = min(a.length for a in alternatives)
+                alternatives = [a for a in alternatives if a.length == best]
+            elif nonterminals == 0:
+                # Keep the derivation going until it is big enough
+                alternatives = [a for a in alternatives if a.nonterminals] \
+                               or alternatives
+
+            if len(alternatives) == 1:
+                chosen = alternatives[0]
+            elif node.weighted:
+                chosen = choose(alternatives,
+                                [a.weight for a in alternatives])[0]
+            else:
+                chosen = alternatives[int(rand() * len(alternatives))]
+
+            pending += chosen.length - node.length
+            nonterminals += chosen.nonterminals
+            depth += 1
+            stack.extend([(item,depth) for item in chosen.items])
+
+    def text(self,token):
+        """Random text of the terminal `token`, which lexes back to it.
+
+        Raises ``ValueError`` if no such text can be found."""
+        return self.random.choice(self._texts_of(token))
+
+    def _texts_of(self,token):
+        texts = self._texts.get(token)
+        if texts is None:
+            texts = self._texts[token] = self._render(token)
+        return texts
+
+    def _render(self,token):
+        "Up to `variety` different texts of `token`."
+        pattern = sre_parse.parse(token.rule.pattern,token.rule.flags)
+        wanted = 1 if _fixed(pattern) else self.variety
+        texts = []
+        for attempt in range(4 * wanted + 100):
+            result = []
+            _sample(pattern,self.random,{},result)
+            text = "".join(result)
+            match = self.lexer._match(text,0) if text else None
+            if (match is not None and match[0] == token and
+                match[1] == text and text not in texts):
+                texts.append(text)
+                if len(texts) == wanted:
+                    break
+        if not texts:
+            raise ValueError('Could not generate text for token {}'.format(
+                             token.name))
+        return texts
+
+    def _production(self,symbol,rule):
+        "The ``(Symbol, SymbolString)`` key of a production, or ValueError."
+        rule_symbols = SymbolString([_make_symbol(self.lexer,x)
+                                     for x in rule.split()])
+        if len(rule_symbols) == 0:
+            rule_symbols = SymbolString((EPSILON,))
+        for key in self.productions:
+            if key.name == symbol:
+                for existing, action in self.productions[key]:
+                    if existing == rule_symbols:
+                        return (key,existing)
+        raise ValueError('No production {} -> {}'.format(symbol,rule))
+
+    def _compile(self):
+        """Build the ``_Node`` of every symbol, working out the fewest
+        lexemes and levels of productions each one can derive."""
+        nodes = {}
+        for symbol, rules in self.productions.items():
+            nodes[symbol] = _Node(symbol,False)
+            for rule,action in rules:
+                for item in rule:
+                    if item.terminal() and item != EPSILON and \
+                       item not in nodes:
+                        nodes[item] = _Node(item,True)
+                        nodes[item].length = 1
+        for item in self.start:
+            if item.terminal() and item not in nodes:
+                nodes[item] = _Node(item,True)
+                nodes[item].length = 1
+        for symbol, rules in self.productions.items():
+            node = nodes[symbol]
+            for rule,action in rules:
+                items = tuple(nodes[item] for item in reversed(tuple(rule))
+                              if item != EPSILON)
+                node.alternatives.append(_Alternative(items,
+                    self.weights.get((symbol,rule),1)))
+            node.weighted = any(a.weight != 1 for a in node.alternatives)
+
+        changed = True
+        while changed:
+            changed = False
+            for symbol in self.productions:
+                node = nodes[symbol]
+                for a in node.alternatives:
+                    a.length = sum(item.length for item in a.items)
+                    a.height = 1 + max([item.low for item in a.items
+                                        if not item.terminal] or [0])
+                    if a.length < node.length:
+                        node.length = a.length
+                        changed = True
+                    if a.height < node.low:
+                        node.low = a.height
+                        changed = True
+        for symbol in self.productions:
+            node = nodes[symbol]
+            if node.length == INFINITY:
+                raise ValueError('Symbol {} derives no finite sentence'.format(
+                                 symbol.name))
+            node.height = max(a.height for a in node.alternatives)
+            node.lowest = [a for a in node.alternatives if a.height == node.low]
+        self._nodes = nodes
+        self._start = [nodes[item] for item in reversed(tuple(self.start))
+                       if item != EPSILON]
+
+class _Node:
+    """A symbol of the grammar, as seen by ``Generator.lexemes``: the fewest
+    lexemes it derives, and for nonterminals, its alternatives, the most and
+    fewest levels of productions that they need, and the alternatives
+    needing the fewest. Terminals keep their texts."""
+
+    __slots__ = ('symbol','terminal','length','alternatives','low','height',
+                 'lowest','weighted','texts')
+
+    def __init__(self,symbol,terminal):
+        self.symbol = symbol
+        self.terminal = terminal
+        self.length = INFINITY
+        self.alternatives = []
+        self.low = INFINITY
+        self.height = 0
+        self.lowest = None
+        self.weighted = False
+        self.texts = None
+
+class _Alternative:
+    """A production of a ``_Node``: its items (in reverse, without
+    EPSILON), how many are nonterminals, its weight, and the fewest lexemes
+    and levels of productions it derives."""
+
+    __slots__ = ('items','nonterminals','weight','length','height')
+
+    def __init__(self,items,weight):
+        self.items = items
+        self.nonterminals = sum(1 for item in items if not item.terminal)
+        self.weight = weight
+        self.length = INFINITY
+        self.height = INFINITY
+
+def _fixed(pattern):
+    "Whether the parsed regular expression `pattern` matches only one string."
+    return all(op == sre_constants.LITERAL or op == sre_constants.AT or
+               (op == sre_constants.SUBPATTERN and _fixed(av[-1]))
+               for op, av in pattern)
+
+def _sample(pattern,rng,groups,result,repeat=8):
+    """Append a random string matching `pattern` (as parsed by
+    ``sre_parse``) to the list `result`. Repetitions without an upper bound
+    are repeated at most `repeat` times more than their minimum."""
+    c = sre_constants
+    for op, av in pattern:
+        if op == c.LITERAL:
+            result.append(chr(av))
+        elif op == c.NOT_LITERAL:
+            result.append(rng.choice([x for x in _ALPHABET if ord(x) != av]))
+        elif op == c.ANY:
+            result.append(rng.choice(_ALPHABET))
+        elif op == c.IN:
+            result.append(_sample_in(av,rng))
+        elif op == c.CATEGORY:
+            result.append(_sample_in([(op,av)],rng))
+        elif op in (c.MAX_REPEAT,c.MIN_REPEAT,
+                    getattr(c,'POSSESSIVE_REPEAT',c.MAX_REPEAT)):
+            low, high, item = av
+            high = min(high,low + repeat)
+            for i in range(rng.randint(low,high)):
+                _sample(item,rng,groups,result,repeat)
+        elif op == c.SUBPATTERN:
+            group, item = av[0], av[-1]
+            start = len(result)
+            _sample(item,rng,groups,result,repeat)
+            if group is not None:
+                groups[group] = "".join(result[start:])
+        elif op == getattr(c,'ATOMIC_GROUP',None):
+            _sample(av,rng,groups,result,repeat)
+        elif op == c.BRANCH:
+            _sample(rng.choice(av[1]),rng,groups,result,repeat)
+        elif op == c.GROUPREF:
+            result.append(groups.get(av,''))
+        elif op == c.GROUPREF_EXISTS:
+            group, yes, no = av
+            branch = yes if group in groups else no
+            if branch is not None:
+                _sample(branch,rng,groups,result,repeat)
+        # AT (anchors), ASSERT and ASSERT_NOT match no text. Lookarounds
+        # are not honored - Generator.text checks the result instead.
+
+def _sample_in(items,rng):
+    "A random character of the character class `items`."
+    c = sre_constants
+    negate = items and items[0][0] == c.NEGATE
+    if negate:
+        items = items[1:]
+    def member(char):
+        code = ord(char)
+        for op, av in items:
+            if op == c.LITERAL and code == av:
+                return True
+            if op == c.RANGE and av[0] <= code <= av[1]:
+                return True
+            if op == c.CATEGORY and _CATEGORIES.get(av,lambda c: False)(char):
+                return True
+        return False
+    if negate:
+        return rng.choice([x for x in _ALPHABET if not member(x)])
+
+    op, av = rng.choice(items)
+    if op == c.LITERAL:
+        return chr(av)
+    if op == c.RANGE:
+        return chr(rng.randint(av[0],av[1]))
+    return rng.choice([x for x in _ALPHABET + '\t\n' if member(x)])
@@ -0,0 +1,115 @@
+# generate_test.py - unit tests for generate.py
+
+"""This module provides unit tests for the ``pcc.generate``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import io
+import unittest
+
+import pcc.ll as ll
+from pcc.generate import Generator
+from pcc.lexer import Lexer
+
+class GeneratorTester(unittest.TestCase):
+    """Test harness for ``pcc.generate.Generator`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        self.p = p = ll.LLParser(lexer)
+        p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+        p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+        p.ap('EP',"", lambda x: 0)
+        p.ap('T',"F TP", lambda x: x[0] * x[1])
+        p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+        p.ap('TP',"", lambda x: 1)
+        p.ap('F',"'(' E ')'", lambda x: x[1])
+        p.ap('F',"NUM", lambda x: int(x[0]))
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def _depth(self,tree,node):
+        return 1 + max([self._depth(tree,child) for child
+                        in tree.children(node)] or [0])
+
+    def test_sentences(self):
+        """generate.py: Test generating sentences of a size and depth"""
+        g = Generator(self.p,seed=42)
+        for size in (1,10,100,1000):
+            text = g.sentence(size=size)
+            lexemes = list(self.p.lexer.lex(text))
+            self.assertGreaterEqual(len(lexemes),size)
+            self.assertLess(len(lexemes),size + 20)
+            self.p.parse(text)
+
+        for max_depth in (4,10,30):
+            for i in range(10):
+                text = g.sentence(size=50,max_depth=max_depth)
+                tree = self.p.parsetree(text)
+                # The root is the start production, which doesn't count
+                self.assertLessEqual(self._depth(tree,tree.root) - 1,
+                                     max_depth)
+
+        self.assertEqual(Generator(self.p,seed=1).sentence(size=100),
+                         Generator(self.p,seed=1).sentence(size=100))
+        self.assertNotEqual(Generator(self.p,seed=1).sentence(size=100),
+                            Generator(self.p,seed=2).sentence(size=100))
+
+        out = io.StringIO()
+        written = Generator(self.p,seed=1).write(out,size=5000,chunk=100)
+        self.assertEqual(written,len(out.getvalue()))
+        self.assertEqual(out.getvalue(),
+                         Generator(self.p,seed=1).sentence(size=5000))
+
+    def test_weights(self):
+        """generate.py: Test production weights"""
+        g = Generator(self.p,seed=1,weights={('F',"'(' E ')'"): 0,
+                                             ('TP',"'*' F TP"): 5})
+        text = g.sentence(size=200)
+        self.assertNotIn('(',text)
+        self.assertGreater(text.count('*'),text.count('+'))
+
+        with self.assertRaises(ValueError):
+            Generator(self.p,weights={('F',"NUM NUM"): 2})
+        with self.assertRaises(ValueError):
+            Generator(self.p,weights={('F',"NUM"): -1})
+
+        p = ll.LLParser(self.p.lexer)
+        p.ap('S',"A",None,start_production=True)
+        p.ap('A',"'(' A ')'",None)
+        with self.assertRaises(ValueError):
+            Generator(p)
+
+    def test_text(self):
+        """generate.py: Test the text of tokens"""
+        # Earlier tokens win ties, so the identifiers come last
+        rules = [r'\d+\.\d*([eE][-+]?\d+)?', r'(ab|cd)+x?', r'"[^"\\]{3}"',
+                 r'<(a+)>\1', r'(?i)zz', r'\w\S', r'#[a-z]*',
+                 r'[A-Za-z_][A-Za-z_0-9]*']
+        lexer = Lexer()
+        for index, rule in enumerate(rules):
+            lexer.addtoken(name='T{}'.format(index),rule=rule)
+        p = ll.LLParser(lexer)
+        p.ap('S',"L",None,start_production=True)
+        p.ap('L',"ITEM L",None)
+        p.ap('L',"",None)
+        for index in range(len(rules)):
+            p.ap('ITEM',"T{} ';'".format(index),None)
+        g = Generator(p,seed=7,variety=8)
+        for index, rule in enumerate(rules):
+            token = lexer.tokens['T{}'.format(index)]
+            for i in range(20):
+                text = g.text(token)
+                self.assertTrue(token.rule.fullmatch(text),(rule,text))
+        self.assertEqual(g.text(lexer.tokens['T4']),'zz')
+        p.parse(g.sentence(size=500))
@@ -18,11 +18,34 @@
 # along with pcc, in a file called COPYING.  If not, see
 # <http://www.gnu.org/licenses/>.
 
+import asyncio
+import codecs
 import re
+try:
+    import re._parser as _sre_parse
+except ImportError: # Python < 3.11
+    import sre_parse as _sre_parse
+
 import pcc.symbols as symbols
+from pcc.limits import _limit_lexemes
 
 _token_ident = re.compile(r'[a-zA-Z][_a-zA-Z0-0]*')
 
+class LexingError(ValueError):
+    """Exception raised when no token matches the input. ``line`` and
+    ``position`` locate it, as in the message, and ``offset`` is its index
+    in the input."""
+    line = None
+    position = None
+    offset = None
+
+def _no_token(line,line_pos,offset):
+    "The ``LexingError`` for text at `offset` that no token matches."
+    error = LexingError('No token was found at line {} position {}.'.format(
+                        line,line_pos))
+    error.line, error.position, error.offset = line, line_pos, offset
+    return error
+
 class Lexer:
     r"""Create a new Lexer object.
 
@@ -81,6 +104,10 @@ class Lexer:
                  report_literals=True):
         self.tokens = {}
         self.report_literals = report_literals
+        # The tokens worth trying at each first character (see _starting)
+        self._dispatch = {}
+        # The LITERAL tokens made so far, by character (see _literal)
+        self.literals = {}
 
         if report_literals:
             # Keep in mind that the LITERAL token is special and isn't
@@ -123,53 +150,353 @@ class Lexer:
             raise ValueError('Token {} already exists.'.format(token))
 
         self.tokens[token.name] = token
+        self._dispatch = {}
         
 
         
 
-    def lex(self,input):
-        """Generator that produces ``Lexeme`` objects from the input string."""
+    def lex(self,input,cache=None,limits=None):
+        """Generator that produces ``Lexeme`` objects from the input string.
+
+        `cache`, if given, is a ``pcc.cache.ResultCache`` which keeps the
+        lexemes of inputs that were seen before. In that case the whole input
+        is lexed at once, and the ``Lexeme`` objects are shared by every call
+        for the same input (so they must not be modified.)
+
+        `limits`, if given, are the ``pcc.limits.Limits`` of the time, tokens
+        and memory that lexing may take, counted from this call; the
+        generator raises ``pcc.limits.LimitExceeded`` once it goes over one.
+        They can't be used together with `cache`.
+        """
+        if limits is not None:
+            if cache is not None:
+                raise ValueError("Can't limit a cached lex")
+            return _limit_lexemes(self._lex(input,0,1,1),
+                                  limits.start(nested=False))
+        if cache is not None:
+            return iter(cache.lex(self,input))
+        return self._lex(input,0,1,1)
+
+    async def alex(self,reader,encoding='utf-8',size=1 << 16):
+        """Asynchronous generator that produces ``Lexeme`` objects from
+        input that arrives in pieces, for use with ``asyncio``.
+
+        `reader` is an ``asyncio.StreamReader`` (or anything else with an
+        awaitable ``read(n)`` method, which is read `size` characters or
+        bytes at a time), or an asynchronous iterator of chunks. Chunks of
+        bytes are decoded with `encoding`, even where a character is split
+        between two chunks. The input is lexed with a ``PushLexer``, which
+        settles a lexeme once there is input after it (see there), and at
+        most 4096 characters at a time. Other tasks get a turn between those
+        pieces, so that a large chunk doesn't hold up the event loop for long
+        (producing a lexeme doesn't give them one by itself.)
+
+        >>> import asyncio
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> async def chunks():
+        ...     yield b"12 3"
+        ...     yield b"4 5"
+        >>> async def main():
+        ...     return [x.match async for x in l.alex(chunks())]
+        >>> asyncio.run(main())
+        ['12', '34', '5']
+        """
+        push = PushLexer(self)
+        async for chunk in _text_chunks(reader,encoding,size):
+            for start in range(0,len(chunk),_ALEX_PIECE):
+                if start:
+                    await asyncio.sleep(0)
+                for lexeme in push.feed(chunk[start:start + _ALEX_PIECE]):
+                    yield lexeme
+        for lexeme in push.close():
+            yield lexeme
+
+    def _lex(self,input,position,line,line_pos):
+        """``lex``, starting at `position` in `input`, which is on line `line`
+        at position `line_pos`.
+        """
         if len(self.tokens) < 1:
             raise ValueError('The lexer must have at least 1 rule to work.')
 
-        line = 1
-        line_pos = 1
-        position = 0
         end = len(input)
 
         while position < end:
-                      # This is a tuple (name,match_object,silent_flag)
-            matches = [(token, token.match(input,position))
-                       for token in self.tokens.values()
-                       if not self.report_literals or token.name != "LITERAL"]
-            # Prune out all non-matches and 0-length matches
-            matches = [(token,match) for token,match in matches
-                       if match and len(match) > 0 ]
-            # Sort the matches by match length, descending.
-            matches.sort(reverse= True, key=lambda x: len(x[1]))
-
-            if len(matches) == 0:
-                if self.report_literals:
-                    top_match = input[position]
-                    top_token = symbols.Token('LITERAL',re.escape(top_match))
-                else:
-                    raise ValueError('No token was found at line {} position '
-                                 '{}.'.format(line,line_pos))
-            else:
-                # Pull out the top match
-                top_token, top_match = matches[0]
+            top = self._match(input,position)
+            if top is None:
+                raise _no_token(line,line_pos,position)
+            top_token, top_match = top
 
             if not top_token.silent:
-                yield symbols.Lexeme(top_token,top_match,line,line_pos)
+                yield symbols.Lexeme(top_token,top_match,line,line_pos,
+                                     position)
+
+            line, line_pos = _advance(line,line_pos,top_match)
+            position += len(top_match)
+
+    def _match(self,input,position,tokens=None):
+        """Find the longest token match at `position` in `input`.
+
+        Returns a tuple ``(token, match)``, or None if there is no match (only
+        possible if `report_literals` is off.)
+
+        `tokens`, if given, is the sequence of ``Token`` objects to try instead
+        of this lexer's tokens (earlier ones win ties.) In that case there is
+        no LITERAL fallback, and None is returned if none of them match.
+        """
+        literals = self.report_literals and tokens is None
+        if tokens is None:
+            tokens = self._starting(input[position])
+        top = self._longest(input,position,tokens)
+        if top is None:
+            if literals:
+                top_match = input[position]
+                return self._literal(top_match), top_match
+            return None
+        token, end = top
+        return token, input[position:end]
+
+    def _longest(self,input,position,tokens):
+        """``_match`` without the match string (or the LITERAL fallback):
+        returns ``(token, end)`` for the longest non-empty match of `tokens`
+        at `position`, earlier ones winning ties, or None."""
+        top = None
+        top_end = position
+        for token in tokens:
+            m = token.rule.match(input,position)
+            if m is not None:
+                end = m.end()
+                if end > top_end:
+                    top, top_end = token, end
+        if top is None:
+            return None
+        return top, top_end
+
+    def _starting(self,char):
+        """The tokens (other than LITERAL) that may match text starting with
+        `char`, in order - the others need not be tried. Worked out with
+        ``_first_chars`` the first time each character is asked for."""
+        tokens = self._dispatch.get(char)
+        if tokens is None:
+            if self._dispatch.get(None) != len(self.tokens):
+                # Tokens were added to the dictionary directly
+                self._dispatch = {None: len(self.tokens)}
+            tokens = []
+            for token in self.tokens.values():
+                if self.report_literals and token.name == "LITERAL":
+                    continue
+                first = _first_chars(token.rule)
+                if first is None or char in first:
+                    tokens.append(token)
+            tokens = self._dispatch[char] = tuple(tokens)
+        return tokens
+
+    def _literal(self,char):
+        """Return the LITERAL ``Token`` for the single character `char`.
+
+        The same object is returned for every occurrence of `char`, so that
+        parsers can compare tokens by identity before falling back on
+        ``Token.__eq__``.
+        """
+        token = self.literals.get(char)
+        if token is None:
+            token = self.literals.setdefault(char,
+                        symbols.Token('LITERAL',re.escape(char)))
+        return token
+
 
-            # Advance line and line_pos as needed.
-            line_count = top_match.count("\n")
-            line += line_count
-            if line_count > 0:
-                line_pos = len(top_match.split("\n")[-1]) +1
-            else:
-                line_pos += len(top_match)
+class PushLexer:
+    """Incremental ('push') lexing of input that arrives in pieces.
 
+    Wraps a ``Lexer``. Call ``feed`` with each chunk of input as it arrives,
+    and ``close`` once there is no more. Each call returns a list of the
+    ``Lexeme`` objects that the available input has settled. The results are
+    the same as ``Lexer.lex`` on the whole input, except for one rule of
+    thumb: a lexeme is considered settled as soon as at least one character
+    of input follows it, so a token that only matches when text is added
+    after an otherwise-complete shorter match (for instance a pattern that
+    spans a line break) should not be split across chunks at that point.
+
+    Only the unsettled tail of the input is kept between calls.
+
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> pl = PushLexer(l)
+    >>> [x.match for x in pl.feed("12 3")]
+    ['12']
+    >>> [x.match for x in pl.feed("4 5")]
+    ['34']
+    >>> [x.match for x in pl.close()]
+    ['5']
+    """
+
+    def __init__(self,lexer):
+        if len(lexer.tokens) < 1:
+            raise ValueError('The lexer must have at least 1 rule to work.')
+        self.lexer = lexer
+        self.buffer = ''
+        # Offset of the start of the buffer in the whole input
+        self.offset = 0
+        self.line = 1
+        self.line_pos = 1
+        self.closed = False
+
+    def feed(self,chunk):
+        """Add `chunk` to the input, and return the newly settled lexemes."""
+        if self.closed:
+            raise ValueError('Attempt to feed a closed PushLexer.')
+        self.buffer += chunk
+        return self._lex(False)
+
+    def close(self):
+        """Mark the end of the input, and return the remaining lexemes."""
+        if self.closed:
+            raise ValueError('Attempt to close a closed PushLexer.')
+        self.closed = True
+        return self._lex(True)
+
+    def _lex(self,final):
+        lexemes = []
+        buffer = self.buffer
+        position = 0
+        end = len(buffer)
+        line, line_pos = self.line, self.line_pos
+
+        while position < end:
+            top = self.lexer._match(buffer,position)
+            if top is None:
+                if not final and position + 1 >= end:
+                    break
+                raise _no_token(line,line_pos,self.offset + position)
+            top_token, top_match = top
+            if not final and position + len(top_match) >= end:
+                # More input might extend this match - wait for it.
+                break
+
+            if not top_token.silent:
+                lexemes.append(symbols.Lexeme(top_token,top_match,line,
+                                              line_pos,self.offset+position))
+
+            line, line_pos = _advance(line,line_pos,top_match)
             position += len(top_match)
-            
-            
+
+        self.buffer = buffer[position:]
+        self.offset += position
+        self.line, self.line_pos = line, line_pos
+        return lexemes
+
+# The most input that Lexer.alex lexes at once
+_ALEX_PIECE = 1 << 12
+
+async def _read_chunks(reader,size):
+    "Asynchronously iterate over the chunks that ``reader.read`` returns."
+    while True:
+        chunk = await reader.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+async def _text_chunks(reader,encoding,size):
+    """Asynchronously iterate over the input from `reader` as strings,
+    decoding chunks of bytes with `encoding` (see ``Lexer.alex``)."""
+    decoder = None
+    if hasattr(reader,'read'):
+        reader = _read_chunks(reader,size)
+    async for chunk in reader:
+        if isinstance(chunk,(bytes,bytearray)):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            chunk = decoder.decode(chunk)
+        yield chunk
+    if decoder is not None:
+        yield decoder.decode(b'',True)
+
+# pattern, flags -> the result of _first_chars
+_FIRST_CHARS = {}
+
+def _first_chars(rule):
+    r"""The set of characters that a non-empty match of the compiled regular
+    expression `rule` may start with, or None if that can't be told (or if
+    there are too many to list.)
+
+    >>> sorted(_first_chars(re.compile(r'(0x)?[0-9]+|[-+]')))
+    ['+', '-', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+    >>> _first_chars(re.compile(r'\s+')) is None
+    True
+    """
+    key = (rule.pattern,rule.flags)
+    if key not in _FIRST_CHARS:
+        try:
+            if rule.flags & re.IGNORECASE or not isinstance(rule.pattern,str):
+                raise _Unknown
+            first, nullable = _first_of(_sre_parse.parse(rule.pattern,
+                                                         rule.flags))
+            _FIRST_CHARS[key] = frozenset(first)
+        except (_Unknown,re.error,RecursionError):
+            _FIRST_CHARS[key] = None
+    return _FIRST_CHARS[key]
+
+class _Unknown(Exception):
+    "Raised by ``_first_of`` for what it can't (or won't) work out."
+    pass
+
+def _first_of(items):
+    """The ``(first, nullable)`` of a parsed regular expression `items`: the
+    characters that a match may start with, and whether it may be empty.
+    Zero-width assertions are taken to match anything."""
+    p = _sre_parse
+    first = set()
+    for op, arg in items:
+        if op is p.LITERAL:
+            item, nullable = {chr(arg)}, False
+        elif op is p.IN:
+            item, nullable = _first_in(arg), False
+        elif op is p.SUBPATTERN:
+            if arg[1] & re.IGNORECASE:
+                raise _Unknown
+            item, nullable = _first_of(arg[-1])
+        elif op is p.BRANCH:
+            item, nullable = set(), False
+            for branch in arg[1]:
+                branch_first, branch_nullable = _first_of(branch)
+                item |= branch_first
+                nullable = nullable or branch_nullable
+        elif op in (p.MAX_REPEAT,p.MIN_REPEAT,
+                    getattr(p,'POSSESSIVE_REPEAT',p.MAX_REPEAT)):
+            item, nullable = _first_of(arg[2])
+            nullable = nullable or arg[0] == 0
+        elif op is getattr(p,'ATOMIC_GROUP',None):
+            item, nullable = _first_of(arg)
+        elif op in (p.AT,p.ASSERT,p.ASSERT_NOT):
+            item, nullable = set(), True
+        else:
+            # ANY, NOT_LITERAL, GROUPREF and so on
+            raise _Unknown
+        first |= item
+        if len(first) > 256:
+            raise _Unknown
+        if not nullable:
+            return first, False
+    return first, True
+
+def _first_in(items):
+    "The characters of the parsed character set `items` (``[...]``)."
+    p = _sre_parse
+    chars = set()
+    for op, arg in items:
+        if op is p.LITERAL:
+            chars.add(chr(arg))
+        elif op is p.RANGE and arg[1] - arg[0] < 256:
+            chars.update(chr(c) for c in range(arg[0],arg[1] + 1))
+        else:
+            # NEGATE, CATEGORY (such as \d, which isn't just ASCII), big
+            # ranges
+            raise _Unknown
+    return chars
+
+def _advance(line,line_pos,match):
+    "Return the (line, line_pos) after the text `match`."
+    line_count = match.count("\n")
+    if line_count > 0:
+        return line + line_count, len(match.split("\n")[-1]) +1
+    return line, line_pos + len(match)
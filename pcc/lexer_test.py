@@ -8,6 +8,7 @@ ways, but most easily by going to the project root dir and executing
 ``python3 setup.py nosetests``.
 """
 
+import asyncio
 import unittest
 
 import pcc.lexer as fl
@@ -86,7 +87,138 @@ class LexerTester(unittest.TestCase):
         self.assertEqual(lexemes[3].token.name,"NUMBER")
         self.assertEqual(lexemes[3].match,"3")
         
-        with self.assertRaises(ValueError):
+        with self.assertRaises(fl.LexingError) as raised:
             lexemes = [t for t in no_literals.lex(input)]
+        e = raised.exception
+        self.assertIsInstance(e,ValueError)
+        self.assertEqual((e.line,e.position,e.offset),(1,5,4))
         
 
+    def test_push(self):
+        """lexer.py: Test incremental lexing of chunked input"""
+        l = fl.Lexer()
+        l.addtoken(name='WORD',rule=r'[a-zA-Z]+')
+        l.addtoken(name='NUMBER',rule=r'[0-9]+')
+        l.addtoken(name='POW',rule=r'\*\*')
+
+        input = "abc 123 de**4 * 5!\n  xyz\n99"
+        expected = [(x.token.name,x.match,x.line,x.position)
+                    for x in l.lex(input)]
+
+        for size in (1,2,3,7):
+            pl = fl.PushLexer(l)
+            lexemes = []
+            for i in range(0,len(input),size):
+                lexemes.extend(pl.feed(input[i:i+size]))
+                self.assertTrue(len(pl.buffer) <= size + 3)
+            lexemes.extend(pl.close())
+            self.assertEqual([(x.token.name,x.match,x.line,x.position)
+                              for x in lexemes], expected)
+
+        l = fl.Lexer(report_literals=False)
+        l.addtoken(name='WORD',rule=r'[a-zA-Z]+')
+        pl = fl.PushLexer(l)
+        self.assertEqual(len(pl.feed("ab !")),1)
+        with self.assertRaises(fl.LexingError) as raised:
+            pl.feed("x")
+        self.assertEqual(raised.exception.offset,3)
+
+    def test_alex(self):
+        """lexer.py: Test lexing input from asynchronous sources"""
+        l = fl.Lexer()
+        l.addtoken(name='WORD',rule=r'[a-zé]+')
+        l.addtoken(name='NUMBER',rule=r'[0-9]+')
+        input = "été 12 ça**4\n  xyz 99 " * 2000
+        expected = [(x.token.name,x.match,x.line,x.position,x.offset)
+                    for x in l.lex(input)]
+        def lexemes(source,**options):
+            async def main():
+                return [(x.token.name,x.match,x.line,x.position,x.offset)
+                        async for x in l.alex(source(),**options)]
+            return asyncio.run(main())
+
+        data = input.encode('utf-8')
+        for size in (1,2,5,100000):
+            async def chunks():
+                for i in range(0,len(data),size):
+                    yield data[i:i + size]
+            self.assertEqual(lexemes(chunks),expected)
+            async def text():
+                for i in range(0,len(input),size):
+                    yield input[i:i + size]
+            self.assertEqual(lexemes(text),expected)
+        async def reader():
+            reader = asyncio.StreamReader()
+            reader.feed_data(input.encode('latin-1'))
+            reader.feed_eof()
+            return reader
+        async def main():
+            return [x.match async for x in l.alex(await reader(),
+                                                  encoding='latin-1',
+                                                  size=3)]
+        self.assertEqual(asyncio.run(main()),[x[1] for x in expected])
+
+        # Other tasks have their turn while a large chunk is lexed
+        async def main():
+            turns = []
+            async def other():
+                while True:
+                    turns.append(len(turns))
+                    await asyncio.sleep(0)
+            task = asyncio.create_task(other())
+            await asyncio.sleep(0)
+            count = 0
+            async for lexeme in l.alex(text()):
+                count += 1
+            task.cancel()
+            return count, len(turns)
+        async def text():
+            yield input
+        count, turns = asyncio.run(main())
+        self.assertEqual(count,len(expected))
+        self.assertGreaterEqual(turns,len(input) // fl._ALEX_PIECE)
+
+        l = fl.Lexer(report_literals=False)
+        l.addtoken(name='WORD',rule=r'[a-z]+')
+        async def bad():
+            yield "ab !"
+        with self.assertRaises(ValueError):
+            lexemes(bad)
+
+    def test_first_chars(self):
+        """lexer.py: Test trying only the tokens that may match"""
+        rules = [r'(?i)select', r'(0x)?[0-9a-f]+', r'[-+]?\d+', r'(?=a)\w+',
+                 r'a*b|c?d', r'\bif\b', r'[^x]y', r'(ab|cd)+x?', r'e{0,2}f',
+                 r'"(\\.|[^"\\])*"', r'(?:gh)?+i', r'\$[a-z]', r'.']
+        l = fl.Lexer(report_literals=False)
+        for index, rule in enumerate(rules):
+            l.addtoken(name='T{}'.format(index),rule=rule)
+        self.assertEqual(fl._first_chars(l.tokens['T1'].rule),
+                         set('0123456789abcdef'))
+        self.assertEqual(fl._first_chars(l.tokens['T4'].rule),set('abcd'))
+        self.assertEqual(fl._first_chars(l.tokens['T8'].rule),set('ef'))
+        self.assertEqual(fl._first_chars(l.tokens['T10'].rule),set('gi'))
+        for index in (0,2,3,6,12):
+            self.assertIsNone(fl._first_chars(
+                l.tokens['T{}'.format(index)].rule))
+
+        # The same lexemes as when trying every token
+        text = ('SeLeCt 0x1f -42 abc aab d if iff zy cdabx ef "a\\"b" ghi '
+                '$q + ٣٤ select')
+        lexemes = [(x.token.name,x.match) for x in l.lex(text)]
+        expected = []
+        position = 0
+        tokens = list(l.tokens.values())
+        while position < len(text):
+            token, match = max(((t,t.match(text,position)) for t in tokens
+                                if t.match(text,position)),
+                               key=lambda x: (len(x[1]),-tokens.index(x[0])))
+            if not token.silent:
+                expected.append((token.name,match))
+            position += len(match)
+        self.assertEqual(lexemes,expected)
+        self.assertIn(('T2','٣٤'),lexemes)
+
+        # Tokens added later are tried too
+        l.addtoken(name='LONG',rule=r'selection')
+        self.assertEqual([x.token.name for x in l.lex("selection")],['LONG'])
@@ -0,0 +1,244 @@
+"""limits.py - Bound the time, work and memory of a parse
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+import tracemalloc
+
+# The bytes counted for each block the interpreter allocates, when memory
+# isn't being traced with ``tracemalloc`` (see Limits)
+_BLOCK_BYTES = 64
+
+class LimitExceeded(Exception):
+    """Exception raised when a parse (or a lex) goes over one of its
+    ``Limits``. Each limit has a subclass of its own.
+
+    Besides the message, it tells how far the parse got: ``tokens`` (read
+    so far), ``steps`` (decisions made between productions), ``depth`` (of
+    nested calls, if the limits asked for it), ``memory`` (the estimated
+    bytes allocated, if they asked for that), ``elapsed`` (seconds), and
+    ``line``, ``position`` and ``offset`` of the last token read. ``limit``
+    is the value of the limit that was exceeded.
+    """
+    limit = None
+    tokens = 0
+    steps = 0
+    depth = None
+    memory = None
+    elapsed = 0.0
+    line = None
+    position = None
+    offset = None
+
+class DeadlineExceeded(LimitExceeded):
+    "Raised when a parse runs past its ``timeout`` or ``deadline``."
+    pass
+
+class TokenLimitExceeded(LimitExceeded):
+    "Raised when a parse reads more than ``max_tokens`` tokens."
+    pass
+
+class StepLimitExceeded(LimitExceeded):
+    "Raised when a parse takes more than ``max_steps`` steps."
+    pass
+
+class DepthLimitExceeded(LimitExceeded):
+    "Raised when a parse nests deeper than ``max_depth``."
+    pass
+
+class MemoryLimitExceeded(LimitExceeded):
+    "Raised when a parse allocates more than about ``max_memory`` bytes."
+    pass
+
+class Limits:
+    """Limits on a single call of ``parse`` (or ``Lexer.lex``), for inputs
+    that can't be trusted to be reasonable. Pass them as the `limits` of
+    the call, and it raises a ``LimitExceeded`` (of the subclass for the
+    limit) as soon as it goes over one. The same object may be used for any
+    number of calls, in any number of threads: each call has a budget of
+    its own.
+
+    `timeout` is the seconds a call may take, and `deadline` the
+    ``time.monotonic()`` by which it must be done (useful to share one
+    deadline between several calls). `max_tokens` limits the tokens read,
+    and `max_steps` the decisions between productions (a step for each
+    nonterminal and each item of a repetition), which bounds the work done
+    per token. `max_depth` limits the nesting of the parse, counted in the
+    Python calls it makes on the stack (about one per level of nested
+    productions), and `max_memory` the bytes allocated meanwhile - measured
+    with ``tracemalloc`` if it is tracing, and otherwise estimated from the
+    number of blocks the interpreter has allocated (``sys.getallocatedblocks``,
+    at 64 bytes each), which counts the allocations of other threads too.
+
+    Token and step limits are exact. The others are only checked every
+    `every` tokens or steps, to keep the cost of checking low, and may be
+    overshot by that much. Steps and depth don't apply to lexing.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM*", lambda x: len(x[0]), start_production=True)
+    >>> limits = Limits(timeout=0.5, max_tokens=100)
+    >>> p.parse("1 2 3", limits=limits)
+    3
+    >>> try:
+    ...     p.parse("1 2 3 " * 100, limits=limits)
+    ... except TokenLimitExceeded as e:
+    ...     print(e)
+    ...     print(e.tokens, e.offset)
+    More than 100 tokens, on line 1 at position 201
+    101 200
+    """
+
+    def __init__(self, timeout=None, deadline=None, max_tokens=None,
+                 max_steps=None, max_depth=None, max_memory=None, every=256):
+        for name, value in (('timeout',timeout),('max_tokens',max_tokens),
+                            ('max_steps',max_steps),('max_depth',max_depth),
+                            ('max_memory',max_memory)):
+            if value is not None and value < 0:
+                raise ValueError('{} must not be negative'.format(name))
+        if every < 1:
+            raise ValueError('every must be at least 1')
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+        self.max_steps = max_steps
+        self.max_depth = max_depth
+        self.max_memory = max_memory
+        self.every = every
+
+    def start(self,nested=True):
+        """Return the ``_Budget`` of a call that starts now - in the frame
+        of the caller, from which `depth` is counted (unless `nested` is
+        False, for calls that don't nest)."""
+        return _Budget(self,sys._getframe(1) if nested else None)
+
+class _Budget:
+    """What is left of the ``Limits`` of a call.
+
+    Whoever reads a token adds one to ``tokens``, and whoever takes a step
+    to ``steps``, and both subtract one from ``countdown`` - calling
+    ``check`` when it runs out.
+    """
+
+    def __init__(self,limits,frame):
+        self.limits = limits
+        self.tokens = 0
+        self.steps = 0
+        self.started = time.monotonic()
+        deadline = limits.deadline
+        if limits.timeout is not None:
+            timeout = self.started + limits.timeout
+            if deadline is None or timeout < deadline:
+                deadline = timeout
+        self.deadline = deadline
+        self.base = None
+        if frame is not None and limits.max_depth is not None:
+            self.base = _stack_depth(frame)
+        self.traced = tracemalloc.is_tracing()
+        if limits.max_memory is not None:
+            self.allocated = self._allocated()
+        self._reset()
+
+    def _reset(self):
+        "Set the ``countdown`` to the next check."
+        limits = self.limits
+        countdown = limits.every
+        if limits.max_tokens is not None:
+            countdown = min(countdown,limits.max_tokens - self.tokens + 1)
+        if limits.max_steps is not None:
+            countdown = min(countdown,limits.max_steps - self.steps + 1)
+        self.countdown = countdown
+
+    def _allocated(self):
+        if self.traced:
+            return tracemalloc.get_traced_memory()[0]
+        return sys.getallocatedblocks() * _BLOCK_BYTES
+
+    def check(self,lexeme=None):
+        """Raise ``LimitExceeded`` if the call is over its limits, having
+        got as far as `lexeme` (the ``Lexeme`` just read, if any)."""
+        limits = self.limits
+        if limits.max_tokens is not None and self.tokens > limits.max_tokens:
+            self.exceeded(TokenLimitExceeded,limits.max_tokens,lexeme,
+                          'More than {} tokens'.format(limits.max_tokens))
+        if limits.max_steps is not None and self.steps > limits.max_steps:
+            self.exceeded(StepLimitExceeded,limits.max_steps,lexeme,
+                          'More than {} steps'.format(limits.max_steps))
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded(DeadlineExceeded,
+                          limits.timeout if limits.deadline is None
+                          else limits.deadline,lexeme,
+                          'Out of time after {:.3f} seconds'.format(
+                          time.monotonic() - self.started))
+        if self.base is not None:
+            depth = _stack_depth(sys._getframe(1)) - self.base
+            if depth > limits.max_depth:
+                self.exceeded(DepthLimitExceeded,limits.max_depth,lexeme,
+                              'Nested more than {} deep'.format(
+                              limits.max_depth))
+        if limits.max_memory is not None:
+            memory = self._allocated() - self.allocated
+            if memory > limits.max_memory:
+                self.exceeded(MemoryLimitExceeded,limits.max_memory,lexeme,
+                              'More than {} bytes allocated'.format(
+                              limits.max_memory))
+        self._reset()
+
+    def exceeded(self,cls,limit,lexeme,message):
+        "Raise the ``LimitExceeded`` subclass `cls`, with the progress."
+        if lexeme is not None and lexeme.line != -1:
+            message += ', on line {} at position {}'.format(lexeme.line,
+                                                            lexeme.position)
+        e = cls(message)
+        e.limit = limit
+        e.tokens = self.tokens
+        e.steps = self.steps
+        e.elapsed = time.monotonic() - self.started
+        if self.base is not None:
+            e.depth = _stack_depth(sys._getframe(2)) - self.base
+        if self.limits.max_memory is not None:
+            e.memory = self._allocated() - self.allocated
+        if lexeme is not None and lexeme.line != -1:
+            e.line = lexeme.line
+            e.position = lexeme.position
+            e.offset = lexeme.offset
+        raise e
+
+def _limit_lexemes(lexemes,budget):
+    """Generate the lexemes of the iterable `lexemes`, counting them in
+    `budget` (see ``Lexer.lex``)."""
+    for lexeme in lexemes:
+        budget.tokens += 1
+        budget.countdown -= 1
+        if budget.countdown <= 0:
+            budget.check(lexeme)
+        yield lexeme
+
+def _stack_depth(frame):
+    "The number of frames on the stack, from `frame` down."
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
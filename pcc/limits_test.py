@@ -0,0 +1,184 @@
+# limits_test.py - unit tests for limits.py
+
+"""This module provides unit tests for the ``pcc.limits``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import pickle
+import time
+import tracemalloc
+import unittest
+
+import pcc.ll as ll
+import pcc.peg as peg
+from pcc.cache import ResultCache
+from pcc.lexer import Lexer
+from pcc.limits import (Limits, LimitExceeded, DeadlineExceeded,
+                        TokenLimitExceeded, StepLimitExceeded,
+                        DepthLimitExceeded, MemoryLimitExceeded)
+
+class LimitsTester(unittest.TestCase):
+    """Test harness for ``pcc.limits.Limits`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.lexer = Lexer()
+        self.lexer.addtoken(name='NUM',rule=r'[0-9]+')
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def _grammar(self,p):
+        "Nested lists of numbers."
+        p.ap('S',"L",lambda x: x[0],start_production=True)
+        p.ap('L',"ITEM L",lambda x: [x[0]] + x[1])
+        p.ap('L',"",lambda x: [])
+        p.ap('ITEM',"NUM",lambda x: int(x[0]))
+        p.ap('ITEM',"'(' L ')'",lambda x: x[1])
+        return p
+
+    def _parsers(self):
+        return [self._grammar(ll.LLParser(self.lexer)),
+                self._grammar(ll.LLParser(self.lexer,k=2)),
+                self._grammar(ll.LLParser(self.lexer,context_lexing=True)),
+                self._grammar(peg.PEGParser(self.lexer))]
+
+    def test_tokens(self):
+        """limits.py: Test the token and step limits"""
+        text = "1 (2) " * 25
+        for p in self._parsers():
+            self.assertEqual(len(p.parse(text,limits=Limits(max_tokens=100))),
+                             50)
+            with self.assertRaises(TokenLimitExceeded) as raised:
+                p.parse(text + "4",limits=Limits(max_tokens=100,every=7))
+            e = raised.exception
+            self.assertEqual((e.limit,e.tokens),(100,101))
+            self.assertEqual((e.line,e.position,e.offset),(1,151,150))
+            self.assertIn('More than 100 tokens',str(e))
+
+            with self.assertRaises(StepLimitExceeded) as raised:
+                p.parse(text,limits=Limits(max_steps=50))
+            self.assertEqual(raised.exception.steps,51)
+        # A step is taken for every nonterminal (but the start symbol)
+        p = self._grammar(ll.LLParser(self.lexer))
+        self.assertEqual(p.parse("1",limits=Limits(max_steps=3)),[1])
+        with self.assertRaises(StepLimitExceeded):
+            p.parse("1",limits=Limits(max_steps=2))
+
+        # The same limits serve any number of calls
+        limits = Limits(max_tokens=3)
+        for i in range(3):
+            self.assertEqual(p.parse("1 2 3",limits=limits),[1,2,3])
+        with self.assertRaises(LimitExceeded):
+            p.parse("1 2 3 4",limits=limits)
+
+        # Syntax errors are still found
+        with self.assertRaises(ll.ParsingError):
+            p.parse("1 )",limits=limits)
+        errors = []
+        self.assertEqual(p.parse("1 + 2",errors=errors,limits=limits),[1,2])
+        self.assertEqual(len(errors),1)
+        with self.assertRaises(TokenLimitExceeded):
+            p.parse("1 + 2 3",errors=errors,limits=limits)
+
+        with self.assertRaises(ValueError):
+            p.parse("1",cache=ResultCache(),limits=limits)
+        with self.assertRaises(ValueError):
+            Limits(max_tokens=-1)
+        with self.assertRaises(ValueError):
+            Limits(every=0)
+
+    def test_depth(self):
+        """limits.py: Test the depth limit"""
+        text = "(" * 100 + ")" * 100
+        for p in self._parsers():
+            self.assertEqual(len(p.parse(text,limits=Limits(max_depth=600))),
+                             1)
+            with self.assertRaises(DepthLimitExceeded) as raised:
+                p.parse(text,limits=Limits(max_depth=100,every=8))
+            e = raised.exception
+            self.assertGreater(e.depth,100)
+
+        # Repetitions don't nest
+        p = ll.LLParser(self.lexer)
+        p.ap('S',"NUM*",lambda x: len(x[0]),start_production=True)
+        self.assertEqual(p.parse("1 " * 5000,limits=Limits(max_depth=10,
+                                                             every=1)),5000)
+
+    def test_time(self):
+        """limits.py: Test the timeout and the deadline"""
+        text = "1 (2) " * 60
+        for p in self._parsers():
+            self.assertEqual(len(p.parse(text,limits=Limits(timeout=60))),
+                             120)
+            with self.assertRaises(DeadlineExceeded) as raised:
+                p.parse(text,limits=Limits(timeout=0))
+            e = raised.exception
+            self.assertEqual(e.limit,0)
+            # Only checked every 256 tokens or steps
+            self.assertLessEqual(e.tokens + e.steps,256)
+            self.assertGreater(e.tokens + e.steps,0)
+            self.assertGreaterEqual(e.elapsed,0)
+
+        deadline = time.monotonic() - 1
+        with self.assertRaises(DeadlineExceeded) as raised:
+            p.parse(text,limits=Limits(timeout=60,deadline=deadline,every=1))
+        self.assertEqual(raised.exception.limit,deadline)
+        self.assertLessEqual(raised.exception.tokens,1)
+
+    def test_memory(self):
+        """limits.py: Test the memory limit"""
+        p = ll.LLParser(self.lexer)
+        p.ap('S',"ITEM*",lambda x: x[0],start_production=True)
+        p.ap('ITEM',"NUM",lambda x: [int(x[0])] * 10)
+        text = "1 " * 20000
+        self.assertEqual(len(p.parse(text,limits=Limits(max_memory=1 << 30))),
+                         20000)
+        with self.assertRaises(MemoryLimitExceeded) as raised:
+            p.parse(text,limits=Limits(max_memory=100000))
+        e = raised.exception
+        self.assertGreater(e.memory,100000)
+        self.assertLess(e.tokens,20000)
+
+        tracemalloc.start()
+        try:
+            with self.assertRaises(MemoryLimitExceeded) as raised:
+                p.parse(text,limits=Limits(max_memory=100000))
+            self.assertGreater(raised.exception.memory,100000)
+        finally:
+            tracemalloc.stop()
+
+    def test_lex(self):
+        """limits.py: Test the limits of lexing"""
+        lexemes = self.lexer.lex("1 2 3",limits=Limits(max_tokens=3))
+        self.assertEqual([l.match for l in lexemes],['1','2','3'])
+        lexemes = self.lexer.lex("1 2\n3 4",limits=Limits(max_tokens=3,
+                                                           max_steps=0,
+                                                           max_depth=0))
+        with self.assertRaises(TokenLimitExceeded) as raised:
+            list(lexemes)
+        e = raised.exception
+        self.assertEqual((e.tokens,e.line,e.position),(4,2,3))
+        self.assertIsNone(e.depth)
+        with self.assertRaises(DeadlineExceeded):
+            list(self.lexer.lex("1 " * 1000,limits=Limits(timeout=0)))
+        with self.assertRaises(ValueError):
+            self.lexer.lex("1",cache=ResultCache(),limits=Limits())
+
+    def test_pickle(self):
+        """limits.py: Test pickling the exceptions"""
+        p = self._grammar(ll.LLParser(self.lexer))
+        with self.assertRaises(TokenLimitExceeded) as raised:
+            p.parse("1 2 3",limits=Limits(max_tokens=2))
+        e = raised.exception
+        copy = pickle.loads(pickle.dumps(e))
+        self.assertIs(type(copy),TokenLimitExceeded)
+        self.assertEqual(str(copy),str(e))
+        self.assertEqual((copy.tokens,copy.offset),(3,4))
@@ -19,43 +19,137 @@
 # along with pcc, in a file called COPYING.  If not, see
 # <http://www.gnu.org/licenses/>.
 
-from pcc.parser import Parser, GrammarError, ParsingError
+from pcc.parser import Parser, GrammarError, ParsingError, _make_symbol
+from pcc.parser import _left_recursion, _expand, _link, _items
 from pcc.symbols import Symbol, Token, EOF, EPSILON, SymbolString, Lexeme
+from pcc.lexer import PushLexer, _advance, _no_token
+from pcc.tree import ParseTree
 
+from bisect import bisect_left, bisect_right
+from collections import deque
+import asyncio
 import itertools
+import queue
 import re
+import threading
+import time
 
 class LLParser(Parser):
-    
-    def __init__(self,lexer):
+    """LL(1) table-driven recursive descent parser.
+
+    If `adaptive` is True, the grammar need not be LL(1): when the parse
+    table offers more than one production for the next token, the parser
+    looks further ahead in the input (as many tokens as it takes, in the
+    style of ANTLR's ALL(*) algorithm) to decide which production to use.
+    Each such decision is remembered as a small lookahead DFA for its
+    nonterminal, so later parses usually decide by walking a few cached
+    transitions. Decisions that one token of lookahead can settle are made
+    exactly as in the non-adaptive parser. Left-recursive grammars are still
+    rejected, and a truly ambiguous input is resolved in favor of the
+    production that was added first.
+
+    With `k` greater than 1 (and `adaptive` False), the grammar may be
+    strong LL(k) rather than LL(1): decisions that one token can not settle
+    look at the next `k` tokens instead, using FIRST_k and FOLLOW_k sets
+    computed at ``finalize``. All other decisions are made exactly as in an
+    LL(1) parser, and a grammar that is not LL(k) raises ``GrammarError``.
+
+    >>> from pcc.lexer import Lexer
+    >>> l = Lexer()
+    >>> l.addtoken(name='NAME',rule=r'[a-z]+')
+    >>> p = LLParser(l, k=2)
+    >>> p.ap('S', "A", lambda x: x[0], start_production=True)
+    >>> p.ap('A', "NAME '=' NAME", lambda x: ('set', x[0], x[2]))
+    >>> p.ap('A', "NAME", lambda x: ('get', x[0]))
+    >>> p.parse("a = b")
+    ('set', 'a', 'b')
+    >>> p.parse("a")
+    ('get', 'a')
+
+    If `lazy` is True, ``finalize`` only does the global analysis (the
+    FOLLOW sets, and the checks that need the whole grammar), and each row of
+    the parse table is built - and checked for LL(1) conflicts - the first
+    time the parser needs it. This makes large grammars, of which any one
+    input uses only a small part, much quicker to get started with. Note that
+    a grammar error in a row then only surfaces (as ``GrammarError``) when
+    some input uses that row.
+
+    If `context_lexing` is True, ``parse`` lexes the input as it goes, and at
+    each point tries only the tokens that the parse table allows next (and
+    the lexer's silent tokens) rather than every token of the lexer. Tokens
+    that the grammar never mentions are therefore never tried, large token
+    sets cost much less per lexeme, and input that the full lexer would
+    split the wrong way (say, a keyword where only an identifier can appear)
+    is lexed as the grammar expects. The full lexer is only consulted when
+    none of the expected tokens match, to report the error. ``parsetree``,
+    ``reparse`` and ``pushparser`` always use the full lexer.
+
+    >>> l = Lexer()
+    >>> l.addtoken(name='IF',rule=r'if')
+    >>> l.addtoken(name='NAME',rule=r'[a-z]+')
+    >>> p = LLParser(l, context_lexing=True)
+    >>> p.ap('S', "IF NAME", lambda x: x[1], start_production=True)
+    >>> p.parse("if if")
+    'if'
+    """
+
+    def __init__(self,lexer,adaptive=False,context_lexing=False,k=1,
+                 lazy=False):
+        if k < 1:
+            raise ValueError('k must be at least 1')
+        if adaptive and k > 1:
+            raise ValueError('An adaptive parser has no fixed k')
         self.lexer = lexer
+        self.adaptive = adaptive
+        self.context_lexing = context_lexing
+        self.k = k
+        self.lazy = lazy
+        # Incremented by every update() of the grammar after finalize
+        self.version = 0
         self.finalized = False
         self.productions = {}
         self.start = None
         self.terminals = {t for t in lexer.tokens.values()} | {EOF}
+        # The helper nonterminals of repetitions, options and groups in
+        # rules (see pcc.parser._expand)
+        self.helpers = {}
+        # An empty parse table row, copied by _table_row (copying a dict
+        # doesn't hash its keys again)
+        self._blank_row = None
+        # Held while finalizing, so that concurrent first calls to parse()
+        # (and friends) from several threads finalize exactly once.
+        self._lock = threading.RLock()
 
-    def addproduction(self,symbol,rule,action, start_production=False):
-        if self.finalized:
-            raise ValueError("Can't add a production after finalizing the "
-                             "parser (maybe you called parse() too soon?")
-
-        symbol = Symbol(symbol)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
 
-        if symbol.name in self.lexer.tokens:
-            raise GrammarError('Symbol conflicts with Token name: {}'.format(
-                               symbol.name))
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
 
+    def addproduction(self,symbol,rule,action, start_production=False):
         # Initial start_production check
         if self.start is not None and start_production:
             raise GrammarError('A Start production has already been specified.')
 
-        # Symbolize the rule
-        rule_symbols=SymbolString([_make_symbol(self.lexer,x)
-                                  for x in rule.split()])
+        if self.finalized:
+            if start_production:
+                raise GrammarError("Can't add a start production after "
+                                   "finalizing the parser.")
+            self.update(add=[(symbol,rule,action)])
+            return
 
-        # Handle epsilon-productions:
-        if len(rule_symbols) == 0:
-            rule_symbols = SymbolString((EPSILON,))
+        productions = _expand(symbol,rule,action,self.helpers,self._defined)
+        for symbol, rule, action in productions[1:]:
+            self._add(symbol,rule,action)
+        symbol, rule, action = productions[0]
+        self._add(symbol,rule,action,start_production)
+
+    def _add(self,symbol,rule,action,start_production=False):
+        "Add a production with a plain rule to a parser not yet finalized."
+        symbol, rule_symbols = self._symbolize(symbol,rule)
 
         # Wrap up start_production stuff
         if start_production:
@@ -76,23 +170,613 @@ class LLParser(Parser):
         # Add any new string literal tokens to the terminals set
         self.terminals |= { s for s in rule_symbols if s.terminal() }
 
+    def addexpression(self,symbol,operand,operators):
+        """Add the nonterminal `symbol` as an expression of `operand`s joined
+        by binary `operators`, which is parsed by operator precedence rather
+        than by one nonterminal per level of precedence.
+
+        `operand` is a symbol, given as in the rule of ``addproduction``
+        (prefix operators, parentheses and the like belong in its
+        productions.) `operators` is a sequence of ``(operator, precedence,
+        associativity, action)`` tuples, where `operator` is a terminal (a
+        token name or a quoted character), operators of a higher
+        `precedence` bind more tightly, `associativity` is ``'left'`` or
+        ``'right'``, and `action` is called with ``[left, operator, right]``
+        (or used as a constant) just like the action of a production
+        ``symbol -> symbol operator symbol``.
+
+        For its FIRST and FOLLOW sets, and anything else that works with the
+        productions, the expression is the pair of productions ``symbol ->
+        operand symbol_OPS`` and ``symbol_OPS -> operator operand symbol_OPS
+        | <empty>`` (one for each operator), whose actions work the values
+        out by precedence. ``parse`` instead reads the whole expression in
+        one loop, with no recursion other than for its operands.
+
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> p = LLParser(l)
+        >>> p.ap('S', "E", lambda x: x[0], start_production=True)
+        >>> p.addexpression('E', "F", [
+        ...     ("'-'", 1, 'left', lambda x: ('-', x[0], x[2])),
+        ...     ("'*'", 2, 'left', lambda x: ('*', x[0], x[2])),
+        ...     ("'^'", 3, 'right', lambda x: ('^', x[0], x[2]))])
+        >>> p.ap('F', "NUM", lambda x: int(x[0]))
+        >>> p.ap('F', "'(' E ')'", lambda x: x[1])
+        >>> p.parse("1 - 2 - 3 * 4 ^ 5 ^ 6")
+        ('-', ('-', 1, 2), ('*', 3, ('^', 4, ('^', 5, 6))))
+        >>> p.parsetree("(1 - 2) * 3").fold()
+        ('*', ('-', 1, 2), 3)
+        """
+        tail = symbol + '_OPS'
+        for name in (symbol,tail):
+            if self.productions.get(Symbol(name)):
+                raise GrammarError('Symbol {} is already defined'.format(name))
+        if len(operand.split()) != 1:
+            raise GrammarError('The operand of {} must be a single '
+                               'symbol'.format(symbol))
+        productions = [(symbol,"{} {}".format(operand,tail),_Expression())]
+        for operator, precedence, associativity, action in operators:
+            if associativity not in ('left','right'):
+                raise ValueError('Associativity must be left or right, not '
+                                 '{!r}'.format(associativity))
+            if ( len(operator.split()) != 1 or
+                 not _make_symbol(self.lexer,operator).terminal()
+               ):
+                raise GrammarError('Operator {} of {} is not a '
+                                   'terminal'.format(operator,symbol))
+            productions.append((tail,"{} {} {}".format(operator,operand,tail),
+                                _Operator(precedence,associativity == 'right',
+                                          action)))
+        productions.append((tail,"",None))
+        if self.finalized:
+            self.update(add=productions)
+        else:
+            for production in productions:
+                self.addproduction(*production)
+
+    def addlist(self,symbol,item,reducer,separator=None):
+        """Add the nonterminal `symbol` as a list of one or more of the
+        terminal `item` (separated by the terminal `separator`, if given),
+        whose value is worked out all at once by `reducer`.
+
+        `item` and `separator` are token names or quoted characters, as in
+        the rule of ``addproduction``. `reducer` is called with the list of
+        the matched texts of all the items, and its result is the value of
+        `symbol` - so that a list of a million numbers costs one call of,
+        say, ``lambda texts: numpy.array(texts, dtype=float)`` rather than
+        a million calls of an action per item. (Lists that may be empty are
+        simply optional: ``"'[' L? ']'"``.)
+
+        For its FIRST and FOLLOW sets, and anything else that works with the
+        productions, the list is the pair of productions ``symbol -> item
+        symbol_ITEMS`` and ``symbol_ITEMS -> separator item symbol_ITEMS |
+        <empty>``. ``parse`` reads the whole list in one loop, collecting the
+        texts with no other calls per item than those of the lexer.
+
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> p = LLParser(l)
+        >>> p.ap('S', "'[' L? ']'", lambda x: x[1] or [], start_production=True)
+        >>> p.addlist('L', "NUM", lambda texts: [int(t) for t in texts], "','")
+        >>> p.parse("[1, 2, 3]")
+        [1, 2, 3]
+        >>> p.parsetree("[4]").fold()
+        [4]
+        """
+        tail = symbol + '_ITEMS'
+        for name in (symbol,tail):
+            if self.productions.get(Symbol(name)):
+                raise GrammarError('Symbol {} is already defined'.format(name))
+        for part in (item,separator):
+            if part is not None and (len(part.split()) != 1 or
+                                     not _make_symbol(self.lexer,part).terminal()):
+                raise GrammarError('{} of the list {} is not a '
+                                   'terminal'.format(part,symbol))
+        more = item if separator is None else separator + ' ' + item
+        productions = [(symbol,"{} {}".format(item,tail),_Bulk(reducer)),
+                       (tail,"{} {}".format(more,tail),_bulk_link),
+                       (tail,"",None)]
+        if self.finalized:
+            self.update(add=productions)
+        else:
+            for production in productions:
+                self.addproduction(*production)
+
+    def removeproduction(self,symbol,rule):
+        """Remove the production of `symbol` with the rule `rule` (given just
+        as to ``addproduction``.) Raises ``GrammarError`` if there is no
+        such production, or if it is the start production.
+        """
+        if self.finalized:
+            self.update(remove=[(symbol,rule)])
+            return
+        symbol, rule = self._symbolize(symbol,self._plain(symbol,rule))
+        self._remove(self.productions,symbol,rule)
+
+    def _defined(self,name):
+        "Whether `name` is a symbol of the grammar or a token of the lexer."
+        return Symbol(name) in self.productions or name in self.lexer.tokens
+
+    def _plain(self,symbol,rule):
+        """The plain rule that ``_expand`` makes of `rule`, to remove the
+        production of `symbol` that was added with it."""
+        return _expand(symbol,rule,None,dict(self.helpers),self._defined)[0][1]
+
+    def _symbolize(self,symbol,rule):
+        "Return the ``Symbol`` and ``SymbolString`` of a production."
+        symbol = Symbol(symbol)
+
+        if symbol.name in self.lexer.tokens:
+            raise GrammarError('Symbol conflicts with Token name: {}'.format(
+                               symbol.name))
+
+        # Symbolize the rule
+        rule_symbols=SymbolString([_make_symbol(self.lexer,x)
+                                  for x in rule.split()])
+
+        # Handle epsilon-productions:
+        if len(rule_symbols) == 0:
+            rule_symbols = SymbolString((EPSILON,))
+        return symbol, rule_symbols
+
+    def _remove(self,productions,symbol,rule):
+        """Remove `rule` from the productions of `symbol` in `productions`
+        (replacing the list, rather than changing it) and return its index.
+        """
+        if self.start is not None and (symbol,rule+EOF) == self.start[:2]:
+            raise GrammarError("Can't remove the start production.")
+        rules = productions.get(symbol,())
+        for index, (other,action) in enumerate(rules):
+            if other == rule:
+                productions[symbol] = rules[:index] + rules[index+1:]
+                return index
+        raise GrammarError('There is no production {} -> {}'.format(
+                           symbol,rule))
+
+    def update(self,add=(),remove=()):
+        """Change the grammar of a finalized parser: remove each production
+        ``(symbol, rule)`` of `remove`, and add each ``(symbol, rule, action)``
+        of `add` (with the same arguments as ``addproduction``, which calls
+        this after ``finalize``, as does ``removeproduction``.)
+
+        Rather than finalizing from scratch, only the FIRST and FOLLOW sets
+        that the change can affect are computed again - starting from the
+        changed symbols, and following the grammar to the symbols that
+        depend on them - and only the parse table rows of those symbols are
+        rebuilt and checked for conflicts. If the new grammar has a problem,
+        ``GrammarError`` is raised and the parser is left as it was. (The
+        LL(k) lookahead sets and the adaptive prediction cache are global,
+        and simply recomputed when there are any.)
+
+        Edits must not happen while other threads are parsing. Trees from
+        before the edit can still be folded, and passing one to ``reparse``
+        simply parses its input again from scratch.
+        """
+        if not self.finalized:
+            for symbol, rule in remove:
+                self.removeproduction(symbol,rule)
+            for symbol, rule, action in add:
+                self.addproduction(symbol,rule,action)
+            return
+        with self._lock:
+            saved = (self.productions,self.terminals,self.FIRST,self.FOLLOW,
+                     self.prodids,len(self.prodlist),self.predictor,
+                     dict(self.helpers))
+            try:
+                remove = [(symbol,self._plain(symbol,rule))
+                          for symbol, rule in remove]
+                add = [production for symbol, rule, action in add
+                       for production in _expand(symbol,rule,action,
+                                                 self.helpers,self._defined)]
+                self._update(add,remove)
+            except:
+                (self.productions,self.terminals,self.FIRST,self.FOLLOW,
+                 self.prodids,length,self.predictor,self.helpers) = saved
+                del self.prodlist[length:]
+                raise
+
+    def _update(self,add,remove):
+        "The body of ``update``, called with the lock held."
+        old_first = self.FIRST
+        old_productions = self.productions
+        saved_terminals = self.terminals
+        productions = dict(self.productions)
+        prodids = dict(self.prodids)
+        terminals = set(self.terminals)
+        changed = set()
+        # Nonterminals in rules that were added or removed
+        mentioned = set()
+
+        for symbol, rule in remove:
+            symbol, rule = self._symbolize(symbol,rule)
+            index = self._remove(productions,symbol,rule)
+            prodids[symbol] = prodids[symbol][:index] + prodids[symbol][index+1:]
+            changed.add(symbol)
+            mentioned |= {s for s in rule if not s.terminal()}
+        for symbol, rule, action in add:
+            symbol, rule = self._symbolize(symbol,rule)
+            productions[symbol] = productions.get(symbol,[]) + [(rule,action)]
+            prodids[symbol] = prodids.get(symbol,[]) + [len(self.prodlist)]
+            self.prodlist.append((symbol,rule,action))
+            changed.add(symbol)
+            for implicit in rule:
+                if implicit.terminal():
+                    terminals.add(implicit)
+                else:
+                    mentioned.add(implicit)
+                    if implicit not in productions:
+                        productions[implicit] = []
+                        prodids[implicit] = []
+
+        uses = _uses(productions)
+        # Symbols that lost their last production and are no longer used go
+        for symbol in changed | mentioned:
+            if ( not productions[symbol] and not uses.get(symbol) and
+                 symbol != self.start[0]
+               ):
+                del productions[symbol]
+                del prodids[symbol]
+        changed = {symbol for symbol in changed if symbol in productions}
+        mentioned = {symbol for symbol in mentioned if symbol in productions}
+        for symbol in changed | mentioned:
+            if len(productions[symbol]) == 0:
+                raise GrammarError('Symbol {} has no productions'.format(
+                                   symbol.name))
+
+        def was_nullable(symbol):
+            if symbol not in old_productions:
+                return True
+            return EPSILON in self._first(SymbolString((symbol,)),old_first)
+
+        # The symbols whose FIRST may change: the changed symbols, and those
+        # with a rule that starts with one of them after nullable symbols.
+        first_changes = set()
+        todo = list(changed | (mentioned - set(old_productions)))
+        while todo:
+            symbol = todo.pop()
+            if symbol in first_changes:
+                continue
+            first_changes.add(symbol)
+            for user, rule in uses.get(symbol,()):
+                if user in first_changes:
+                    continue
+                for item in rule:
+                    if item.terminal() and item != EPSILON:
+                        break
+                    if item in first_changes:
+                        todo.append(user)
+                        break
+                    if not item.terminal() and not was_nullable(item):
+                        break
+
+        self.productions = productions
+        self.prodids = prodids
+        self.terminals = terminals
+        self.FIRST = {key: value for key, value in old_first.items()
+                      if len(key) == 1 and key[0] not in first_changes and
+                      (key[0].terminal() or key[0] in productions)}
+        first = {symbol: set() for symbol in first_changes}
+        def first_of(rule):
+            result = set()
+            for item in rule:
+                if item.terminal():
+                    found = {item}
+                elif item in first:
+                    found = first[item]
+                else:
+                    found = self._first(SymbolString((item,)),self.FIRST)
+                result |= found - {EPSILON}
+                if EPSILON not in found:
+                    return result
+            return result | {EPSILON}
+        # Worklist propagation: each symbol is visited again only when the
+        # FIRST set of one of its left corners grows.
+        dependents = {symbol: set() for symbol in first_changes}
+        for symbol in first_changes:
+            for rule,action in productions[symbol]:
+                for item in rule:
+                    if item.terminal() and item != EPSILON:
+                        break
+                    if item in first_changes:
+                        dependents[item].add(symbol)
+                    elif not item.terminal() and not was_nullable(item):
+                        break
+        todo = list(first_changes)
+        while todo:
+            symbol = todo.pop()
+            new = set()
+            for rule,action in productions[symbol]:
+                new |= first_of(rule)
+            if not new <= first[symbol]:
+                first[symbol] |= new
+                todo.extend(dependents[symbol])
+        for symbol, result in first.items():
+            self.FIRST[SymbolString((symbol,))] = result
+
+        def nullable(symbol):
+            return ( EPSILON in self._first(SymbolString((symbol,)),self.FIRST)
+                     or was_nullable(symbol) )
+
+        # The symbols whose FOLLOW may change: those in changed rules, those
+        # before (nullable symbols before) a symbol whose FIRST changed, and
+        # those at the (nullable) end of a rule of any of these.
+        follow_changes = set()
+        todo = list(mentioned | (set(productions) - set(old_productions)))
+        for symbol in first_changes:
+            for user, rule in uses.get(symbol,()):
+                items = list(rule)
+                for index, item in enumerate(items):
+                    if item != symbol:
+                        continue
+                    for before in reversed(items[:index]):
+                        if before.terminal():
+                            break
+                        todo.append(before)
+                        if not nullable(before):
+                            break
+        while todo:
+            symbol = todo.pop()
+            if symbol in follow_changes:
+                continue
+            follow_changes.add(symbol)
+            for rule,action in productions[symbol]:
+                for item in reversed(list(rule)):
+                    if item.terminal():
+                        if item == EPSILON:
+                            continue
+                        break
+                    todo.append(item)
+                    if not nullable(item):
+                        break
+
+        self.FOLLOW = {symbol: follow for symbol, follow
+                       in self.FOLLOW.items() if symbol in productions}
+        for symbol in follow_changes:
+            self.FOLLOW[symbol] = set()
+        self.FOLLOW[self.start[0]] |= {EOF}
+        # Seed each FOLLOW set with what it gets from the FIRST sets and the
+        # FOLLOW sets that don't change, then propagate along the worklist.
+        dependents = {symbol: set() for symbol in follow_changes}
+        for symbol in follow_changes:
+            follow_set = self.FOLLOW[symbol]
+            for user, rule in uses.get(symbol,()):
+                items = list(rule)
+                for index, item in enumerate(items):
+                    if item != symbol:
+                        continue
+                    first_set = first_of(items[index+1:])
+                    _update_follow(follow_set,first_set)
+                    if EPSILON in first_set:
+                        if user in follow_changes:
+                            dependents[user].add(symbol)
+                        else:
+                            _update_follow(follow_set,self.FOLLOW[user])
+        todo = list(follow_changes)
+        while todo:
+            symbol = todo.pop()
+            for dependent in dependents[symbol]:
+                if _update_follow(self.FOLLOW[dependent],self.FOLLOW[symbol]):
+                    todo.append(dependent)
+
+        # Check the grammar, and prepare the new parse table rows
+        rows = first_changes | follow_changes | changed
+        if self.adaptive:
+            recursive = _left_recursion(productions)
+            if recursive is not None:
+                raise GrammarError('Grammar is left-recursive for symbol '
+                                   '{}'.format(recursive.name))
+            self.predictor = _AdaptivePredictor(self)
+        elif not self.lazy:
+            conflicts = {symbol for symbol in rows if self._conflicts(symbol)}
+            if self.predictor is not None:
+                conflicts |= set(self.predictor.tables) - rows
+            if conflicts:
+                self.predictor = _LookaheadPredictor(self,conflicts)
+            else:
+                self.predictor = None
+        elif self.k > 1:
+            self.predictor = _LookaheadPredictor(self,set(
+                             self.predictor.tables) - rows)
+        if not self.lazy:
+            new_rows = {symbol: self._table_row(symbol,self.FIRST)
+                        for symbol in rows}
+
+        # Nothing can go wrong from here on - update the tables.
+        for symbol in set(old_productions) - set(productions):
+            self.ptable.pop(symbol,None)
+            del self.plan_table[symbol]
+        for terminal in terminals - saved_terminals:
+            for row in self.ptable.values():
+                row[terminal] = ()
+        if self.lazy:
+            for symbol in rows:
+                self.ptable.pop(symbol,None)
+        else:
+            self.ptable.update(new_rows)
+
+        while len(self.plans) < len(self.prodlist):
+            symbol, rule, action = self.prodlist[len(self.plans)]
+            self.plans.append(_Plan(len(self.plans),action))
+        for symbol in productions:
+            if symbol not in self.plan_table:
+                self.plan_table[symbol] = _Row(self,symbol)
+        for symbol in rows:
+            plan_row = self.plan_table[symbol]
+            plan_row.clear()
+            plan_row.built = False
+            if not self.lazy:
+                self._fill_row(symbol)
+
+        # Steps of new productions, and (for their candidate tokens) of the
+        # productions that use a changed symbol
+        recompile = set(range(len(self.plans) - len(add),len(self.plans)))
+        if self.context_lexing:
+            for symbol in rows:
+                for user, rule in uses.get(symbol,()):
+                    recompile |= {prod for prod in prodids[user]
+                                  if self.prodlist[prod][1] == rule}
+        candidates = {}
+        for prod in recompile:
+            self._compile_steps(self.plans[prod],candidates)
+        self.version += 1
 
-    def finalize(self):
+
+    def finalize(self,tables=None):
         """This function actually performs the 'parser generation' that gives
         ``pcc`` its name (compiler compiling). Callable only once, it constructs
         the FIRST and FOLLOW sets, the parsing table, the action table, etc.
         
         In general terms, it prepares the parser to be able to call 'parse'.
+
+        `tables`, if given, are the ``tables()`` of a parser with the same
+        grammar and options (from an earlier run of the program, say), which
+        are used instead of working the tables out again. ``ValueError`` is
+        raised if they belong to some other grammar.
+
+        Once finalized, the parser's tables are never modified again (apart
+        from the lookahead DFA cache of an adaptive parser, which only ever
+        grows with equivalent states, and the rows of a lazy parser, which
+        are each built once under the lock), so one parser can be shared by any
+        number of threads. ``parse`` and the other methods that need a
+        finalized parser call this automatically, and only the first of
+        several concurrent callers does the work.
         """
-        # TODO - after this is called, the object should also be serializible.
-        #        In the future, a finalized parser should support being written
-        #        to (and read from) disk.
+        with self._lock:
+            if self.finalized:
+                raise ValueError('Attempt to finalize an already finalized '
+                                 'parser.')
+            if tables is None:
+                self._finalize()
+            else:
+                self._load(tables)
 
-        if self.finalized:
-            raise ValueError('Attempt to finalize an already finalized parser.')
+    def tables(self):
+        """Return the tables that ``finalize`` works out, as plain data
+        (a dict of lists of numbers and strings) that can be pickled,
+        marshalled or written as JSON, and given to the ``finalize`` of a
+        parser built with the same grammar and options to save it the work.
+        Symbols are numbered in the list ``tables()['symbols']``, and
+        productions as in ``prodlist``.
+
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> def grammar():
+        ...     p = LLParser(l)
+        ...     p.ap('S', "NUM S", lambda x: [int(x[0])] + x[1],
+        ...          start_production=True)
+        ...     p.ap('S', "", lambda x: [])
+        ...     return p
+        >>> tables = grammar().tables()
+        >>> p = grammar()
+        >>> p.finalize(tables)
+        >>> p.parse("1 2 3")
+        [1, 2, 3]
+        """
+        if not self.finalized:
+            self._finalize_once()
+        with self._lock:
+            keys = self._symbol_keys()
+            index = _numbering(keys)
+            if self.lazy:
+                table = None
+            else:
+                table = [[index(symbol),
+                          [[index(token),[prod for _,_,prod in entries]]
+                           for token, entries in row.items() if entries]]
+                         for symbol, row in self.ptable.items()]
+            if self.lazy or self.adaptive or self.predictor is None:
+                conflicts = []
+            else:
+                conflicts = sorted(index(symbol) for symbol
+                                   in self.predictor.tables)
+            return {'format': 1,
+                    'options': list(self._options()),
+                    'symbols': [list(key) if isinstance(key,tuple) else key
+                                for key in keys],
+                    'productions': self._numbered_productions(index),
+                    'first': [[[index(s) for s in string],
+                               sorted(index(s) for s in first)]
+                              for string, first in self.FIRST.items()],
+                    'follow': [[index(symbol),
+                                sorted(index(s) for s in follow)]
+                               for symbol, follow in self.FOLLOW.items()],
+                    'table': table,
+                    'conflicts': conflicts}
+
+    def _options(self):
+        "The options that the tables of ``tables()`` depend on."
+        return (self.adaptive,self.k,self.lazy,self.context_lexing)
+
+    def _symbol_keys(self):
+        """Every symbol of the grammar, by its key in ``tables()``: the name
+        of a nonterminal, or the name and pattern of a terminal."""
+        keys = {}
+        for symbol in itertools.chain(sorted(self.terminals,key=repr),
+                                      (EPSILON,),self.productions):
+            keys[_key(symbol)] = symbol
+        return keys
+
+    def _numbered_productions(self,index):
+        "``prodlist`` in terms of the symbol numbers of `index`."
+        return [[index(symbol),[index(s) for s in rule]]
+                for symbol, rule, action in self.prodlist]
+
+    def _load(self,tables):
+        "The body of ``finalize(tables)``, called with the lock held."
+        if self.start is None:
+            raise GrammarError('At least one production must be marked as the '
+                               'start production.')
+        if (tables.get('format') != 1 or
+            tuple(tables['options']) != self._options()):
+            raise ValueError('The tables are not for this kind of parser')
+        keys = self._symbol_keys()
+        try:
+            symbols = [keys[key if isinstance(key,str) else tuple(key)]
+                       for key in tables['symbols']]
+        except KeyError:
+            raise ValueError('The tables are not for this grammar') from None
+        index = _numbering(dict(zip(map(_key,symbols),symbols)))
+        self._number_productions()
+        try:
+            fits = (self._numbered_productions(index) ==
+                    [[s,list(r)] for s, r in tables['productions']])
+        except KeyError: # A symbol that the tables don't have
+            fits = False
+        if not fits:
+            raise ValueError('The tables are not for this grammar')
+
+        self.FIRST = {SymbolString([symbols[s] for s in string]):
+                      {symbols[s] for s in first}
+                      for string, first in tables['first']}
+        self.FOLLOW = {symbols[symbol]: {symbols[s] for s in follow}
+                       for symbol, follow in tables['follow']}
+        if self.lazy:
+            self.ptable = _LazyTable(self)
+        else:
+            self.ptable = {}
+            for symbol, cells in tables['table']:
+                row = self._new_row()
+                for token, prods in cells:
+                    row[symbols[token]] = [self.prodlist[prod][1:] + (prod,)
+                                           for prod in prods]
+                self.ptable[symbols[symbol]] = row
+        self.predictor = self._new_predictor(
+            [symbols[symbol] for symbol in tables['conflicts']])
+        self._compile_plans()
         self.finalized = True
 
-        if self.first is None:
+    def _finalize_once(self):
+        "Finalize the parser, unless another thread has just done so."
+        with self._lock:
+            if not self.finalized:
+                self._finalize()
+
+    def _finalize(self):
+        "The body of ``finalize()``, called with the lock held."
+        if self.start is None:
             raise GrammarError('At least one production must be marked as the '
                                'start production.')
 
@@ -101,10 +785,6 @@ class LLParser(Parser):
         self.FIRST = {}
         self.FOLLOW = {symbol: set() for symbol in self.productions}
 
-        # Initialize the parsing table
-        self.ptable = {symbol: {terminal: [] for terminal in self.terminals}
-                       for symbol in self.productions}
-
         # Calculate the FOLLOW sets using the dynamic definition of FIRST sets
         # (Note that this MUST happen before we call self.follow, so it MUST
         #  happen before the grammar error detection routine)
@@ -126,7 +806,8 @@ class LLParser(Parser):
                         follow_set = self.FOLLOW[rule_symbol]
                         if index < len(rule)-1:
                             # "if there is more in this string
-                            first_set = self.first(rule[index+1:])
+                            first_set = self._first(rule[index+1:],
+                                                    self.FIRST)
                             added_something_flag |= _update_follow(
                                 follow_set,first_set)
                             if EPSILON in first_set:
@@ -145,30 +826,226 @@ class LLParser(Parser):
             if len(rules) == 0:
                 raise GrammarError('Symbol {} has no productions'.format(
                                    symbol.name))
-            # LL(1) grammar rule dection
-            elif len(rules) > 1:
-                for (r1,_),(r2,_) in itertools.combinations(rules,2):
-                    if (
-                         not self.first(r1).isdisjoint(self.first(r2)) or
-
-                         (EPSILON in self.first(r1) and not 
-                            self.first(r2).isdisjoint(self.follow(symbol))) or
-
-                         (EPSILON in self.first(r2) and not
-                            self.first(r1).isdisjoint(self.follow(symbol)))
-                       ):
-                        raise GrammarError("Grammar is not LL(1) - ambiguous "
-                                           "derivation for symbol {}".format(
-                                           symbol.name))
-
-        # construct the parsing table
+
+        if self.adaptive:
+            recursive = _left_recursion(self.productions)
+            if recursive is not None:
+                raise GrammarError('Grammar is left-recursive for symbol '
+                                   '{}'.format(recursive.name))
+
+        self._number_productions()
+
+        if self.lazy:
+            # Rows are built by _table_row the first time they are needed.
+            self.ptable = _LazyTable(self)
+            conflicts = ()
+        else:
+            # LL(1) grammar rule dection, and the parsing table
+            conflicts = [symbol for symbol in self.productions
+                         if self._conflicts(symbol)]
+            self.ptable = {symbol: self._table_row(symbol,self.FIRST)
+                           for symbol in self.productions}
+        self.predictor = self._new_predictor(conflicts)
+
+        self._compile_plans()
+
+        # Only now is it safe for other threads to use the tables.
+        self.finalized = True
+
+    def _number_productions(self):
+        """Number the productions. Parse table entries are ``(rule, action,
+        id)`` and ``self.prodlist[id]`` is ``(symbol, rule, action)``."""
+        self.prodlist = []
+        self.prodids = {}
         for symbol, rules in self.productions.items():
+            self.prodids[symbol] = []
             for rule,action in rules:
-                for term in self.first(rule): # either rule or symbol (GULP)
-                    self.ptable[symbol][term].append((rule,action))
-                if EPSILON in self.first(rule):
-                    for term in self.follow(symbol):
-                        self.ptable[symbol][term].append((rule,action))
+                self.prodids[symbol].append(len(self.prodlist))
+                self.prodlist.append((symbol,rule,action))
+        # The start production, with EOF, is a production of its own.
+        self.start_id = len(self.prodlist)
+        self.prodlist.append(self.start)
+
+    def _new_predictor(self,conflicts):
+        """The predictor for the decisions that one token can't settle: those
+        of the symbols `conflicts`, and of a lazy parser any that turn up."""
+        if self.adaptive:
+            return _AdaptivePredictor(self)
+        elif conflicts or (self.lazy and self.k > 1):
+            return _LookaheadPredictor(self,conflicts)
+        return None
+
+    def _conflicts(self,symbol):
+        """Check that the productions of `symbol` can be told apart by one
+        token of lookahead. If not, return True if a fixed `k` may still do,
+        and otherwise raise ``GrammarError``. Adaptive parsers accept any
+        conflict.
+        """
+        rules = self.productions[symbol]
+        if len(rules) < 2 or self.adaptive:
+            return False
+        follow = self.FOLLOW[symbol]
+        cache = {}
+        for (r1,_),(r2,_) in itertools.combinations(rules,2):
+            first1 = self._first(r1,cache)
+            first2 = self._first(r2,cache)
+            if (
+                 not first1.isdisjoint(first2) or
+
+                 (EPSILON in first1 and not
+                    first2.isdisjoint(follow)) or
+
+                 (EPSILON in first2 and not
+                    first1.isdisjoint(follow))
+               ):
+                if self.k > 1:
+                    # Settled (or not) by _LookaheadPredictor
+                    return True
+                raise GrammarError("Grammar is not LL(1) - ambiguous "
+                                   "derivation for symbol {}".format(
+                                   symbol.name))
+        return False
+
+    def _table_row(self,symbol,cache):
+        """Construct the row of the parsing table for `symbol`, using (and
+        adding to) `cache` for FIRST sets. Cells are lists of ``(rule, action,
+        prod)`` triples, and empty cells are empty tuples.
+        """
+        row = self._new_row()
+        prods = list(self.prodids[symbol])
+        if symbol == self.start[0]:
+            prods.append(self.start_id)
+        for prod in prods:
+            symbol, rule, action = self.prodlist[prod]
+            entry = (rule,action,prod)
+            first = self._first(rule,cache)
+            if EPSILON in first:
+                first = first | self.FOLLOW[symbol]
+            for term in first: # either rule or symbol (GULP)
+                if row[term]:
+                    row[term].append(entry)
+                else:
+                    row[term] = [entry]
+        return row
+
+    def _new_row(self):
+        "A parse table row with every cell empty."
+        if (self._blank_row is None or
+            len(self._blank_row) != len(self.terminals)):
+            self._blank_row = dict.fromkeys(self.terminals,())
+        return self._blank_row.copy()
+
+    def _lazy_row(self,symbol):
+        """The ``_LazyTable`` row of `symbol`, checked for conflicts.
+        Called with the lock held."""
+        if symbol not in self.productions:
+            raise KeyError(symbol)
+        if self._conflicts(symbol):
+            self.predictor.add(symbol)
+        return self._table_row(symbol,{})
+
+    def _compile_plans(self):
+        """Compile a ``_Plan`` for every production, for use by ``parse``.
+
+        ``self.plans[id]`` is the plan of production ``id``, and
+        ``self.plan_table`` is the parse table restated in terms of plans:
+        ``self.plan_table[symbol][token]`` is the plan to follow (or a
+        ``_Choice`` between plans, when there is a predictor), and empty
+        cells are left out altogether. The rows of a lazy parser are only
+        filled in (by ``_fill_row``) when first used.
+        """
+        self.plans = [_Plan(prod,action) for prod, (symbol,rule,action)
+                      in enumerate(self.prodlist)]
+        self.plan_table = {symbol: _Row(self,symbol)
+                           for symbol in self.productions}
+        if not self.lazy:
+            for symbol in self.productions:
+                self._fill_row(symbol)
+
+        # The steps refer to the rows, so they can only be filled in now.
+        candidates = {}
+        for plan in self.plans:
+            self._compile_steps(plan,candidates)
+
+    def _compile_steps(self,plan,candidates):
+        """Fill in the steps of `plan`. `candidates` caches the candidate
+        tokens of nonterminals between calls."""
+        symbol, rule, action = self.prodlist[plan.prod]
+        if rule == SymbolString((EPSILON,)):
+            return
+        plan.arity = len(rule)
+        if rule[0] == EPSILON:
+            # The start production of an empty rule, (EPSILON, EOF): EPSILON
+            # consumes nothing, so it gets no step, only its None value.
+            rule = SymbolString(rule[1:])
+            if plan.call:
+                plan.action = _Placeholder(plan.action)
+        steps = []
+        for s in rule:
+            if s.terminal():
+                steps.append((None,s,self._candidates((s,))))
+                continue
+            if s not in candidates and not self.context_lexing:
+                candidates[s] = None
+            elif s not in candidates:
+                # The tokens with an entry in the row of s
+                first = self._first(SymbolString((s,)),{})
+                if EPSILON in first:
+                    first = first | self.FOLLOW[s]
+                candidates[s] = self._candidates(first)
+            steps.append((self.plan_table[s],s,candidates[s]))
+        plan.steps = tuple(steps)
+
+    def _fill_row(self,symbol):
+        "Fill in ``self.plan_table[symbol]`` from ``self.ptable[symbol]``."
+        plan_row = self.plan_table[symbol]
+        with self._lock:
+            if plan_row.built:
+                return
+            for token, entries in self.ptable[symbol].items():
+                if not entries:
+                    continue
+                if not self.adaptive:
+                    # The start production is only ever used at the top.
+                    entries = [e for e in entries if e[2] != self.start_id]
+                if len(entries) > 1 and self.predictor is not None:
+                    plan_row[token] = _Choice(symbol,{prod: self.plans[prod]
+                                              for _,_,prod in entries})
+                elif entries:
+                    # Without a predictor, the first production wins (see
+                    # _rd_parse_plan.)
+                    plan = self.plans[entries[0][2]]
+                    if plan.action.__class__ is _Expression:
+                        plan = _Operators(plan)
+                    elif plan.action.__class__ is _Bulk:
+                        plan = _BulkList(plan)
+                    elif plan.action is _link:
+                        # A repetition, unless it is the first item of a
+                        # X_PLUS -> item X_STAR
+                        rule = self.prodlist[plan.prod][1]
+                        if rule[len(rule) - 1] == symbol:
+                            plan = _Loop(plan)
+                    plan_row[token] = plan
+            plan_row.built = True
+
+    def _candidates(self,terminals):
+        """The tokens a context-lexing parser tries when it expects one of
+        `terminals`, or None if `context_lexing` is off.
+
+        The silent tokens of the lexer are always included, and ties between
+        matches of the same length are broken in the lexer's own order, with
+        literals last.
+        """
+        if not self.context_lexing:
+            return None
+        order = {token: index for index, token
+                 in enumerate(self.lexer.tokens.values())}
+        tokens = {t for t in terminals if t != EOF and t != EPSILON}
+        tokens |= {t for t in self.lexer.tokens.values() if t.silent}
+        if self.lexer.report_literals:
+            tokens.discard(self.lexer.tokens.get('LITERAL'))
+        return tuple(sorted(tokens,key=lambda t: (order.get(t,len(order)),
+                                                   t.rule.pattern)))
 
 
     def first(self,symbols):
@@ -182,11 +1059,21 @@ class LLParser(Parser):
         """
         # First, finalize (end rule-adding phase)
         if not self.finalized:
-            self.finalize()
+            self._finalize_once()
 
+        # Strings that were not needed to finalize the parser are computed
+        # in a scratch cache, to keep the shared tables unmodified.
+        return self._first(symbols,{})
+
+    def _first(self,symbols,cache):
+        """The definition of ``first()``. Results are looked up in self.FIRST
+        and `cache`, and new results are added to `cache`.
+        """
         # Dynamic return to cut down execution time
         if symbols in self.FIRST:
             return self.FIRST[symbols]
+        if symbols in cache:
+            return cache[symbols]
 
         # Actual definition:
 
@@ -195,7 +1082,7 @@ class LLParser(Parser):
             if symbol.terminal():
                 # Terminal singletons are their own FIRST set
                 result = { symbol }
-                self.FIRST[symbols] = result
+                cache[symbols] = result
                 return result
             else: 
                 # Non-terminal singletons use the FIRST of every rule they
@@ -203,23 +1090,23 @@ class LLParser(Parser):
                 rules = self.productions[symbol]
                 result = set()
                 for rule,action in rules:
-                    result |= self._first_string(rule)
+                    result |= self._first_string(rule,cache)
                 if SymbolString((EPSILON,)) in rules:
                     result |= {EPSILON}
-                self.FIRST[symbols] = result
+                cache[symbols] = result
                 return result
         else:
             # String of symbols (non-singleton)
-            result = self._first_string(symbols)
-            self.FIRST[symbols] = result
+            result = self._first_string(symbols,cache)
+            cache[symbols] = result
             return result
 
-    def _first_string(self,symbols):
+    def _first_string(self,symbols,cache):
         "Helper func of ``first()`` on a SymbolString"
         result = set()
         flag_epsilon = True
         for symbol in symbols:
-            new_set = self.first(SymbolString((symbol,)))
+            new_set = self._first(SymbolString((symbol,)),cache)
             result |= (new_set - {EPSILON} )
             if not EPSILON in new_set:
                 flag_epsilon = False
@@ -235,104 +1122,1704 @@ class LLParser(Parser):
         FOLLOW sets in this implementation, this function merely returns the
         pre-computed set - the actual set computation occurs in finalize()
         """
-        if not self.finalized: 
-            self.finalize()
+        if not self.finalized:
+            self._finalize_once()
 
         if symbol.terminal():
             raise ValueError('Attempt to compute FOLLOW of a terminal')
         
         return self.FOLLOW[symbol]
 
-    def parse(self,input):
-        """Use the recursive descent method to parse the input."""
+    def parse(self,input,profile=None,cache=None,errors=None,sync=(),
+              limits=None,prefetch=0):
+        """Use the recursive descent method to parse the input.
+
+        `profile`, if given, is a ``pcc.profiler.ParseProfile`` in which to
+        record statistics about the parse (which makes it slower.) Without
+        one, the parser does no bookkeeping at all.
+
+        `cache`, if given, is a ``pcc.cache.ResultCache`` holding the lexemes
+        (and if it says so, the results) of inputs parsed before. It is not
+        used when profiling, and only for results with `context_lexing`.
+
+        `errors`, if given, is a list to which syntax errors are appended
+        (as ``ParsingError`` objects with their ``line``, ``position`` and
+        ``offset``) instead of being raised: the parser recovers from each
+        one and goes on, so that one pass finds them all, and returns what
+        it could make of the input. This is 'panic mode' recovery. A missing
+        terminal is taken to be there (with a value of None), unless it
+        follows a token that doesn't belong, which is skipped. Where no
+        production of a nonterminal fits the next token, tokens are skipped
+        until one does, or until a token that may follow the nonterminal
+        (see ``follow``) or one of the synchronizing terminals `sync` (names
+        or quoted characters, such as ``"';'"``) - at which point the
+        nonterminal is given up, with a value of None. No further errors are
+        reported until a token has been matched again. Actions that fail on
+        such values, once an error has been reported, give None too (other
+        failures are raised as usual.) Lexing errors are still raised, and
+        `errors` can't be used together with `profile` or `cache`.
+
+        `limits`, if given, are the ``pcc.limits.Limits`` of the time, tokens,
+        steps, nesting and memory that the parse may take: it raises
+        ``pcc.limits.LimitExceeded`` as soon as it goes over one. They can't
+        be used together with `cache`.
+
+        `prefetch`, if positive, has the input lexed by a thread of its own,
+        ahead of the parser, which takes the lexemes from a queue in batches
+        of `prefetch` (and at most four batches ahead). That only pays off
+        where lexing and parsing really run at the same time - on a
+        free-threaded build of Python, with plenty of lexing to do - and
+        otherwise only adds the cost of the handover (see
+        ``benchmarks/prefetch.py``). It can't be used together with `cache`,
+        or with `context_lexing`, where the parser tells the lexer what to
+        look for.
+
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> p = LLParser(l)
+        >>> p.ap('S', "(NUM '+' NUM ';')*", lambda x: x[0],
+        ...      start_production=True)
+        >>> errors = []
+        >>> p.parse("1 + 2; 3 4; 5 + + 6; 7 + 8;", errors=errors, sync=["';'"])
+        [['1', '+', '2', ';'], ['3', None, '4', ';'], ['5', '+', '6', ';'], ['7', '+', '8', ';']]
+        >>> for error in errors:
+        ...     print(error)
+        Expected LITERAL but found 4 on line 1 at position 10
+        Expected NUM but found + on line 1 at position 17
+        """
+        if not self.finalized:
+            self._finalize_once()
+        stop = budget = None
+        if errors is not None:
+            if profile is not None or cache is not None:
+                raise ValueError("Can't recover from errors while profiling "
+                                 "or caching")
+            stop = set()
+            for name in sync:
+                token = _make_symbol(self.lexer,name)
+                if not token.terminal():
+                    raise ValueError('{} is not a terminal'.format(name))
+                stop.add(token)
+        if limits is not None:
+            if cache is not None:
+                raise ValueError("Can't limit a cached parse")
+            budget = limits.start()
+        if prefetch > 0:
+            if cache is not None or self.context_lexing:
+                raise ValueError("Can't prefetch lexemes when caching or "
+                                 "lexing in context")
+            source = _PrefetchLexemeIterator(self.lexer,input,prefetch)
+            try:
+                return self._parse_from(source,profile,errors,stop,limits,
+                                        budget)
+            finally:
+                source.close()
+        if cache is not None and profile is None:
+            return cache.parse(self,input,
+                               None if self.context_lexing else
+                               self._parse_lexed)
+        if self.context_lexing:
+            lexer = _ContextLexemeIterator(self.lexer,input)
+        elif self.k > 1:
+            lexer = _RingLexemeIterator(self.lexer,input,self.k)
+        else:
+            lexer = _LexemeIterator(self.lexer,input)
+        return self._parse_from(lexer,profile,errors,stop,limits,budget)
+
+    def _parse_from(self,lexer,profile,errors,stop,limits,budget):
+        "The rest of ``parse``, from the lexeme iterator `lexer`."
+        if limits is not None:
+            lexer = _LimitedLexemeIterator(lexer,budget)
+        if profile is not None:
+            return self._profile_lexemes(lexer,profile)
+        if errors is not None:
+            predict = self.predictor.predict if self.predictor else None
+            return _rd_recover_plan(self.plans[self.start_id],lexer,predict,
+                                    _Recovery(self,errors,stop))
+        return self._parse_lexemes(lexer)
+
+    def _parse_lexed(self,lexemes):
+        "Parse the sequence of ``Lexeme`` objects `lexemes`."
+        lexemes = list(lexemes)
+        lexemes.append(Lexeme(EOF,"EOF",-1,-1))
+        return self._parse_lexemes(_ListLexemeIterator(lexemes))
+
+    def _parse_lexemes(self,lexer):
+        "Parse from `lexer`, a ``_LexemeIterator`` (or a similar object)."
+        predict = self.predictor.predict if self.predictor else None
+        return _rd_parse_plan(self.plans[self.start_id],lexer,predict)
+
+    def _profile_lexemes(self,lexer,profile):
+        "``_parse_lexemes``, recording statistics in `profile`."
+        profile.bind(self.prodlist)
+        predict = self.predictor.predict if self.predictor else None
+        start = time.perf_counter()
+        try:
+            return _rd_profile_plan(self.plans[self.start_id],
+                                    _TimedLexemeIterator(lexer,profile),
+                                    predict,profile)
+        finally:
+            profile.total_time += time.perf_counter() - start
+
+    def validate(self,input):
+        """Check that `input` is in the language of the grammar, without
+        running any semantic actions: returns None if it is, or otherwise
+        the ``ParsingError`` (not raised) for the first error, located by its
+        ``line``, ``position`` and ``offset``. Lexing errors are reported the
+        same way.
+
+        This only recognizes the input: the lexer makes no ``Lexeme`` objects
+        or match strings, and no values are collected, so it is much quicker
+        than ``parse`` and allocates next to nothing per token. Tail calls are
+        followed in a loop, so right recursion (and repetition) doesn't
+        nest either.
+
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> p = LLParser(l)
+        >>> p.ap('S', "'[' NUM (',' NUM)* ']'", None, start_production=True)
+        >>> p.validate("[1, 2, 3]") is None
+        True
+        >>> error = p.validate("[1, 2\\n 3]")
+        >>> error.line, error.position, error.offset
+        (2, 2, 7)
+        >>> print(error)
+        Unexpected input "3" on line 2 at position 2
+        """
         if not self.finalized:
-            self.finalize()
+            self._finalize_once()
+        predict = self.predictor.predict if self.predictor else None
+        try:
+            scanner = _TokenScanner(self.lexer,input,self.context_lexing)
+            _rd_validate_plan(self.plans[self.start_id],scanner,predict)
+        except ParsingError as e:
+            return e
+        return None
+
+    def parsetree(self,input):
+        """Parse the input without running any semantic actions, and return
+        a ``pcc.tree.ParseTree``. Use ``ParseTree.fold`` to run the actions
+        (or any others) over the tree afterwards.
+        """
+        if not self.finalized:
+            self._finalize_once()
         lexer = _LexemeIterator(self.lexer,input)
+        tree = ParseTree(self.prodlist)
+        tree.input = input
+        tree.version = self.version
         start_symbol, start_rule, start_action = self.start
-        return _rd_parse_rule(start_rule,start_action,lexer,self.ptable)
+        predict = self.predictor.predict if self.predictor else None
+        _rd_tree_rule(start_rule,self.start_id,lexer,self.ptable,predict,tree)
+        tree._close()
+        return tree
+
+    def reparse(self,tree,start,end,text):
+        """Return a new ``ParseTree`` for the input of `tree` (a tree made by
+        ``parsetree`` or ``reparse``) after replacing ``input[start:end]``
+        with `text`.
+
+        Only the lexemes around the edit are lexed again, and the lexemes
+        after them are shared with `tree` (their positions are moved when
+        ``lexemes`` is first read.) Then the smallest node of `tree` whose
+        lexemes, and the one token of lookahead that followed them, hold the
+        edit is parsed again, copying every subtree of it that the edit did
+        not touch, and put in place of the old one. The new tree takes over
+        the arrays of `tree`, which keeps only what it needs to undo the
+        change (see ``ParseTree``.) The work done is therefore proportional
+        to the size of the edit plus the depth of the tree at the edit,
+        rather than to the size of the input.
+
+        Adaptive parsers may look arbitrarily far ahead, so for them this
+        simply parses the new input from scratch.
+        """
+        if not self.finalized:
+            self._finalize_once()
+        if tree.productions is not self.prodlist:
+            raise ValueError('The tree was not produced by this parser.')
+        old_input = tree.input
+        if not 0 <= start <= end <= len(old_input):
+            raise ValueError('Invalid edit range {}:{}'.format(start,end))
+        new_input = old_input[:start] + text + old_input[end:]
+        if self.predictor is not None or tree.version != self.version:
+            return self.parsetree(new_input)
+
+        tree._checkout()
+        relexed, a, b, marks, moves = _relex(self.lexer,tree,new_input,
+                                             start,end,
+                                             len(text) - (end - start))
+        delta = len(relexed) - (b - a)
+        path = _edit_path(tree,a,b)
+        level = len(path) - 1
+        while level >= 0:
+            (node, node_start, node_end, first), tail, siblings = path[level]
+            lexer = _EditedLexemeIterator(tree._store.lexemes,a,b,relexed)
+            lexer.index = node_start
+            reuse = _Reuse(tree,path[level][0],a,b,delta)
+            part = ParseTree(self.prodlist)
+            try:
+                if level == 0:
+                    start_symbol, rule, start_action = self.start
+                    prod = self.start_id
+                else:
+                    rule, prod = _tree_production(tree.symbol(node),lexer,
+                                                  self.ptable,None)
+                _rd_tree_rule(rule,prod,lexer,self.ptable,None,part,reuse)
+            except ParsingError:
+                pass
+            else:
+                if lexer.index == node_end + delta:
+                    break
+            # The parents that end with this node would end in the same place
+            while level > 0 and path[level][1]:
+                level -= 1
+            level -= 1
+        else:
+            # Report the error where a full parse finds it
+            return self.parsetree(new_input)
+
+        moved = [sibling for entry in path[1:level+1] for sibling in entry[2]]
+        new_tree = tree._replace(node,first,part,moved,a,b - a,relexed)
+        new_tree._marks = marks
+        new_tree._moves = moves
+        new_tree.input = new_input
+        new_tree.version = self.version
+        return new_tree
+
+    async def aparse(self,reader,every=1024,encoding='utf-8'):
+        """Parse the input that arrives from `reader` (an
+        ``asyncio.StreamReader``, or an asynchronous iterator of chunks - see
+        ``pcc.lexer.Lexer.alex``), and return what ``parse`` would have.
+
+        The lexemes are pushed into a ``PushParser`` as they arrive, `every`
+        at a time, after which the parse gives other tasks a turn - so that
+        a large input doesn't hold up the event loop, even if all of it has
+        been received already.
+
+        >>> import asyncio
+        >>> from pcc.lexer import Lexer
+        >>> l = Lexer()
+        >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+        >>> p = LLParser(l)
+        >>> p.ap('S', "NUM*", lambda x: sum(int(n) for n in x[0]),
+        ...      start_production=True)
+        >>> async def main():
+        ...     reader = asyncio.StreamReader()
+        ...     reader.feed_data(b"1 2 3 " * 1000)
+        ...     reader.feed_eof()
+        ...     return await p.aparse(reader, every=100)
+        >>> asyncio.run(main())
+        6000
+        """
+        push = self.pushparser()
+        lexemes = []
+        async for lexeme in self.lexer.alex(reader,encoding):
+            lexemes.append(lexeme)
+            if len(lexemes) >= every:
+                push.push(lexemes)
+                lexemes = []
+                await asyncio.sleep(0)
+        push.push(lexemes)
+        return push.close()
+
+    def pushparser(self):
+        """Return a new ``PushParser`` for incrementally arriving input."""
+        if not self.finalized:
+            self._finalize_once()
+        return PushParser(self)
+
+class PushParser:
+    """Push-mode ('feed') parsing with an ``LLParser``.
+
+    Instead of handing the whole input to ``LLParser.parse``, call ``feed``
+    with each piece of input as it becomes available, and finally ``close``,
+    which returns the same value ``parse`` would have. Every ``feed`` lexes
+    and parses as far as the available input allows, so that receiving and
+    parsing overlap, and semantic actions run as soon as their production is
+    complete. ``ParsingError`` is raised from whichever call first sees the
+    error. Lexemes that were lexed already (by ``Lexer.alex``, say) can be
+    handed over with ``push`` instead.
+
+    The parser keeps an explicit stack instead of recursing, so between
+    calls it only holds the unsettled tail of the input (see
+    ``pcc.lexer.PushLexer``), the stack of partially matched productions,
+    and - in adaptive mode - the lexemes needed to make a pending decision.
+
+    >>> from pcc.lexer import Lexer
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM S", lambda x: int(x[0]) + x[1], start_production=True)
+    >>> p.ap('S', "", lambda x: 0)
+    >>> pp = p.pushparser()
+    >>> pp.feed("1 2 3")
+    >>> pp.feed("0 4")
+    >>> pp.close()
+    37
+    """
+
+    def __init__(self,parser):
+        if not parser.finalized:
+            parser._finalize_once()
+        self.lexer = PushLexer(parser.lexer)
+        self.predictor = parser.predictor
+        # Each frame is [plan, index of next step, values so far]
+        self.stack = [[parser.plans[parser.start_id],0,[]]]
+        # Lexemes not yet consumed by the parser
+        self.pending = deque()
+        self.closed = False
+        self.result = None
+
+    def feed(self,chunk):
+        """Parse as much as possible after adding `chunk` to the input."""
+        if self.closed:
+            raise ValueError('Attempt to feed a closed PushParser.')
+        self.pending.extend(self.lexer.feed(chunk))
+        self._run()
+
+    def push(self,lexemes):
+        """Parse as much as possible after adding `lexemes` (a sequence of
+        ``Lexeme`` objects from the parser's lexer, such as those of
+        ``Lexer.alex``) to the input - instead of lexing chunks with
+        ``feed``."""
+        if self.closed:
+            raise ValueError('Attempt to push to a closed PushParser.')
+        self.pending.extend(lexemes)
+        self._run()
+
+    def close(self):
+        """Finish parsing, and return the result of the start production."""
+        if self.closed:
+            raise ValueError('Attempt to close a closed PushParser.')
+        self.closed = True
+        self.pending.extend(self.lexer.close())
+        self.pending.append(Lexeme(EOF,"EOF",-1,-1))
+        self._run()
+        return self.result
+
+    def _run(self):
+        pending = self.pending
+        while pending:
+            try:
+                self._push(pending[0])
+            except _NeedInput:
+                return
+            pending.popleft()
+
+    def _push(self,lexeme):
+        """Advance the parse until `lexeme` is consumed, following the plans
+        of the productions just as ``_rd_parse_plan`` does."""
+        stack = self.stack
+        token = lexeme.token
+        while True:
+            frame = stack[-1]
+            plan, index, values = frame
+            steps = plan.steps
+
+            if index == len(steps):
+                # Production complete - perform the 'action'
+                stack.pop()
+                if plan.call:
+                    value = plan.action(values if steps else [None])
+                else:
+                    value = plan.action
+                if stack:
+                    frame = stack[-1]
+                    frame[2].append(value)
+                    frame[1] += 1
+                    continue
+                self.result = value
+                return
+
+            row, symbol, tokens = steps[index]
+            if row is None:
+                if token is not symbol and token != symbol:
+                    raise ParsingError('Expected {} but found {} on line {} '
+                        'at position {}'.format( symbol.name, lexeme.match,
+                        lexeme.line, lexeme.position))
+                values.append(lexeme.match)
+                frame[1] += 1
+                if token is EOF:
+                    # Nothing more will arrive, so finish all reductions
+                    continue
+                return
+
+            child = row.get(token)
+            if child is None:
+                child = _missing(row,token)
+            if child is None:
+                raise ParsingError('Unexpected input "{}" on line {} at '
+                    'position {}'.format(lexeme.match,lexeme.line,
+                    lexeme.position))
+            if child.__class__ is _Choice:
+                child = child.plans[self.predictor.predict(symbol,self)[2]]
+            elif child.__class__ is not _Plan:
+                # _Loop, _Operators or _BulkList: followed as the
+                # productions it stands for
+                child = child.plan
+            stack.append([child,0,[]])
+
+    def peek(self,tokens=None):
+        """The next lexeme, for the predictors."""
+        return self.lookahead(0)
+
+    def lookahead(self,k):
+        """Lookahead for the predictors, within the pending lexemes."""
+        if k < len(self.pending):
+            return self.pending[k]
+        if self.closed:
+            return Lexeme(EOF,"EOF",-1,-1)
+        raise _NeedInput()
+
+class _NeedInput(Exception):
+    "Raised inside ``PushParser`` when a decision needs more lookahead."
+    pass
         
-def _make_symbol(lexer,name):
-    """Helper function to symbolize the elements of a production's rule"""
-
-    # If it looks like a string literal, make a literal-like token
-    if len(name)==3 and name[0]=="'" and name[2]=="'":
-        # A quick reminder here that this token is NOT the same as
-        # the token called "LITERAL" that is generated automatically by the
-        # lexer when report_literals is True. This is a sort of Token Template,
-        # and if we get a Lexeme with the lexer's LITERAL token, we check to
-        # see if the matched lexeme text matche's this character.
-        return Token("LITERAL",re.escape(name[1]))
-
-    # If the name is in the lexer's token set, use that token
-    if name in lexer.tokens:
-        return lexer.tokens[name]
-
-    # Otherwise, we assume it's a Symbol. If it's not, then the Symbol
-    # regexp should catch it and barf, which is what we want.
-    return Symbol(name)
-
-def _rd_parse_rule(rule,action,lexer,parse_table):
-    """Recursive function to parse the input"""
-    input_values = []
-    for symbol in rule:
+def _rd_parse_plan(plan,lexer,predict=None):
+    """Recursive function to parse the input, following the compiled `plan`
+    of a production (see ``LLParser._compile_plans``).
+
+    `predict`, if given, is called as ``predict(symbol, lexer)`` to choose
+    between the plans of a ``_Choice``, and must return the chosen
+    ``(rule, action, id)`` parse table entry.
+    """
+    values = []
+    for row, symbol, tokens in plan.steps:
+        if row is None:
+            next = lexer.poll(tokens)
+
+            # if the wrong token is lexed:
+            token = next.token
+            if token is not symbol and token != symbol:
+                raise ParsingError('Expected {} but found {} on line {} at '
+                    'position {}'.format( symbol.name, next.match,
+                    next.line, next.position))
+
+            values.append(next.match)
+        else:
+            # non-terminal symbol - find the right derivation to follow
+            next = lexer.peek(tokens)
+            child = row.get(next.token)
+            if child is None:
+                child = _missing(row,next.token)
+            if child is None:
+                raise ParsingError('Unexpected input "{}" on line {} at '
+                    'position {}'.format(next.match,next.line,next.position))
+            if child.__class__ is _Choice:
+                # Not an LL(1) decision - look further ahead.
+                child = child.plans[predict(symbol,lexer)[2]]
+
+            if child.steps:
+                # RECURSION
+                values.append(_rd_parse_plan(child,lexer,predict))
+            elif child.__class__ is _Operators:
+                values.append(_rd_parse_operators(child.plan,lexer,predict))
+            elif child.__class__ is _Loop:
+                values.append(_rd_parse_loop(child.plan,lexer,predict))
+            elif child.__class__ is _BulkList:
+                values.append(_rd_parse_bulk(child.plan,lexer,predict))
+            elif child.call:
+                # epsilon-production: consume nothing, and don't recurse
+                values.append(child.action([None]))
+            else:
+                values.append(child.action)
+
+    # Parsing complete, now perform the 'action'
+    if plan.call:
+        return plan.action(values)
+    return plan.action
+
+def _rd_parse_step(row,symbol,tokens,lexer,predict):
+    """Parse one step ``(row, symbol, tokens)`` of a plan, exactly as
+    ``_rd_parse_plan`` does, and return its value."""
+    if row is None:
+        next = lexer.poll(tokens)
+        token = next.token
+        if token is not symbol and token != symbol:
+            raise ParsingError('Expected {} but found {} on line {} at '
+                'position {}'.format( symbol.name, next.match,
+                next.line, next.position))
+        return next.match
+    next = lexer.peek(tokens)
+    child = row.get(next.token)
+    if child is None:
+        child = _missing(row,next.token)
+    if child is None:
+        raise ParsingError('Unexpected input "{}" on line {} at '
+            'position {}'.format(next.match,next.line,next.position))
+    if child.__class__ is _Choice:
+        child = child.plans[predict(symbol,lexer)[2]]
+    if child.steps:
+        return _rd_parse_plan(child,lexer,predict)
+    elif child.__class__ is _Operators:
+        return _rd_parse_operators(child.plan,lexer,predict)
+    elif child.__class__ is _Loop:
+        return _rd_parse_loop(child.plan,lexer,predict)
+    elif child.__class__ is _BulkList:
+        return _rd_parse_bulk(child.plan,lexer,predict)
+    elif child.call:
+        return child.action([None])
+    return child.action
+
+def _rd_parse_loop(plan,lexer,predict):
+    """Parse the repetition of `plan`, the production ``X_STAR -> item
+    X_STAR`` of a rule with ``item*`` (see ``pcc.parser._expand``), in one
+    loop, and return the list of the values of the items. The row of
+    ``X_STAR`` decides whether there is another item, just as it would for
+    the production itself.
+    """
+    (row, symbol, tokens), (loop, loop_symbol, loop_tokens) = plan.steps
+    items = []
+    append = items.append
+    while True:
+        append(_rd_parse_step(row,symbol,tokens,lexer,predict))
+        next = lexer.peek(loop_tokens)
+        child = loop.get(next.token)
+        if child is None:
+            child = _missing(loop,next.token)
+        if child is None:
+            raise ParsingError('Unexpected input "{}" on line {} at '
+                'position {}'.format(next.match,next.line,next.position))
+        if child.__class__ is _Choice:
+            child = child.plans[predict(loop_symbol,lexer)[2]]
+        if child.__class__ is not _Loop and child is not plan:
+            # The empty production: no more items
+            return items
+
+def _rd_parse_bulk(plan,lexer,predict):
+    """Parse the list of `plan`, the production ``L -> item L_ITEMS`` of
+    ``LLParser.addlist``, in one loop, and return the value of its reducer
+    for the matched texts of the items. The row of ``L_ITEMS`` decides
+    whether there is another item, just as it would for the production
+    itself - but as long as the next token is the one that starts another
+    item in an LL(1) row, it is taken without looking it up.
+    """
+    (_, item, item_tokens), (tail, tail_symbol, tail_tokens) = plan.steps
+    next = lexer.poll(item_tokens)
+    token = next.token
+    if token is not item and token != item:
+        raise ParsingError('Expected {} but found {} on line {} at '
+            'position {}'.format( item.name, next.match,
+            next.line, next.position))
+    texts = [next.match]
+    append = texts.append
+    # The token that starts another item in an LL(1) row, and the
+    # terminals of the item
+    head = more = None
+    while True:
+        next = lexer.peek(tail_tokens)
+        if next.token is head:
+            steps = more
+        else:
+            child = tail.get(next.token)
+            if child is None:
+                child = _missing(tail,next.token)
+            if child is None:
+                raise ParsingError('Unexpected input "{}" on line {} at '
+                    'position {}'.format(next.match,next.line,next.position))
+            if child.__class__ is _Choice:
+                child = child.plans[predict(tail_symbol,lexer)[2]]
+            elif head is None and child.steps:
+                head, more = next.token, child.steps[:-1]
+            if not child.steps:
+                # The empty production: no more items
+                return plan.action.reducer(texts)
+            steps = child.steps[:-1]
+        for row, symbol, tokens in steps:
+            next = lexer.poll(tokens)
+            token = next.token
+            if token is not symbol and token != symbol:
+                raise ParsingError('Expected {} but found {} on line {} at '
+                    'position {}'.format( symbol.name, next.match,
+                    next.line, next.position))
+        append(next.match)
+
+def _rd_parse_operators(plan,lexer,predict):
+    """Parse the expression of `plan`, the production ``E -> operand E_OPS``
+    of ``LLParser.addexpression``, in one loop: each operand and operator is
+    read in turn (following the row of ``E_OPS``, so that the decisions are
+    those of the productions), and applied by precedence as soon as the
+    next operator shows that nothing binds more tightly. Each step is parsed
+    just as in ``_rd_parse_plan``.
+    """
+    (row, symbol, tokens), (tail, tail_symbol, tail_tokens) = plan.steps
+    operands = []
+    pending = []
+    while True:
+        # The operand - _rd_parse_step, inlined to save a frame per level of
+        # nesting
+        if row is None:
+            next = lexer.poll(tokens)
+            token = next.token
+            if token is not symbol and token != symbol:
+                raise ParsingError('Expected {} but found {} on line {} at '
+                    'position {}'.format( symbol.name, next.match,
+                    next.line, next.position))
+            operands.append(next.match)
+        else:
+            next = lexer.peek(tokens)
+            child = row.get(next.token)
+            if child is None:
+                child = _missing(row,next.token)
+            if child is None:
+                raise ParsingError('Unexpected input "{}" on line {} at '
+                    'position {}'.format(next.match,next.line,next.position))
+            if child.__class__ is _Choice:
+                child = child.plans[predict(symbol,lexer)[2]]
+            if child.steps:
+                operands.append(_rd_parse_plan(child,lexer,predict))
+            elif child.__class__ is _Operators:
+                operands.append(_rd_parse_operators(child.plan,lexer,
+                                                    predict))
+            elif child.__class__ is _Loop:
+                operands.append(_rd_parse_loop(child.plan,lexer,predict))
+            elif child.__class__ is _BulkList:
+                operands.append(_rd_parse_bulk(child.plan,lexer,predict))
+            elif child.call:
+                operands.append(child.action([None]))
+            else:
+                operands.append(child.action)
+
+        # The operator, if any
+        next = lexer.peek(tail_tokens)
+        child = tail.get(next.token)
+        if child is None:
+            child = _missing(tail,next.token)
+        if child is None:
+            raise ParsingError('Unexpected input "{}" on line {} at '
+                'position {}'.format(next.match,next.line,next.position))
+        if child.__class__ is _Choice:
+            child = child.plans[predict(tail_symbol,lexer)[2]]
+        operator = child.action
+        if operator.__class__ is not _Operator:
+            # The empty production: the expression is complete
+            break
+        (_, op_symbol, op_tokens), (row, symbol, tokens), _ = child.steps
+        next = lexer.poll(op_tokens)
+        token = next.token
+        if token is not op_symbol and token != op_symbol:
+            raise ParsingError('Expected {} but found {} on line {} at '
+                'position {}'.format( op_symbol.name, next.match,
+                next.line, next.position))
+        if pending:
+            _reduce(operands,pending,operator)
+        pending.append((operator,next.match))
+    if pending:
+        _reduce(operands,pending,None)
+    return operands[0]
+
+def _reduce(operands,pending,operator):
+    """Apply the `pending` operators (``(operator, match)`` pairs) that bind
+    more tightly than `operator` - all of them if it is None - to the last
+    `operands`, replacing those with the results."""
+    while pending:
+        top = pending[-1][0]
+        if operator is not None and (
+            top.precedence < operator.precedence or
+            (top.precedence == operator.precedence and operator.right)):
+            return
+        top, match = pending.pop()
+        right = operands.pop()
+        operands[-1] = top.apply(operands[-1],match,right)
+
+class _Operator:
+    """The action of a production ``E_OPS -> operator operand E_OPS`` of
+    ``LLParser.addexpression``. Called with the values of the rule, it
+    returns them as a link of a chain ``(operator, match, operand, rest)``
+    for the ``_Expression`` of ``E`` to work out."""
+    __slots__ = ('precedence','right','action','call')
+
+    def __init__(self,precedence,right,action):
+        self.precedence = precedence
+        self.right = right
+        self.action = action
+        self.call = hasattr(action,'__call__')
+
+    def __call__(self,values):
+        return (self,values[0],values[1],values[2])
+
+    def apply(self,left,match,right):
+        "The value of ``left operator right``."
+        if self.call:
+            return self.action([left,match,right])
+        return self.action
+
+class _Expression:
+    """The action of a production ``E -> operand E_OPS`` of
+    ``LLParser.addexpression``, which applies the chain of operators of
+    ``E_OPS`` by precedence."""
+    __slots__ = ()
+
+    def __call__(self,values):
+        operands = [values[0]]
+        pending = []
+        link = values[1]
+        while link is not None:
+            operator, match, operand, link = link
+            _reduce(operands,pending,operator)
+            pending.append((operator,match))
+            operands.append(operand)
+        _reduce(operands,pending,None)
+        return operands[0]
+
+class _Bulk:
+    """The action of a production ``L -> item L_ITEMS`` of
+    ``LLParser.addlist``, which calls the `reducer` with the texts of the
+    items (from the chain of ``_bulk_link`` values of ``L_ITEMS``, or a list
+    of them.)"""
+    __slots__ = ('reducer',)
+
+    def __init__(self,reducer):
+        self.reducer = reducer
+
+    def __call__(self,values):
+        return self.reducer([values[0]] + _items(values[1]))
+
+def _bulk_link(values):
+    """The action of the productions ``L_ITEMS -> [separator] item L_ITEMS``
+    of ``LLParser.addlist``: a link ``(item, rest)`` of a chain."""
+    return (values[len(values) - 2],values[len(values) - 1])
+
+class _BulkList:
+    """A parse table cell of ``LLParser.plan_table`` for the `plan` of a
+    production ``L -> item L_ITEMS`` (see ``LLParser.addlist``), which
+    ``_rd_parse_plan`` parses with ``_rd_parse_bulk`` (see
+    ``_Operators``.)"""
+    __slots__ = ('plan',)
+    steps = ()
+
+    def __init__(self,plan):
+        self.plan = plan
+
+class _Loop:
+    """A parse table cell of ``LLParser.plan_table`` for the `plan` of a
+    production ``X_STAR -> item X_STAR``, which ``_rd_parse_plan`` parses
+    with ``_rd_parse_loop`` (see ``_Operators``.)"""
+    __slots__ = ('plan',)
+    steps = ()
+
+    def __init__(self,plan):
+        self.plan = plan
+
+class _Operators:
+    """A parse table cell of ``LLParser.plan_table`` for the `plan` of a
+    production ``E -> operand E_OPS`` (see ``LLParser.addexpression``),
+    which ``_rd_parse_plan`` parses with ``_rd_parse_operators``. It has no
+    steps of its own, so the usual path never takes it for a plan."""
+    __slots__ = ('plan',)
+    steps = ()
+
+    def __init__(self,plan):
+        self.plan = plan
+
+def _rd_validate_plan(plan,scanner,predict):
+    """``_rd_parse_plan`` for ``LLParser.validate``: follow `plan` over the
+    tokens of `scanner` (a ``_TokenScanner``), without values or actions.
+
+    A nonterminal is only followed once the next step is reached, so that
+    the plan of the last one - a tail call - can be followed by the loop
+    instead of by recursion.
+    """
+    while True:
+        child = None
+        for row, symbol, tokens in plan.steps:
+            if child is not None:
+                _rd_validate_plan(child,scanner,predict)
+                child = None
+            token = scanner.token
+            if token is None:
+                token = scanner.next(tokens)
+            if row is None:
+                if token is not symbol and token != symbol:
+                    raise scanner.error(symbol)
+                scanner.skip()
+            else:
+                child = row.get(token)
+                if child is None:
+                    child = _missing(row,token)
+                if child is None:
+                    raise scanner.error()
+                if child.__class__ is _Choice:
+                    child = child.plans[predict(symbol,scanner)[2]]
+                elif child.__class__ is not _Plan:
+                    # _Loop, _Operators or _BulkList: their plans
+                    # recognize the same
+                    child = child.plan
+                if not child.steps:
+                    child = None
+        if child is None:
+            return
+        plan = child
+
+def _rd_recover_plan(plan,lexer,predict,recovery):
+    """``_rd_parse_plan`` for ``LLParser.parse`` with `errors`: parse
+    `plan`, recovering from syntax errors with `recovery`, a ``_Recovery``.
+    """
+    values = []
+    for row, symbol, tokens in plan.steps:
+        values.append(_rd_recover_step(row,symbol,tokens,lexer,predict,
+                                       recovery))
+    if not plan.call:
+        return plan.action
+    if not plan.steps:
+        return plan.action([None])
+    return recovery.call(plan.action,values)
+
+def _rd_recover_step(row,symbol,tokens,lexer,predict,recovery):
+    "Parse one step of a plan for ``_rd_recover_plan``, returning its value."
+    if row is None:
+        next = lexer.peek(tokens)
+        token = next.token
+        if token is not symbol and token != symbol:
+            recovery.report('Expected {} but found {} on line {} at '
+                'position {}'.format( symbol.name, next.match,
+                next.line, next.position),next)
+            if symbol is EOF:
+                # Nothing more to parse
+                while lexer.peek().token is not EOF:
+                    lexer.poll()
+                return None
+            after = lexer.lookahead(1).token
+            if token is EOF or (after is not symbol and after != symbol):
+                # Missing
+                return None
+            # A token too many
+            lexer.poll(tokens)
+        recovery.quiet = False
+        return lexer.poll(tokens).match
+    child = recovery.choose(row,symbol,tokens,lexer,predict)
+    if child is None:
+        return None
+    if child.__class__ is _Loop:
+        return _rd_recover_repetition(child.plan,lexer,predict,recovery)
+    if child.__class__ is _BulkList:
+        return recovery.call(child.plan.action.reducer,
+            _rd_recover_repetition(child.plan,lexer,predict,recovery))
+    if child.__class__ is _Operators:
+        child = child.plan
+    return _rd_recover_plan(child,lexer,predict,recovery)
+
+def _rd_recover_repetition(plan,lexer,predict,recovery):
+    """Parse the repetition of `plan` (of a ``_Loop`` or a ``_BulkList``) in
+    one loop, like ``_rd_parse_loop``, and return the list of the values of
+    its items."""
+    (row, symbol, tokens), (tail, tail_symbol, tail_tokens) = plan.steps
+    items = [_rd_recover_step(row,symbol,tokens,lexer,predict,recovery)]
+    while True:
+        child = recovery.choose(tail,tail_symbol,tail_tokens,lexer,predict)
+        if child is None:
+            return items
+        if child.__class__ is not _Plan:
+            child = child.plan
+        if not child.steps:
+            # The empty production: no more items
+            return items
+        for row, symbol, tokens in child.steps[:-1]:
+            value = _rd_recover_step(row,symbol,tokens,lexer,predict,
+                                     recovery)
+        items.append(value)
+
+class _Recovery:
+    """The state of a parse that recovers from syntax errors (see
+    ``LLParser.parse``): the list of `errors` to add to, and the terminals
+    to `stop` skipping at besides those in the FOLLOW sets."""
+
+    def __init__(self,parser,errors,stop):
+        self.follow = parser.FOLLOW
+        self.errors = errors
+        self.stop = stop | {EOF}
+        self.reported = len(errors)
+        # Whether errors go unreported, until a token is matched
+        self.quiet = False
+
+    def report(self,message,lexeme):
+        "Add the error `message` at `lexeme`, unless it is quiet."
+        if not self.quiet:
+            error = ParsingError(message)
+            error.line, error.position = lexeme.line, lexeme.position
+            error.offset = lexeme.offset
+            self.errors.append(error)
+        self.quiet = True
+
+    def choose(self,row,symbol,tokens,lexer,predict):
+        """The cell of `row` (of `symbol`) to follow, skipping tokens that
+        have none, or None if a token that ends `symbol` is reached first.
+        A ``_Choice`` is settled with `predict`."""
+        stop = None
+        while True:
+            next = lexer.peek(tokens)
+            child = row.get(next.token)
+            if child is None:
+                child = _missing(row,next.token)
+            if child is not None:
+                if child.__class__ is _Choice:
+                    child = child.plans[predict(symbol,lexer)[2]]
+                return child
+            if stop is None:
+                self.report('Unexpected input "{}" on line {} at position '
+                            '{}'.format(next.match,next.line,next.position),
+                            next)
+                stop = self.follow.get(symbol,set()) | self.stop
+            if next.token in stop:
+                return None
+            lexer.poll(tokens)
+
+    def call(self,action,values):
+        """``action(values)``, or None if that fails after an error was
+        reported and the values hold the None of something missing or
+        skipped (see ``_holds_none``.) Other failures are raised."""
+        try:
+            return action(values)
+        except Exception:
+            if len(self.errors) == self.reported or not _holds_none(values):
+                raise
+            return None
+
+def _holds_none(values):
+    """Whether the list `values` has None in it, or in a list or tuple in
+    it (the items of a repetition, say), and so on."""
+    for value in values:
+        if value is None:
+            return True
+        if isinstance(value,(list,tuple)) and _holds_none(value):
+            return True
+    return False
+
+def _rd_profile_plan(plan,lexer,predict,profile,caller=None,depth=1):
+    """``_rd_parse_plan``, recording what it does in `profile`, a
+    ``pcc.profiler.ParseProfile``. Kept apart so that parsing without a
+    profile pays nothing for it.
+    """
+    clock = time.perf_counter
+    begin = clock()
+    prod = plan.prod
+    profile.calls[prod] += 1
+    if depth > profile.max_depth:
+        profile.max_depth = depth
+    outermost = not profile.active[prod]
+    profile.active[prod] += 1
+
+    values = []
+    children = 0.0
+    for row, symbol, tokens in plan.steps:
+        if row is None:
+            next = lexer.poll(tokens)
+            token = next.token
+            if token is not symbol and token != symbol:
+                raise ParsingError('Expected {} but found {} on line {} at '
+                    'position {}'.format( symbol.name, next.match,
+                    next.line, next.position))
+            values.append(next.match)
+        else:
+            next = lexer.peek(tokens)
+            child = row.get(next.token)
+            if child is None:
+                child = _missing(row,next.token)
+            if child is None:
+                raise ParsingError('Unexpected input "{}" on line {} at '
+                    'position {}'.format(next.match,next.line,next.position))
+            profile.cells[(symbol,next.token)] += 1
+            if child.__class__ is _Choice:
+                child = child.plans[predict(symbol,lexer)[2]]
+            elif child.__class__ is not _Plan:
+                # _Loop, _Operators or _BulkList: profiled as the
+                # productions it stands for
+                child = child.plan
+            start = clock()
+            values.append(_rd_profile_plan(child,lexer,predict,profile,prod,
+                                           depth + 1))
+            children += clock() - start
+
+    if plan.call:
+        start = clock()
+        result = plan.action(values if plan.steps else [None])
+        elapsed = clock() - start
+        profile.action_time[prod] += elapsed
+        profile.action_total += elapsed
+    else:
+        result = plan.action
+
+    total = clock() - begin
+    profile.active[prod] -= 1
+    profile.own_time[prod] += total - children
+    if outermost:
+        profile.primitive_calls[prod] += 1
+        profile.cumulative_time[prod] += total
+    if caller is not None:
+        edge = profile.callers[prod][caller]
+        edge[0] += 1
+        edge[2] += total - children
+        if outermost:
+            edge[1] += 1
+            edge[3] += total
+    return result
+
+def _key(symbol):
+    "The key of `symbol` in ``LLParser.tables()``."
+    if symbol.terminal():
+        return (symbol.name,symbol.rule.pattern)
+    return symbol.name
+
+def _numbering(keys):
+    """A function from each symbol of the dict `keys` (see ``_key``) to its
+    position in it. Terminals are looked up by identity first, since hashing
+    a ``Token`` is slow."""
+    numbers = {}
+    for number, (key, symbol) in enumerate(keys.items()):
+        numbers[key] = number
+        if symbol.terminal():
+            numbers.setdefault(id(symbol),number)
+    def index(symbol):
         if symbol.terminal():
+            number = numbers.get(id(symbol))
+            if number is not None:
+                return number
+            return numbers[(symbol.name,symbol.rule.pattern)]
+        return numbers[symbol.name]
+    return index
+
+class _Plan:
+    """Precompiled reduction plan for one production.
+
+    ``steps`` is a tuple of ``(row, symbol, tokens)`` triples, one per symbol
+    of the rule: `row` is None for a terminal, and otherwise the row of
+    ``LLParser.plan_table`` for the nonterminal, so that no lookups by
+    symbol are left to do while parsing. `tokens` are the lexer candidates
+    at that step when lexing in context (see ``LLParser._candidates``.)
+    ``call`` tells whether ``action`` is to be called or is a constant.
+    Epsilon-productions have no steps, and an ``arity`` of 1 for the
+    ``None`` placeholder passed to ``action``.
+    """
+    __slots__ = ('prod','steps','action','call','arity')
+
+    def __init__(self,prod,action):
+        self.prod = prod
+        self.steps = ()
+        self.action = action
+        self.call = hasattr(action,'__call__')
+        self.arity = 1
+
+class _Placeholder:
+    """The action of a plan whose rule starts with EPSILON, which has no step
+    (see ``LLParser._compile_steps``): calls `action` with the ``None`` value
+    of EPSILON in front of the values of the steps."""
+    __slots__ = ('action',)
+
+    def __init__(self,action):
+        self.action = action
+
+    def __call__(self,values):
+        return self.action([None] + values)
+
+class _Row(dict):
+    """A row of ``LLParser.plan_table``: a dict of token to plan, which a lazy
+    parser only fills in (see ``_missing``) the first time it is used."""
+
+    def __init__(self,parser,symbol):
+        self.parser = parser
+        self.symbol = symbol
+        self.built = False
+
+def _missing(row,token):
+    """The slow path of looking up `token` in `row`, a ``_Row`` that had no
+    plan for it: fill the row in if that hasn't happened yet, and look
+    again. Returns None if the token really is unexpected.
+    """
+    if row.built:
+        return None
+    row.parser._fill_row(row.symbol)
+    return row.get(token)
+
+class _LazyTable(dict):
+    """The parse table of a lazy ``LLParser``: each row is built (and checked
+    for conflicts) the first time it is looked up, exactly once."""
+
+    def __init__(self,parser):
+        self.parser = parser
+
+    def __missing__(self,symbol):
+        with self.parser._lock:
+            if symbol not in self:
+                self[symbol] = self.parser._lazy_row(symbol)
+            return dict.__getitem__(self,symbol)
+
+class _Choice:
+    "A parse table cell with more than one ``_Plan``, for ``predict`` to pick."
+    __slots__ = ('symbol','plans')
+
+    def __init__(self,symbol,plans):
+        self.symbol = symbol
+        self.plans = plans
+
 
+def _rd_tree_rule(rule,prod,lexer,parse_table,predict,tree,reuse=None):
+    """Recursive function to parse the input in to a ``ParseTree``
+
+    This is ``_rd_parse_rule`` without values or actions: it only adds the
+    node for `rule` (production `prod`) to `tree`, after its children.
+    A nonterminal is only parsed once the next symbol is reached, so that
+    the last one - a tail call, such as the rest of a repetition - can be
+    parsed by the loop instead of by recursion, as in
+    ``_rd_validate_plan``. If `reuse` (a ``_Reuse``) is given, subtrees are
+    copied from an old tree whenever possible instead of being parsed.
+
+    The spans of the nodes are the indices of `lexer` (which must have an
+    ``index``), and the lexemes are only added to `tree` without `reuse`
+    (``LLParser.reparse`` adds them itself.)
+    """
+    lexemes = tree._store.lexemes if reuse is None else None
+    nodes = tree._store.prod
+    # (prod, start, first) of the nodes waiting for their last child
+    pending = []
+    while True:
+        pending.append((prod,lexer.index,len(nodes)))
+        child = None
+        for symbol in rule:
+            if child is not None:
+                if reuse is None or not reuse.copy(child,tree,lexer):
+                    child_rule, child_prod = _tree_production(
+                        child,lexer,parse_table,predict)
+                    _rd_tree_rule(child_rule,child_prod,lexer,parse_table,
+                                  predict,tree,reuse)
+                child = None
+            if not symbol.terminal():
+                child = symbol
+                continue
             if symbol == EPSILON:
-                # epsilon-production - treat like input, but consume nothing
-                input_values.append(None)
                 continue
-            
+
             next = lexer.poll()
-    
-            # if the wrong token is lexed:
+
             if ( next.token != symbol or
                  (symbol.name == "LITERAL" and not symbol.match(next.match,0))
                ):
                 raise ParsingError('Expected {} but found {} on line {} at '
                     'position {}'.format( symbol.name, next.match,
                     next.line, next.position))
-            
-            input_values.append(next.match)
+
+            if lexemes is not None:
+                lexemes.append(next)
+
+        if child is None or (reuse is not None and
+                             reuse.copy(child,tree,lexer)):
+            break
+        rule, prod = _tree_production(child,lexer,parse_table,predict)
+
+    end = lexer.index
+    while pending:
+        prod, start, first = pending.pop()
+        tree._add(prod,start,end,first)
+
+def _tree_production(symbol,lexer,parse_table,predict):
+    """Return the rule and the production id with which ``_rd_tree_rule``
+    derives `symbol` at the next lexeme of `lexer`."""
+    next = lexer.peek()
+    productions = parse_table[symbol][next.token]
+
+    if len(productions) == 0:
+        raise ParsingError('Unexpected input "{}" on line {} at '
+            'position {}'.format(next.match,next.line,next.position))
+    elif len(productions) > 1 and predict is not None:
+        rule,_,prod = predict(symbol,lexer)
+    else:
+        rule,_,prod = productions[0]
+    return rule, prod
+
+def _relex(lexer,tree,input,start,end,delta):
+    """Lex the edited region for ``LLParser.reparse``.
+
+    `input` is the new input of `tree`, in which ``old_input[start:end]`` was
+    replaced with text of length ``end - start + delta``. Returns ``(relexed,
+    a, b, marks, moves)`` where `relexed` are the new lexemes that replace
+    ``tree.lexemes[a:b]``; the lexemes after them stay the same objects as
+    before, and `marks` and `moves` say where those have moved to (see
+    ``ParseTree._lexeme``.) The store of `tree` must hold it.
+    """
+    old = tree._store.lexemes
+    lexeme_at = tree._lexeme
+    # The first lexeme that ends at or after the start of the edit - it might
+    # be extended by the new text.
+    lo, hi = 0, len(old) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        lexeme = lexeme_at(mid)
+        if lexeme.offset + len(lexeme.match) < start:
+            lo = mid + 1
+        else:
+            hi = mid
+    a = lo
+
+    # Resume lexing where the lexer was right after lexeme a-1
+    if a == 0:
+        position, line, line_pos = 0, 1, 1
+    else:
+        previous = lexeme_at(a-1)
+        position = previous.offset + len(previous.match)
+        line, line_pos = _advance(previous.line,previous.position,
+                                  previous.match)
+
+    # Lex until a new lexeme lines up with an old one after the edit, after
+    # which the lexing can only turn out the same as before.
+    relexed = []
+    b = a
+    edit_end = end + delta
+    tail = len(old) - 1
+    for lexeme in lexer._lex(input,position,line,line_pos):
+        if lexeme.offset >= edit_end:
+            while b < tail and lexeme_at(b).offset < lexeme.offset - delta:
+                b += 1
+            if b < tail:
+                first = lexeme_at(b)
+                if ( first.offset == lexeme.offset - delta and
+                     first.token == lexeme.token and
+                     first.match == lexeme.match
+                   ):
+                    break
+        relexed.append(lexeme)
+    else:
+        b = tail
+
+    # The lexemes before the edit stay where they were, the new ones are
+    # where they were lexed, and the rest (but EOF) move with `lexeme`, the
+    # new lexeme that lined up with `first`.
+    count = bisect_left(tree._marks,a)
+    marks = tree._marks[:count]
+    moves = tree._moves[:count]
+    if marks:
+        marks.append(a)
+        moves.append((0,0,{}))
+    if b < tail:
+        line_delta = lexeme.line - first.line
+        position_delta = lexeme.position - first.position
+        shift = a + len(relexed) - b
+        mark = bisect_right(tree._marks,b) - 1
+        if mark < 0:
+            olds = [(b,(0,0,{}))]
+        else:
+            olds = []
+        olds.extend(zip(tree._marks[max(mark,0):],tree._moves[max(mark,0):]))
+        for index, (offset, lines, positions) in olds:
+            if position_delta:
+                # Lexemes on the line of `first` also move along it
+                positions = dict(positions)
+                line = first.line - lines
+                positions[line] = positions.get(line,0) + position_delta
+            marks.append(max(index,b) + shift)
+            moves.append((offset + delta,lines + line_delta,positions))
+
+    return relexed, a, b, marks, moves
+
+def _edit_path(tree,a,b):
+    """Return the path from the root of `tree` to the smallest node that
+    holds the old lexemes ``[a, b)`` replaced by ``LLParser.reparse``, and
+    starts before them (and so ends with, or after, the lookahead after
+    them.)
+
+    Each entry is ``((node, start, end, first), tail, siblings)``: `tail`
+    says that the node is the last child of the one before it, and that the
+    rule of that one ends with it; `siblings` are the nodes after it with the
+    same parent.
+    """
+    entry = (tree.root,0,len(tree._store.lexemes),0)
+    path = [(entry,False,())]
+    test = lambda start, end: start < a and end >= b
+    while True:
+        node, start, end, first = entry
+        below = tree._descend(node,start,end,first,test)
+        if below[0] != node:
+            rule = list(tree.rule(node))
+            entry = below
+            path.append((entry,not rule[-1].terminal(),()))
             continue
+        children = tree._children(node,start,end,first)
+        for index, child in enumerate(children):
+            if test(child[1],child[2]):
+                break
         else:
-            #non-terminal symbol
-            # find the right derivation to follow
-            next = lexer.peek()
-            productions = parse_table[symbol][next.token]
-            
-            if len(productions) == 0:
-                raise ParsingError('Unexpected input "{}" on line {} at '
-                    'position {}'.format(next.match,next.line,next.position))
-            elif len(productions) > 1:
-                # TODO - more than one production means this isn't actually
-                # LL(1). In the future, we should automatically left-factor
-                # and eliminate recursion when possible, in which case this
-                # condition would be a definite error. However instead,
-                # we will simply choose the first production, but this is
-                # a BUG and should be fixed.
-                pass
-            new_rule,new_action = productions[0]
-            # RECURSION
-            input_values.append(_rd_parse_rule(new_rule,new_action,lexer,
-                                parse_table))
+            return path
+        rule = list(tree.rule(node))
+        entry = child
+        path.append((entry,child[0] == node - 1 and not rule[-1].terminal(),
+                     [sibling[0] for sibling in children[index+1:]]))
+
+class _Reuse:
+    """Finds and copies reusable subtrees of an old ``ParseTree`` while
+    `entry` (a ``(node, start, end, first)`` tuple of it) is parsed again.
+
+    The old lexemes ``[a, b)`` were replaced, and the lexemes after them
+    moved by `delta` places. The parser only moves forward, so the old tree
+    is searched by walking down from where the last search ended.
+    """
+
+    def __init__(self,tree,entry,a,b,delta):
+        self.tree = tree
+        self.a = a
+        self.b = b
+        self.delta = delta
+        # The nodes from `entry` down to the last one searched
+        self.path = [entry]
+
+    def copy(self,symbol,tree,lexer):
+        """If the old tree has a reusable derivation of `symbol` at the current
+        position of `lexer`, append it to `tree`, skip `lexer` past it, and
+        return True.
+        """
+        index = lexer.index
+        if index < self.a:
+            shift = 0
+        elif index >= self.b + self.delta:
+            shift = self.delta
+        else:
+            return False
+        found = self._find(index - shift,symbol.name)
+        if found is None:
+            return False
+        node, start, end, first = found
+        if index < self.a and end >= self.a:
+            # The subtree, or its lookahead, runs in to the edit
+            return False
+        end += shift
+        tree._graft(self.tree,node,first,index,end)
+        lexer.index = end
+        return True
+
+    def _find(self,index,name):
+        """Return the outermost old node that derives the nonterminal `name`
+        from the lexeme at `index`, if any, as a ``(node, start, end,
+        first)`` tuple."""
+        old = self.tree
+        path = self.path
+        while len(path) > 1 and path[-1][2] <= index:
+            path.pop()
+        if not path[-1][1] <= index < path[-1][2]:
+            return None
+        outer = len(path)
+        while outer > 0 and path[outer-1][1] == index:
+            outer -= 1
+        for entry in path[outer:]:
+            if old.symbol(entry[0]).name == name:
+                return entry
+
+        test = lambda start, end: start <= index < end
+        while True:
+            entry = path[-1]
+            below = old._descend(*entry,test)
+            if below[0] == entry[0]:
+                for below in old._children(*entry):
+                    if test(below[1],below[2]):
+                        break
+                else:
+                    return None
+            path.append(below)
+            if below[1] == index and old.symbol(below[0]).name == name:
+                return below
+
+
+class _AdaptivePredictor:
+    """Lookahead DFA cache for the adaptive (ALL(*)-like) mode of LLParser.
+
+    A decision for nonterminal A is made by simulating every production of
+    A in parallel, one lexeme at a time, until only one production can
+    still match the input. The simulation tracks 'configurations' - pairs
+    of (production index, stack of grammar symbols still to be matched).
+    Since the recursive descent parser does not keep its call stack around,
+    a configuration that reaches the end of A continues into *every* place
+    where A is used in the grammar (its global FOLLOW context).
+
+    Every set of configurations reached this way becomes a ``_DFAState``,
+    and the transitions between them are cached per lexeme token, so that
+    repeating a decision on similar input just walks the cached DFA.
+    """
+
+    def __init__(self, parser):
+        self.productions = parser.productions
+        self.prodids = parser.prodids
+        self.start_symbol = parser.start[0]
+        # For each nonterminal X, every (B, suffix) where B -> alpha X suffix
+        self.callers = {symbol: [] for symbol in self.productions}
+        for symbol, rules in self.productions.items():
+            for rule,action in rules:
+                for index,rule_symbol in enumerate(rule):
+                    if not rule_symbol.terminal():
+                        self.callers[rule_symbol].append(
+                            (symbol,tuple(rule[index+1:])))
+        # Start state for each nonterminal decision
+        self.DFA = {}
+        # Interned DFA states, keyed by their configuration sets
+        self.states = {}
+
+    def predict(self,symbol,lexer):
+        """Return the parse table entry ``(rule, action, id)`` for the
+        production of `symbol` that the upcoming input matches.
+        """
+        state = self.DFA.get(symbol)
+        if state is None:
+            state = self._state(self._closure(
+                (alt,tuple(rule) + (_Return(symbol),))
+                for alt,(rule,action) in enumerate(self.productions[symbol])))
+            state = self.DFA.setdefault(symbol,state)
+
+        k = 0
+        while state.prediction is None:
+            token = lexer.lookahead(k).token
+            next_state = state.edges.get(token)
+            if next_state is None:
+                next_state = self._state(self._closure(
+                                self._move(state.configs,token)))
+                next_state = state.edges.setdefault(token,next_state)
+            if not next_state.configs:
+                # Syntax error ahead - let the parser find and report it.
+                break
+            state = next_state
+            k += 1
+
+        if state.prediction is None:
+            alt = min(alt for alt,stack in state.configs)
+        else:
+            alt = state.prediction
+        rule, action = self.productions[symbol][alt]
+        return rule, action, self.prodids[symbol][alt]
+
+    def _state(self,configs):
+        "Return the (interned) DFA state for a set of configurations."
+        state = self.states.get(configs)
+        if state is None:
+            # If several threads race to add the same state, only one wins.
+            state = self.states.setdefault(configs,_DFAState(configs))
+        return state
+
+    def _closure(self,configs):
+        """Expand configurations until each has a terminal on top of its stack
+        (or has an empty stack, having matched the end of the input).
+        """
+        result = set()
+        seen = set()
+        todo = list(configs)
+        while todo:
+            config = todo.pop()
+            if config in seen:
+                continue
+            seen.add(config)
+            alt, stack = config
+            if not stack:
+                result.add(config)
+                continue
+            top = stack[0]
+            if type(top) is _Return:
+                # The end of the decision's context: go everywhere it can go.
+                for caller, suffix in self.callers[top.symbol]:
+                    todo.append((alt,suffix + (_Return(caller),)))
+                if top.symbol == self.start_symbol:
+                    todo.append((alt,(EOF,)))
+            elif top.terminal():
+                if top == EPSILON:
+                    todo.append((alt,stack[1:]))
+                else:
+                    result.add(config)
+            else:
+                for rule,action in self.productions[top]:
+                    todo.append((alt,tuple(rule) + stack[1:]))
+        return frozenset(result)
+
+    def _move(self,configs,token):
+        "Advance all configurations that can match `token`."
+        moved = []
+        for alt, stack in configs:
+            if not stack:
+                # Already past EOF, and EOF is all that can follow.
+                moved.append((alt,stack))
+            elif stack[0] == token:
+                moved.append((alt,stack[1:]))
+        return moved
+
+class _LookaheadPredictor:
+    """Fixed `k`-token lookahead for the decisions of an LL(k) parser that
+    one token can not settle.
+
+    The lookahead strings of FIRST_k and FOLLOW_k are tuples of small ints
+    (see ``codes``) rather than of ``Token`` objects, which keeps the sets
+    small and quick to hash. A string that reaches the end of the input is
+    padded with EOF to length `k`, just like the lookahead of the lexeme
+    iterators, so every string in ``tables`` is exactly `k` long.
+    """
+
+    def __init__(self,parser,symbols):
+        self.parser = parser
+        self.k = k = parser.k
+        self.codes = {token: code for code, token
+                      in enumerate(sorted(parser.terminals,key=repr))}
+        eof = (self.codes[EOF],) * k
+
+        rules = [(symbol,self._encode(parser.prodlist[prod][1]))
+                 for symbol, prods in parser.prodids.items()
+                 for prod in prods]
+        first = {symbol: set() for symbol in parser.productions}
+        changed = True
+        while changed:
+            changed = False
+            for symbol, rule in rules:
+                strings = _first_k(rule,first,k)
+                if not strings <= first[symbol]:
+                    first[symbol] |= strings
+                    changed = True
+
+        follow = {symbol: set() for symbol in parser.productions}
+        follow[parser.start[0]].add(eof)
+        changed = True
+        while changed:
+            changed = False
+            for symbol, rule in rules:
+                for index, item in enumerate(rule):
+                    if isinstance(item,int):
+                        continue
+                    strings = _concat_k(_first_k(rule[index+1:],first,k),
+                                        follow[symbol],k)
+                    if not strings <= follow[item]:
+                        follow[item] |= strings
+                        changed = True
+
+        self.first = first
+        self.follow = follow
+        # For each symbol, map every lookahead string to its production
+        self.tables = {}
+        for symbol in symbols:
+            self.add(symbol)
+
+    def add(self,symbol):
+        """Build the lookahead table of `symbol`, or raise ``GrammarError`` if
+        `k` tokens can not tell its productions apart.
+        """
+        k = self.k
+        table = {}
+        for prod in self.parser.prodids[symbol]:
+            rule = self._encode(self.parser.prodlist[prod][1])
+            for string in _concat_k(_first_k(rule,self.first,k),
+                                    self.follow[symbol],k):
+                if table.setdefault(string,prod) != prod:
+                    raise GrammarError("Grammar is not LL({}) - ambiguous "
+                                       "derivation for symbol {}".format(
+                                       k,symbol.name))
+        self.tables[symbol] = table
+
+    def _encode(self,rule):
+        """`rule` as a tuple with the terminals replaced by their codes (and
+        EOF by `k` of them), and without EPSILON."""
+        result = []
+        for symbol in rule:
+            if symbol == EPSILON:
+                continue
+            elif symbol == EOF:
+                result.extend([self.codes[EOF]] * self.k)
+            elif symbol.terminal():
+                result.append(self.codes[symbol])
+            else:
+                result.append(symbol)
+        return tuple(result)
+
+    def predict(self,symbol,lexer):
+        """Return the parse table entry ``(rule, action, id)`` for `symbol`,
+        chosen by the next `k` lexemes of `lexer`.
+        """
+        table = self.tables.get(symbol)
+        if table is not None:
+            codes = self.codes
+            key = tuple(codes.get(lexer.lookahead(i).token)
+                        for i in range(self.k))
+            prod = table.get(key)
+            if prod is not None:
+                symbol, rule, action = self.parser.prodlist[prod]
+                return rule, action, prod
+        # Not a k-token decision, or a syntax error somewhere in the next k
+        # lexemes: let the first production find it.
+        return self.parser.ptable[symbol][lexer.peek().token][0]
+
+def _first_k(rule,first,k):
+    """FIRST_k of `rule`, a tuple of terminal codes and nonterminals, given
+    the FIRST_k sets `first` of the nonterminals."""
+    result = {()}
+    for item in rule:
+        if isinstance(item,int):
+            strings = {(item,)}
+        else:
+            strings = first[item]
+        result = _concat_k(result,strings,k)
+        if all(len(string) == k for string in result):
+            break
+    return result
+
+def _concat_k(a,b,k):
+    "Every string of `a` followed by every string of `b`, cut to length `k`."
+    result = set()
+    for x in a:
+        if len(x) >= k:
+            result.add(x)
             continue
-    # Parsing complete, now perform the 'action'
-    if hasattr(action, '__call__'):
-        return action(input_values)
-    else:
-        return action
+        for y in b:
+            result.add((x+y)[:k])
+    return result
+
+class _DFAState:
+    """A state of a lookahead DFA - see ``_AdaptivePredictor``."""
+
+    def __init__(self,configs):
+        self.configs = configs
+        self.edges = {}
+        alts = {alt for alt,stack in configs}
+        if len(alts) == 1:
+            self.prediction = alts.pop()
+        elif alts and self._ambiguous(configs,alts):
+            self.prediction = min(alts)
+        else:
+            self.prediction = None
+
+    @staticmethod
+    def _ambiguous(configs,alts):
+        """True if no amount of further input can separate the alternatives,
+        because every alternative has exactly the same stacks.
+        """
+        stacks = {}
+        for alt, stack in configs:
+            stacks.setdefault(alt,set()).add(stack)
+        first, *rest = stacks.values()
+        return all(other == first for other in rest)
+
+class _Return:
+    """Stack marker for the end of a nonterminal with unknown context."""
+
+    def __init__(self,symbol):
+        self.symbol = symbol
+
+    def __hash__(self):
+        return hash(self.symbol)
+
+    def __eq__(self,other):
+        return type(other) is _Return and self.symbol == other.symbol
+
+    def terminal(self):
+        return False
+
+
+# The most batches of lexemes _PrefetchLexemeIterator lexes ahead
+_PREFETCH_BATCHES = 4
 
-    
 class _LexemeIterator:
     """Helper class to handle reading values from the ``Lexer``."""
 
     def __init__(self,lexer,input):
         self.n = lexer.lex(input)
         self.next_symbol = None
+        # Lexemes beyond next_symbol which were read by lookahead()
+        self.buffer = deque()
+        # The number of lexemes polled
+        self.index = 0
         self.scan()
 
     def scan(self):
         "Load the next lexeme"
+        if self.buffer:
+            self.next_symbol = self.buffer.popleft()
+            return
         try:
             self.next_symbol = next(self.n)
         except StopIteration:
@@ -342,16 +2829,457 @@ class _LexemeIterator:
             self.n = _false_iter()
             self.next_symbol = next(self.n)
 
-    def peek(self):
-        """Return the next lexeme, but do not remove it from the input."""
+    def lookahead(self,k):
+        """Return the lexeme `k` places after the next one, without removing
+        anything from the input. ``lookahead(0)`` is the same as ``peek()``.
+        """
+        if k == 0:
+            return self.next_symbol
+        while len(self.buffer) < k:
+            try:
+                self.buffer.append(next(self.n))
+            except StopIteration:
+                self.buffer.append(Lexeme(EOF,"EOF",-1,-1))
+                self.n = iter(())
+        return self.buffer[k-1]
+
+    def peek(self,tokens=None):
+        """Return the next lexeme, but do not remove it from the input.
+
+        `tokens` (the candidates of ``_ContextLexemeIterator``) is ignored.
+        """
         return self.next_symbol
 
-    def poll(self):
+    def poll(self,tokens=None):
         """Return and remove the next lexeme from the input."""
         result = self.next_symbol
+        self.index += 1
         self.scan()
         return result
 
+class _ContextLexemeIterator:
+    """Like ``_LexemeIterator``, but the next lexeme is only lexed when the
+    parser asks for it, by trying only the candidate tokens the parser passes
+    to ``peek`` or ``poll``. The full lexer is used if none of them match
+    (the parser will then report the error), and for ``lookahead`` beyond the
+    next lexeme.
+    """
+
+    def __init__(self,lexer,input):
+        if len(lexer.tokens) < 1:
+            raise ValueError('The lexer must have at least 1 rule to work.')
+        self.lexer = lexer
+        self.input = input
+        self.position = 0
+        self.line = 1
+        self.line_pos = 1
+        # The lexed but not yet polled lexemes
+        self.buffer = deque()
+
+    def _scan(self,tokens):
+        "Lex and return the lexeme at the current position."
+        input = self.input
+        position = self.position
+        line, line_pos = self.line, self.line_pos
+        while position < len(input):
+            top = None
+            if tokens is not None:
+                top = self.lexer._match(input,position,tokens)
+            if top is None:
+                top = self.lexer._match(input,position)
+            if top is None:
+                raise _no_token(line,line_pos,position)
+            token, match = top
+            lexeme = Lexeme(token,match,line,line_pos,position)
+            line, line_pos = _advance(line,line_pos,match)
+            position += len(match)
+            if not token.silent:
+                break
+        else:
+            lexeme = Lexeme(EOF,"EOF",-1,-1)
+        self.position = position
+        self.line, self.line_pos = line, line_pos
+        return lexeme
+
+    def lookahead(self,k):
+        while len(self.buffer) <= k:
+            self.buffer.append(self._scan(None))
+        return self.buffer[k]
+
+    def peek(self,tokens=None):
+        if not self.buffer:
+            self.buffer.append(self._scan(tokens))
+        return self.buffer[0]
+
+    def poll(self,tokens=None):
+        if not self.buffer:
+            return self._scan(tokens)
+        return self.buffer.popleft()
+
+class _TimedLexemeIterator:
+    "Wraps a lexeme iterator, adding the time spent in it to a profile."
+
+    def __init__(self,lexer,profile):
+        self.lexer = lexer
+        self.profile = profile
+
+    def lookahead(self,k):
+        start = time.perf_counter()
+        result = self.lexer.lookahead(k)
+        self.profile.lex_time += time.perf_counter() - start
+        return result
+
+    def peek(self,tokens=None):
+        start = time.perf_counter()
+        result = self.lexer.peek(tokens)
+        self.profile.lex_time += time.perf_counter() - start
+        return result
+
+    def poll(self,tokens=None):
+        start = time.perf_counter()
+        result = self.lexer.poll(tokens)
+        self.profile.lex_time += time.perf_counter() - start
+        self.profile.lex_calls += 1
+        return result
+
+class _LimitedLexemeIterator:
+    """Wraps a lexeme iterator, counting the lexemes polled (but EOF) as
+    tokens and the peeks (one for each nonterminal or repetition the parser steps
+    into) as steps of a ``pcc.limits._Budget``."""
+
+    def __init__(self,lexer,budget):
+        self.lexer = lexer
+        self.budget = budget
+
+    def lookahead(self,k):
+        return self.lexer.lookahead(k)
+
+    def peek(self,tokens=None):
+        result = self.lexer.peek(tokens)
+        budget = self.budget
+        budget.steps += 1
+        budget.countdown -= 1
+        if budget.countdown <= 0:
+            budget.check(result)
+        return result
+
+    def poll(self,tokens=None):
+        result = self.lexer.poll(tokens)
+        if result.token is not EOF:
+            budget = self.budget
+            budget.tokens += 1
+            budget.countdown -= 1
+            if budget.countdown <= 0:
+                budget.check(result)
+        return result
+
+class _PrefetchLexemeIterator:
+    """Like ``_LexemeIterator``, but the input is lexed by a thread of its
+    own, which puts lists of up to `size` lexemes on a queue (of at most
+    ``_PREFETCH_BATCHES``) for the parser to take - ending with None, or
+    with the exception that lexing raised. ``close`` stops the thread, and
+    must be called once the parse is over.
+    """
+
+    def __init__(self,lexer,input,size):
+        self.queue = queue.Queue(_PREFETCH_BATCHES)
+        self.done = False
+        self.ended = False
+        self.lexemes = []
+        self.index = 0
+        threading.Thread(target=self._produce,args=(lexer.lex(input),size),
+                         daemon=True).start()
+        self._more()
+
+    def _produce(self,lexemes,size):
+        "Lex batches of `size` lexemes onto the queue, until done."
+        put = self.queue.put
+        try:
+            while not self.done:
+                batch = list(itertools.islice(lexemes,size))
+                if not batch:
+                    break
+                put(batch)
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    def _more(self):
+        """Take the next batch from the queue, keeping the lexemes that are
+        left of this one (for lookahead)."""
+        if self.ended:
+            batch = [Lexeme(EOF,"EOF",-1,-1)]
+        else:
+            batch = self.queue.get()
+            if batch is None:
+                self.ended = True
+                batch = [Lexeme(EOF,"EOF",-1,-1)]
+            elif batch.__class__ is not list:
+                self.ended = True
+                raise batch
+        if self.index < len(self.lexemes):
+            batch = self.lexemes[self.index:] + batch
+        self.lexemes = batch
+        self.index = 0
+
+    def close(self):
+        """Stop the thread: once it sees ``done``, its next ``put`` (which
+        emptying the queue lets through) is its last but one."""
+        self.done = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def lookahead(self,k):
+        while self.index + k >= len(self.lexemes):
+            self._more()
+        return self.lexemes[self.index + k]
+
+    def peek(self,tokens=None):
+        return self.lexemes[self.index]
+
+    def poll(self,tokens=None):
+        result = self.lexemes[self.index]
+        self.index += 1
+        if self.index == len(self.lexemes):
+            self._more()
+        return result
+
+class _RingLexemeIterator:
+    """Like ``_LexemeIterator``, for at most `k` lexemes of lookahead.
+
+    The lexemes are kept in a ring of `k` slots, which is refilled from the
+    lexer a batch at a time - whenever the parser has consumed all of it, or
+    asks to look further ahead than what is left.
+    """
+
+    def __init__(self,lexer,input,k):
+        self.n = lexer.lex(input)
+        self.ring = [None] * k
+        self.size = k
+        # The slot of the next lexeme, and the number of lexemes held
+        self.head = 0
+        self.count = 0
+        self.fill()
+
+    def fill(self):
+        "Fill the empty slots of the ring."
+        ring, size = self.ring, self.size
+        index = (self.head + self.count) % size
+        for lexeme in itertools.islice(self.n,size - self.count):
+            ring[index] = lexeme
+            index = (index + 1) % size
+            self.count += 1
+        while self.count < size:
+            # End of input
+            ring[index] = Lexeme(EOF,"EOF",-1,-1)
+            index = (index + 1) % size
+            self.count += 1
+
+    def lookahead(self,k):
+        if k >= self.size:
+            raise ValueError('Lookahead beyond k={}'.format(self.size))
+        if k >= self.count:
+            self.fill()
+        return self.ring[(self.head + k) % self.size]
+
+    def peek(self,tokens=None):
+        return self.ring[self.head]
+
+    def poll(self,tokens=None):
+        result = self.ring[self.head]
+        self.head = (self.head + 1) % self.size
+        self.count -= 1
+        if self.count == 0:
+            self.fill()
+        return result
+
+class _ListLexemeIterator:
+    """Like ``_LexemeIterator``, but over a list of lexemes ending with EOF."""
+
+    def __init__(self,lexemes):
+        self.lexemes = lexemes
+        self.index = 0
+
+    def peek(self,tokens=None):
+        return self.lexemes[self.index]
+
+    def poll(self,tokens=None):
+        result = self.lexemes[self.index]
+        if self.index < len(self.lexemes) - 1:
+            self.index += 1
+        return result
+
+    def lookahead(self,k):
+        return self.lexemes[min(self.index + k,len(self.lexemes) - 1)]
+
+class _EditedLexemeIterator:
+    """Like ``_ListLexemeIterator``, but over the lexemes of an edit by
+    ``LLParser.reparse``: the list `lexemes` (ending with EOF) with
+    ``lexemes[a:b]`` replaced by `relexed`, without making that list.
+    ``poll`` goes on counting past EOF, so that ``index`` is the number of
+    lexemes read."""
+
+    def __init__(self,lexemes,a,b,relexed):
+        self.lexemes = lexemes
+        self.a = a
+        self.relexed = relexed
+        self.shift = a + len(relexed) - b
+        self.index = 0
+
+    def _get(self,index):
+        if index < self.a:
+            return self.lexemes[index]
+        if index < self.a + len(self.relexed):
+            return self.relexed[index - self.a]
+        return self.lexemes[min(index - self.shift,len(self.lexemes) - 1)]
+
+    def peek(self,tokens=None):
+        return self._get(self.index)
+
+    def poll(self,tokens=None):
+        self.index += 1
+        return self._get(self.index - 1)
+
+    def lookahead(self,k):
+        return self._get(self.index + k)
+
+class _TokenScanner:
+    """The lexer of ``LLParser.validate``: like ``_LexemeIterator`` (or with
+    `context`, ``_ContextLexemeIterator``), but without ``Lexeme`` objects,
+    match strings or line counting.
+
+    ``token`` is the next token (None when lexing in context, until ``next``
+    is called with the candidate tokens), and ``start`` the offset of its
+    match; ``skip`` consumes it. ``lookahead`` and ``peek`` make lexemes
+    with only the token and the offset, which is all that the predictors
+    need.
+    """
+
+    def __init__(self,lexer,input,context=False):
+        if len(lexer.tokens) < 1:
+            raise ValueError('The lexer must have at least 1 rule to work.')
+        self.lexer = lexer
+        self.input = input
+        # The (match method, token) pairs to try at each first character
+        self.dispatch = {}
+        self.context = context
+        # Where lexing goes on from, after the lexemes in the buffer
+        self.scanned = 0
+        # (token, start) of the lexemes after the next one, for lookahead
+        self.buffer = deque()
+        self.token = None
+        self.start = 0
+        if not context:
+            self.token, self.start = self._scan(None)
+
+    def _scan(self,tokens):
+        """Lex the next token that isn't silent, trying the candidate `tokens`
+        first if given. Returns ``(token, start)``."""
+        input = self.input
+        position = self.scanned
+        end = len(input)
+        dispatch = self.dispatch
+        while position < end:
+            top = None
+            if tokens is not None:
+                top = self.lexer._longest(input,position,tokens)
+            if top is None:
+                # Lexer._longest over Lexer._starting, inlined
+                matchers = dispatch.get(input[position])
+                if matchers is None:
+                    matchers = dispatch[input[position]] = [
+                        (token.rule.match,token) for token
+                        in self.lexer._starting(input[position])]
+                stop = position
+                for match, token in matchers:
+                    m = match(input,position)
+                    if m is not None and m.end() > stop:
+                        top, stop = token, m.end()
+                if top is not None:
+                    top = (top,stop)
+            if top is None:
+                if not self.lexer.report_literals:
+                    self.start = position
+                    error = ParsingError('No token was found at line {} '
+                        'position {}.'.format(*self._where(position)))
+                    error.line, error.position = self._where(position)
+                    error.offset = position
+                    raise error
+                token = self.lexer._literal(input[position])
+                top = (token,position + 1)
+            token, stop = top
+            if not token.silent:
+                self.scanned = stop
+                return token, position
+            position = stop
+        self.scanned = position
+        return EOF, end
+
+    def next(self,tokens=None):
+        "Return the next token, lexing it from the candidate `tokens`."
+        if self.token is None:
+            self.token, self.start = self._scan(tokens)
+        return self.token
+
+    def skip(self):
+        "Consume the next token."
+        if self.buffer:
+            self.token, self.start = self.buffer.popleft()
+        elif self.context:
+            self.token = None
+        else:
+            self.token, self.start = self._scan(None)
+
+    def lookahead(self,k):
+        self.next()
+        while len(self.buffer) < k:
+            self.buffer.append(self._scan(None))
+        token, start = self.buffer[k-1] if k else (self.token,self.start)
+        return Lexeme(token,None,None,None,start)
+
+    def peek(self,tokens=None):
+        return self.lookahead(0)
+
+    def _where(self,offset):
+        "The ``(line, position)`` of `offset`, as lexers count them."
+        return (self.input.count("\n",0,offset) + 1,
+                offset - self.input.rfind("\n",0,offset))
+
+    def error(self,expected=None):
+        """The ``ParsingError`` for the next token: the terminal `expected`
+        if given, or else no token at all, was expected there. The message
+        is that of ``_rd_parse_plan``."""
+        token, start = self.token, self.start
+        line, position = self._where(start)
+        if token is EOF:
+            match, at = "EOF", (-1,-1)
+        else:
+            match, at = token.rule.match(self.input,start).group(0), (line,
+                                                                    position)
+        if expected is None:
+            error = ParsingError('Unexpected input "{}" on line {} at '
+                                 'position {}'.format(match,*at))
+        else:
+            error = ParsingError('Expected {} but found {} on line {} at '
+                                 'position {}'.format(expected.name,match,*at))
+        error.line, error.position, error.offset = line, position, start
+        return error
+
+def _uses(productions):
+    """Map each symbol to the ``(symbol, rule)`` productions (in `productions`)
+    whose rule uses it, once per production."""
+    result = {}
+    for symbol, rules in productions.items():
+        for rule,action in rules:
+            for item in set(rule):
+                if not item.terminal():
+                    result.setdefault(item,[]).append((symbol,rule))
+    return result
+
 def _update_follow(a,b):
     "Add new elements EXCEPT EPSILON from b to a. Return True if not no-op."
     b = b - {EPSILON}
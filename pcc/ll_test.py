@@ -8,12 +8,17 @@ ways, but most easily by going to the project root dir and executing
 ``python3 setup.py nosetests``.
 """
 
+import asyncio
+import json
+from random import Random
 import unittest
 
 import pcc.ll as ll
 from pcc.lexer import Lexer
 from pcc.symbols import Symbol, SymbolString
 import re
+import threading
+import time
 
 class LLTester(unittest.TestCase):
     """Test harness for ``pcc.ll.LLParser`` class.
@@ -135,3 +140,948 @@ class LLTester(unittest.TestCase):
         
         
 
+    def test_adaptive(self):
+        """ll.py: Test adaptive prediction for non-LL(1) grammars"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+
+        def grammar(p):
+            p.ap('S',"A",lambda x: x[0], start_production=True)
+            p.ap('A',"NUM '+' A",lambda x: int(x[0]) + x[2])
+            p.ap('A',"NUM '-' A",lambda x: int(x[0]) - x[2])
+            p.ap('A',"NUM",lambda x: int(x[0]))
+
+        p = ll.LLParser(lexer)
+        grammar(p)
+        with self.assertRaises(ll.GrammarError):
+            p.finalize()
+
+        p = ll.LLParser(lexer,adaptive=True)
+        grammar(p)
+        self.assertEqual(p.parse("1+2-3"),0)
+        self.assertEqual(p.parse("7"),7)
+        with self.assertRaises(ll.ParsingError):
+            p.parse("1+")
+
+    def test_adaptive_dfa_cache(self):
+        """ll.py: Test unbounded lookahead and lookahead DFA reuse"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer,adaptive=True)
+        p.ap('T',"S",lambda x: x[0], start_production=True)
+        p.ap('S',"X 'a'",lambda x: ('a',x[0]))
+        p.ap('S',"X 'b'",lambda x: ('b',x[0]))
+        p.ap('S',"X",lambda x: ('-',x[0]))
+        p.ap('X',"'(' X ')'",lambda x: x[1])
+        p.ap('X',"NUM",lambda x: int(x[0]))
+
+        self.assertEqual(p.parse("((((4)))) b"),('b',4))
+        self.assertEqual(p.parse("((((5)))) a"),('a',5))
+        self.assertEqual(p.parse("((((6))))"),('-',6))
+        states = len(p.predictor.states)
+        self.assertEqual(p.parse("((((7)))) b"),('b',7))
+        self.assertEqual(len(p.predictor.states),states)
+
+    def test_adaptive_left_recursion(self):
+        """ll.py: Test that adaptive mode rejects left recursion"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer,adaptive=True)
+        p.ap('E',"E '+' NUM",lambda x: x[0] + int(x[2]),
+             start_production=True)
+        p.ap('E',"NUM",lambda x: int(x[0]))
+        with self.assertRaises(ll.GrammarError):
+            p.finalize()
+
+    def test_push(self):
+        """ll.py: Test push-mode parsing of chunked input"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer)
+        p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+        p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+        p.ap('EP',"", lambda x: 0)
+        p.ap('T',"F TP", lambda x: x[0] * x[1])
+        p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+        p.ap('TP',"", lambda x: 1)
+        p.ap('F',"'(' E ')'", lambda x: x[1])
+        p.ap('F',"NUM", lambda x: int(x[0]))
+
+        for input in ("2+3*4", "5", "(12+2)*(3)", "1+((((((((((3))))))))))"):
+            for size in (1,2,5):
+                pp = p.pushparser()
+                for i in range(0,len(input),size):
+                    pp.feed(input[i:i+size])
+                self.assertEqual(pp.close(),p.parse(input))
+
+        pp = p.pushparser()
+        with self.assertRaises(ll.ParsingError):
+            pp.feed("2+*3")
+
+        pp = p.pushparser()
+        pp.feed("2+")
+        with self.assertRaises(ll.ParsingError):
+            pp.close()
+
+    def test_push_adaptive(self):
+        """ll.py: Test push-mode parsing with adaptive prediction"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer,adaptive=True)
+        p.ap('T',"S",lambda x: x[0], start_production=True)
+        p.ap('S',"X 'a'",lambda x: ('a',x[0]))
+        p.ap('S',"X 'b'",lambda x: ('b',x[0]))
+        p.ap('X',"'(' X ')'",lambda x: x[1])
+        p.ap('X',"NUM",lambda x: int(x[0]))
+
+        pp = p.pushparser()
+        for c in "((((4)))) b":
+            pp.feed(c)
+        self.assertEqual(pp.close(),('b',4))
+
+    def test_threads(self):
+        """ll.py: Test sharing one parser between threads"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer)
+        p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+        p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+        p.ap('EP',"", lambda x: 0)
+        p.ap('T',"F TP", lambda x: x[0] * x[1])
+        p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+        p.ap('TP',"", lambda x: 1)
+        p.ap('F',"'(' E ')'", lambda x: x[1])
+        p.ap('F',"NUM", lambda x: int(x[0]))
+
+        calls = []
+        finalize = p._finalize
+        def counting():
+            calls.append(1)
+            time.sleep(0.01)
+            finalize()
+        p._finalize = counting
+
+        barrier = threading.Barrier(8)
+        results = []
+        def work(n):
+            barrier.wait()
+            for i in range(20):
+                results.append(p.parse("{}*(1+{})".format(n,i)) ==
+                               n * (1 + i))
+        threads = [threading.Thread(target=work,args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls),1)
+        self.assertEqual(len(results),160)
+        self.assertTrue(all(results))
+
+        # Looking up FIRST sets does not change the finalized tables
+        before = len(p.FIRST)
+        p.first(SymbolString((Symbol('E'),Symbol('F'),Symbol('T'))))
+        self.assertEqual(len(p.FIRST),before)
+        with self.assertRaises(ValueError):
+            p.finalize()
+
+    def test_plans(self):
+        """ll.py: Test the values passed to actions by compiled plans"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(lexer)
+        p.ap('S',"L", lambda x: x, start_production=True)
+        p.ap('L',"NUM ',' L", lambda x: x)
+        p.ap('L',"'.' E", 'constant')
+        p.ap('L',"", lambda x: x)
+        p.ap('E',"", 'empty')
+
+        self.assertEqual(p.parse(""),[[None],'EOF'])
+        self.assertEqual(p.parse("1, 2, ."),
+                         [['1',',',['2',',','constant']],'EOF'])
+        self.assertEqual(p.plans[p.start_id].arity,2)
+        self.assertIs(lexer._literal(','),lexer._literal(','))
+
+        with self.assertRaises(ll.ParsingError):
+            p.parse("1 2")
+
+        # An empty start rule, which is (EPSILON, EOF)
+        from pcc.profiler import ParseProfile
+        for options in ({},{'k': 2},{'lazy': True},{'context_lexing': True},
+                        {'adaptive': True}):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"", lambda x: x, start_production=True)
+            self.assertEqual(p.parse(""),[None,'EOF'])
+            self.assertEqual(p.parse("",profile=ParseProfile()),[None,'EOF'])
+            self.assertEqual(p.parse("",errors=[]),[None,'EOF'])
+            self.assertEqual(p.parsetree("").fold(),[None,'EOF'])
+            push = p.pushparser()
+            push.feed("")
+            self.assertEqual(push.close(),[None,'EOF'])
+            with self.assertRaises(ll.ParsingError):
+                p.parse("1")
+        p = ll.LLParser(lexer)
+        p.ap('S',"", 'constant', start_production=True)
+        self.assertEqual(p.parse(""),'constant')
+        with self.assertRaises(ll.ParsingError):
+            p.parse(", 1")
+
+    def test_context_lexing(self):
+        """ll.py: Test lexing with only the tokens the parser expects"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='WORD',rule=r'[0-9a-z]+')
+        lexer.addtoken(name='LET',rule=r'let')
+        def grammar(p):
+            p.ap('S',"LET WORD '=' L", lambda x: (x[1],x[3]),
+                 start_production=True)
+            p.ap('L',"NUM L", lambda x: [int(x[0])] + x[1])
+            p.ap('L',"", lambda x: [])
+
+        p = ll.LLParser(lexer)
+        grammar(p)
+        # The full lexer finds WORD (the longest match) everywhere.
+        with self.assertRaises(ll.ParsingError):
+            p.parse("let let = 1 2")
+
+        p = ll.LLParser(lexer,context_lexing=True)
+        grammar(p)
+        self.assertEqual(p.parse("let let = 1 2"),('let',[1,2]))
+        self.assertEqual(p.parse("let x="),('x',[]))
+        with self.assertRaises(ll.ParsingError) as cm:
+            p.parse("let x = 1 y")
+        self.assertIn('"y"',str(cm.exception))
+        self.assertIn('position 11',str(cm.exception))
+
+    def test_ll_k(self):
+        """ll.py: Test LL(k) parsing with a fixed lookahead"""
+        lexer = Lexer()
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        def grammar(p):
+            p.ap('P',"SS", lambda x: x[0], start_production=True)
+            p.ap('SS',"S ';' SS", lambda x: [x[0]] + x[2])
+            p.ap('SS',"", lambda x: [])
+            p.ap('S',"NAME '=' V", lambda x: ('set',x[0],x[2]))
+            p.ap('S',"NAME O", lambda x: ('call',x[0],x[1]))
+            p.ap('O',"'(' V ')'", lambda x: x[1])
+            p.ap('O',"", lambda x: None)
+            p.ap('V',"NAME", lambda x: x[0])
+            p.ap('V',"NUM", lambda x: int(x[0]))
+
+        p = ll.LLParser(lexer)
+        grammar(p)
+        with self.assertRaises(ll.GrammarError):
+            p.finalize()
+
+        p = ll.LLParser(lexer,k=2)
+        grammar(p)
+        result = [('set','a',1),('call','f','a'),('call','g',None)]
+        self.assertEqual(p.parse("a = 1; f(a); g;"),result)
+        self.assertEqual(p.parsetree("a = 1; f(a); g;").fold(),result)
+        push = p.pushparser()
+        for chunk in "a = 1; f(a); g;":
+            push.feed(chunk)
+        self.assertEqual(push.close(),result)
+        with self.assertRaises(ll.ParsingError):
+            p.parse("a = ;")
+
+        # Needs three tokens to decide
+        p = ll.LLParser(lexer,k=2)
+        p.ap('S',"NAME NAME NUM", 'num', start_production=True)
+        p.ap('S',"NAME NAME NAME", 'name')
+        with self.assertRaises(ll.GrammarError):
+            p.finalize()
+        p = ll.LLParser(lexer,k=3)
+        p.ap('S',"A", lambda x: x[0], start_production=True)
+        p.ap('A',"NAME NAME NUM", 'num')
+        p.ap('A',"NAME NAME NAME", 'name')
+        self.assertEqual(p.parse("a b c"),'name')
+        self.assertEqual(p.parse("a b 1"),'num')
+
+        with self.assertRaises(ValueError):
+            ll.LLParser(lexer,adaptive=True,k=2)
+
+    def test_ring_lexeme_iterator(self):
+        """ll.py: Test the k-lexeme ring buffer"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexemes = ll._RingLexemeIterator(lexer,"1 2 3 4 5",3)
+        self.assertEqual(lexemes.lookahead(2).match,'3')
+        result = []
+        while lexemes.peek().match != 'EOF':
+            self.assertEqual(lexemes.lookahead(0),lexemes.peek())
+            result.append((lexemes.poll().match,lexemes.lookahead(2).match))
+        self.assertEqual(result,[('1','4'),('2','5'),('3','EOF'),
+                                 ('4','EOF'),('5','EOF')])
+        with self.assertRaises(ValueError):
+            lexemes.lookahead(3)
+
+    def test_lazy(self):
+        """ll.py: Test building the parse table on demand"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        def grammar(p):
+            p.ap('T',"S",lambda x: x[0],start_production=True)
+            p.ap('S',"'n' N",lambda x: x[1])
+            p.ap('S',"'b' B",lambda x: x[1])
+            p.ap('N',"NUM N",lambda x: [int(x[0])] + x[1])
+            p.ap('N',"",lambda x: [])
+            # Not LL(1), but only noticed when B is used
+            p.ap('B',"NUM",lambda x: 'one')
+            p.ap('B',"NUM NUM",lambda x: 'two')
+
+        p = ll.LLParser(lexer,lazy=True)
+        grammar(p)
+        p.finalize()
+        self.assertEqual(len(p.ptable),0)
+        self.assertEqual(p.parse("n 1 2 3"),[1,2,3])
+        self.assertEqual(set(p.ptable),{Symbol('S'),Symbol('N')})
+        self.assertEqual(p.parsetree("n 4 5").fold(),[4,5])
+        with self.assertRaises(ll.GrammarError):
+            p.parse("b 1")
+
+        p = ll.LLParser(lexer,lazy=True,k=2)
+        grammar(p)
+        self.assertEqual(p.parse("b 1"),'one')
+        self.assertEqual(p.parse("b 1 2"),'two')
+
+        # Each row is built once, even with concurrent first uses
+        p = ll.LLParser(lexer,lazy=True)
+        grammar(p)
+        p.finalize()
+        rows = []
+        build = p._lazy_row
+        def counting(symbol):
+            rows.append(symbol)
+            time.sleep(0.01)
+            return build(symbol)
+        p._lazy_row = counting
+        barrier = threading.Barrier(4)
+        results = []
+        def work():
+            barrier.wait()
+            results.append(p.parse("n 1 2"))
+        threads = [threading.Thread(target=work) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results,[[1,2]] * 4)
+        self.assertEqual(sorted(s.name for s in rows),['N','S'])
+
+    def test_update(self):
+        """ll.py: Test changing the grammar after finalizing"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        for lazy in (False,True):
+            p = ll.LLParser(lexer,lazy=lazy)
+            p.ap('T',"S",lambda x: x[0],start_production=True)
+            p.ap('S',"NUM L",lambda x: [int(x[0])] + x[1])
+            p.ap('L',"',' NUM L",lambda x: [int(x[1])] + x[2])
+            p.ap('L',"",lambda x: [])
+            self.assertEqual(p.parse("1, 2"),[1,2])
+            tree = p.parsetree("1, 2")
+
+            # A new alternative, with a new nonterminal and terminal
+            p.update(add=[('S',"'[' I ']'",lambda x: x[1]),
+                          ('I',"S",lambda x: x[0])])
+            self.assertEqual(p.parse("[1, 2]"),[1,2])
+            self.assertEqual(p.parse("[[3]]"),[3])
+            self.assertEqual(p.version,1)
+            self.assertEqual(p.reparse(tree,4,4,", 3").fold(),[1,2,3])
+
+            # A conflict is rejected, and nothing changes (lazy parsers
+            # only notice when the row is used, as with finalize)
+            conflict = ('L',"',' NUM",lambda x: [int(x[1])])
+            if lazy:
+                p.update(add=[conflict])
+                with self.assertRaises(ll.GrammarError):
+                    p.parse("1, 2")
+                p.update(remove=[conflict[:2]])
+            else:
+                with self.assertRaises(ll.GrammarError):
+                    p.update(add=[conflict])
+                self.assertEqual(p.version,1)
+            self.assertEqual(p.parse("[1, 2]"),[1,2])
+
+            p.removeproduction('S',"'[' I ']'")
+            with self.assertRaises(ll.ParsingError):
+                p.parse("[1]")
+            self.assertEqual(p.parse("4"),[4])
+
+            with self.assertRaises(ll.GrammarError):
+                p.removeproduction('T',"S")
+            with self.assertRaises(ll.GrammarError):
+                p.removeproduction('S',"NUM NUM")
+            with self.assertRaises(ll.GrammarError):
+                p.ap('U',"S",None,start_production=True)
+
+    def test_tables(self):
+        """ll.py: Test finalizing with the tables of another parser"""
+        lexer = Lexer()
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('P',"SS", lambda x: x[0], start_production=True)
+            p.ap('SS',"S ';' SS", lambda x: [x[0]] + x[2])
+            p.ap('SS',"", lambda x: [])
+            p.ap('S',"NAME '=' V", lambda x: ('set',x[0],x[2]))
+            p.ap('S',"NAME O", lambda x: ('call',x[0],x[1]))
+            p.ap('O',"'(' V ')'", lambda x: x[1])
+            p.ap('O',"", lambda x: None)
+            p.ap('V',"NAME", lambda x: x[0])
+            p.ap('V',"NUM", lambda x: int(x[0]))
+            return p
+
+        result = [('set','a',1),('call','f','a'),('call','g',None)]
+        for options in ({'k': 2},{'k': 2,'lazy': True},{'adaptive': True}):
+            p = grammar(**options)
+            tables = p.tables()
+            # Plain data, which survives JSON
+            tables = json.loads(json.dumps(tables))
+            q = grammar(**options)
+            q.finalize(tables)
+            self.assertEqual(q.parse("a = 1; f(a); g;"),result)
+            self.assertEqual(q.FIRST,p.FIRST)
+            self.assertEqual(q.FOLLOW,p.FOLLOW)
+            self.assertEqual(q.tables(),tables)
+            q.update(add=[('V',"'-' NUM",lambda x: -int(x[1]))])
+            self.assertEqual(q.parse("a = -1;"),[('set','a',-1)])
+
+            # Other options, or another grammar, don't fit
+            with self.assertRaises(ValueError):
+                grammar(k=3).finalize(tables)
+            q = grammar(**options)
+            q.ap('V',"'-' NUM",lambda x: -int(x[1]))
+            with self.assertRaises(ValueError):
+                q.finalize(tables)
+            q = grammar(**options)
+            q.ap('O',"'[' V ']'",lambda x: x[1])
+            with self.assertRaises(ValueError):
+                q.finalize(tables)
+            q.finalize()
+            self.assertEqual(q.parse("f[1];"),[('call','f',1)])
+
+    def test_expression(self):
+        """ll.py: Test operator precedence expressions"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"E",lambda x: x[0],start_production=True)
+            p.addexpression('E',"F",[
+                ("'='",1,'right',lambda x: ('=',x[0],x[2])),
+                ("'+'",2,'left',lambda x: ('+',x[0],x[2])),
+                ("'-'",2,'left',lambda x: ('-',x[0],x[2])),
+                ("'*'",3,'left',lambda x: ('*',x[0],x[2])),
+                ("'^'",4,'right',lambda x: ('^',x[0],x[2])),
+                ("'.'",5,'left','dot')])
+            p.ap('F',"NUM",lambda x: int(x[0]))
+            p.ap('F',"NAME",lambda x: x[0])
+            p.ap('F',"'-' F",lambda x: ('neg',x[1]))
+            p.ap('F',"'(' E ')'",lambda x: x[1])
+            return p
+
+        cases = [
+            ("1",1),
+            ("1 - 2 + 3",('+',('-',1,2),3)),
+            ("1 + 2 * 3",('+',1,('*',2,3))),
+            ("1 * 2 + 3",('+',('*',1,2),3)),
+            ("2 ^ 3 ^ 4 * 5",('*',('^',2,('^',3,4)),5)),
+            ("a = b = 1 + - 2",('=','a',('=','b',('+',1,('neg',2))))),
+            ("(1 + 2) * - (3 - 4) ^ 2",
+             ('*',('+',1,2),('^',('neg',('-',3,4)),2))),
+            ("a . b * 2",('*','dot',2)),
+            ("1 * 2 * 3 ^ 4 + 5 = 6",
+             ('=',('+',('*',('*',1,2),('^',3,4)),5),6)),
+        ]
+        from pcc.profiler import ParseProfile
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            for text, result in cases:
+                self.assertEqual(p.parse(text),result)
+                self.assertEqual(p.parsetree(text).fold(),result)
+                self.assertEqual(p.parse(text,profile=ParseProfile()),result)
+                push = p.pushparser()
+                push.feed(text)
+                self.assertEqual(push.close(),result)
+            for text in ("1 +","1 2","+ 1","(1 + 2","1 + * 2"):
+                with self.assertRaises(ll.ParsingError):
+                    p.parse(text)
+
+        # An expression added after finalizing
+        p = ll.LLParser(lexer)
+        p.ap('S',"V",lambda x: x[0],start_production=True)
+        p.ap('V',"NUM",lambda x: int(x[0]))
+        p.finalize()
+        p.addexpression('L',"NUM",[("','",1,'left',
+                                    lambda x: x[0] + [int(x[2])]
+                                    if isinstance(x[0],list)
+                                    else [int(x[0]),int(x[2])])])
+        p.ap('V',"'[' L ']'",lambda x: x[1])
+        self.assertEqual(p.parse("[1, 2, 3]"),[1,2,3])
+        self.assertEqual(p.parse("[1]"),'1')
+
+        p = grammar()
+        with self.assertRaises(ll.GrammarError):
+            p.addexpression('E',"F",[])
+        with self.assertRaises(ll.GrammarError):
+            p.addexpression('G',"F F",[])
+        with self.assertRaises(ll.GrammarError):
+            p.addexpression('G',"F",[("F",1,'left',None)])
+        with self.assertRaises(ValueError):
+            p.addexpression('G',"F",[("'+'",1,'none',None)])
+        # Operators that may also follow the expression are a conflict
+        p.ap('F',"'[' E '+' ']'",None)
+        with self.assertRaises(ll.GrammarError):
+            p.finalize()
+
+    def test_repetition(self):
+        """ll.py: Test repetition, options and groups in rules"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"V",lambda x: x[0],start_production=True)
+            p.ap('V',"'[' (V (',' V)*)? ']'",
+                 lambda x: [] if x[1] is None
+                 else [x[1][0]] + [item[1] for item in x[1][1]])
+            p.ap('V',"NAME+ '!'?",lambda x: (x[0],x[1]))
+            p.ap('V',"NUM",lambda x: int(x[0]))
+            p.ap('V',"'<' (NUM ';')* '>'",lambda x: x[1])
+            return p
+
+        cases = [
+            ("[]",[]),
+            ("1",1),
+            ("[1, 2, [3], []]",[1,2,[3],[]]),
+            ("a b !",(['a','b'],'!')),
+            ("[a, b c]",[(['a'],None),(['b','c'],None)]),
+            ("<1 ; 2 ;>",[['1',';'],['2',';']]),
+            ("<>",[]),
+        ]
+        from pcc.profiler import ParseProfile
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            for text, result in cases:
+                self.assertEqual(p.parse(text),result)
+                self.assertEqual(p.parsetree(text).fold(),result)
+                self.assertEqual(p.parse(text,profile=ParseProfile()),result)
+                push = p.pushparser()
+                push.feed(text)
+                self.assertEqual(push.close(),result)
+            for text in ("[1,]","[1 2]","!","<1>","[,1]"):
+                with self.assertRaises(ll.ParsingError):
+                    p.parse(text)
+
+        # The helpers are plain productions, shared by equal parts
+        p = grammar()
+        p.ap('W',"NAME+",None)
+        p.finalize()
+        names = sorted(symbol.name for symbol in p.productions)
+        self.assertEqual(names,['S','V','V_GROUP1','V_GROUP2','V_GROUP3',
+                                'V_OPT1','V_OPT2','V_PLUS1','V_STAR1',
+                                'V_STAR2','V_STAR3','W'])
+        self.assertEqual(str(p.productions[Symbol('W')][0][0]),'V_PLUS1')
+
+        # Long repetitions are parsed by looping
+        text = "[" + ", ".join(str(i) for i in range(100000)) + "]"
+        self.assertEqual(p.parse(text),list(range(100000)))
+
+        # Adding and removing productions after finalizing
+        p.update(add=[('V',"'{' (NAME ':' V ';')* '}'",
+                       lambda x: dict((k, v) for k, c, v, s in x[1]))])
+        self.assertEqual(p.parse("{a: 1; b: {};}"),{'a': 1,'b': {}})
+        p.removeproduction('V',"NAME+ '!'?")
+        with self.assertRaises(ll.ParsingError):
+            p.parse("a")
+        self.assertEqual(p.parse("<1;>"),[['1',';']])
+
+        for rule in ("*","( )","(NUM","NUM)","'[' (+ ']')"):
+            with self.assertRaises(ll.GrammarError):
+                ll.LLParser(lexer).ap('S',rule,None)
+
+    def test_validate(self):
+        """ll.py: Test recognizing input without building its value"""
+        from pcc.generate import Generator
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        calls = []
+        def grammar(**options):
+            def action(x):
+                calls.append(x)
+                return x
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"E",action,start_production=True)
+            p.addexpression('E',"F",[("'+'",1,'left',action),
+                                     ("'*'",2,'left',action)])
+            p.ap('F',"NUM",action)
+            p.ap('F',"NAME ('(' (E (',' E)*)? ')')?",action)
+            p.ap('F',"'[' L ']'",action)
+            p.ap('L',"E ';' L",action)
+            p.ap('L',"",action)
+            return p
+
+        random = Random(7)
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            g = Generator(p,seed=3)
+            for i in range(30):
+                text = g.sentence(size=30)
+                self.assertIsNone(p.validate(text),text)
+                # Break it, and get the error of parse
+                words = text.split()
+                index = random.randrange(len(words))
+                words[index:index + 1] = [random.choice(
+                    ['+','(',')',';','[',']','1','a','',words[index] * 2])]
+                broken = " ".join(words)
+                try:
+                    p.parse(broken)
+                    error = None
+                except ll.ParsingError as e:
+                    error = str(e)
+                result = p.validate(broken)
+                self.assertEqual(result and str(result),error,broken)
+            calls.clear()
+            self.assertIsNone(p.validate("f(1, [2; 3 * g;]) + x"))
+            self.assertEqual(calls,[])
+
+        p = grammar()
+        error = p.validate("1 +\n  [2; 3 *;]")
+        self.assertEqual((error.line,error.position,error.offset),(2,10,13))
+        self.assertEqual(str(error),'Unexpected input ";" on line 2 at '
+                                    'position 10')
+        error = p.validate("1 + ~")
+        self.assertIsInstance(error,ll.ParsingError)
+        self.assertEqual(error.offset,4)
+        error = p.validate("f(1")
+        self.assertEqual((error.line,error.position,error.offset),(1,4,3))
+
+        # Tail calls don't nest, so long lists need no recursion
+        text = "[" + "1;" * 100000 + "]"
+        self.assertIsNone(p.validate(text))
+        self.assertIsNotNone(p.validate(text[:-1]))
+
+        # An empty start rule
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"",None,start_production=True)
+            self.assertIsNone(p.validate(""))
+            self.assertIsNone(p.validate("  "))
+            error = p.validate("a")
+            self.assertIsInstance(error,ll.ParsingError)
+            self.assertEqual(error.offset,0)
+
+    def test_list(self):
+        """ll.py: Test lists with bulk reducers"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        calls = []
+        def reducer(texts):
+            calls.append(len(texts))
+            return [int(text) for text in texts]
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"V",lambda x: x[0],start_production=True)
+            p.ap('V',"'[' L? ']'",lambda x: x[1] or [])
+            p.ap('V',"'<' W '>'",lambda x: x[1])
+            p.addlist('L',"NUM",reducer,"','")
+            p.addlist('W',"NAME"," ".join)
+            return p
+
+        cases = [("[]",[]),("[1]",[1]),("[1, 2, 3]",[1,2,3]),
+                 ("<a b c>","a b c")]
+        from pcc.profiler import ParseProfile
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            for text, result in cases:
+                self.assertEqual(p.parse(text),result)
+                self.assertEqual(p.parsetree(text).fold(),result)
+                self.assertEqual(p.parse(text,profile=ParseProfile()),result)
+                push = p.pushparser()
+                push.feed(text)
+                self.assertEqual(push.close(),result)
+                self.assertIsNone(p.validate(text))
+            for text in ("[1,]","[1 2]","[,]","<>","<a 1>"):
+                with self.assertRaises(ll.ParsingError):
+                    p.parse(text)
+
+        # One call of the reducer per list
+        p = grammar()
+        calls.clear()
+        text = "[" + ", ".join(str(i) for i in range(100000)) + "]"
+        self.assertEqual(p.parse(text),list(range(100000)))
+        self.assertEqual(calls,[100000])
+
+        # A trailing separator takes two tokens of lookahead
+        for options in ({'k': 2},{'adaptive': True}):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"'[' L ','? ']'",lambda x: x[1],start_production=True)
+            p.addlist('L',"NUM",reducer,"','")
+            self.assertEqual(p.parse("[1, 2, 3]"),[1,2,3])
+            self.assertEqual(p.parse("[1, 2,]"),[1,2])
+            self.assertEqual(p.parsetree("[1,]").fold(),[1])
+
+        # Lists added after finalizing
+        p = grammar()
+        p.finalize()
+        p.addlist('M',"NAME",len,"';'")
+        p.update(add=[('V',"'{' M '}'",lambda x: x[1])])
+        self.assertEqual(p.parse("{a; b}"),2)
+
+        with self.assertRaises(ll.GrammarError):
+            p.addlist('L',"NUM",reducer)
+        with self.assertRaises(ll.GrammarError):
+            grammar().addlist('X',"V",reducer)
+        with self.assertRaises(ll.GrammarError):
+            grammar().addlist('X',"NUM",reducer,"V")
+
+    def test_recovery(self):
+        """ll.py: Test recovering from syntax errors"""
+        from pcc.generate import Generator
+        from pcc.profiler import ParseProfile
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"STMT*",lambda x: x[0],start_production=True)
+            p.ap('STMT',"NAME '=' E ';'",lambda x: (x[0],x[2]))
+            p.ap('STMT',"'{' STMT* '}'",lambda x: x[1])
+            p.addexpression('E',"F",[("'+'",1,'left',
+                                      lambda x: x[0] + x[2])])
+            p.ap('F',"NUM",lambda x: int(x[0]))
+            p.ap('F',"'(' E ')'",lambda x: x[1])
+            p.ap('F',"'[' L? ']'",lambda x: sum(x[1] or []))
+            p.addlist('L',"NUM",lambda texts: [int(t) for t in texts],"','")
+            return p
+
+        text = ("a = 1 + 2;\n"
+                "b = 1 + ;\n"
+                "{ c = (2 + 3; d = 4; }\n"
+                "e = [1, 2 3];\n"
+                "f 5;\n"
+                "g = 6;")
+        for options in ({},{'lazy': True},{'context_lexing': True},
+                        {'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            errors = []
+            result = p.parse(text,errors=errors,sync=["';'"])
+            self.assertEqual([(e.line,e.position) for e in errors],
+                             [(2,9),(3,13),(4,11),(5,3)])
+            self.assertEqual(str(errors[0]),'Unexpected input ";" on line 2 '
+                                            'at position 9')
+            self.assertEqual(result[0],('a',3))
+            self.assertEqual(result[1],('b',None))
+            self.assertEqual(result[2][1],('d',4))
+            self.assertEqual(result[4],('f',5))
+            self.assertEqual(result[5],('g',6))
+
+            # Without errors, the same as parse
+            errors = []
+            self.assertEqual(p.parse("a = [1, 2] + 3; {}",errors=errors),
+                             p.parse("a = [1, 2] + 3; {}"))
+            self.assertEqual(errors,[])
+
+        # The first error is that of parse, and recovery always ends
+        p = grammar()
+        g = Generator(p,seed=5)
+        random = Random(11)
+        for i in range(100):
+            words = g.sentence(size=40).split()
+            for j in range(random.randint(1,4)):
+                index = random.randrange(len(words))
+                words[index:index + 1] = [random.choice(
+                    ['+','(',')',';','[',']','{','}','=','1','a','',','])]
+            broken = " ".join(words)
+            try:
+                p.parse(broken)
+                error = None
+            except ll.ParsingError as e:
+                error = str(e)
+            errors = []
+            p.parse(broken,errors=errors)
+            self.assertEqual(str(errors[0]) if errors else None,error)
+
+        # Long repetitions don't recurse
+        errors = []
+        result = p.parse("x = 1;" * 20000 + "y = ;" + "z = 2;",errors=errors)
+        self.assertEqual((len(result),len(errors)),(20002,1))
+
+        with self.assertRaises(ValueError):
+            p.parse("a = 1;",errors=[],profile=ParseProfile())
+        with self.assertRaises(ValueError):
+            p.parse("a = 1;",errors=[],sync=['E'])
+        # Actions fail as usual, but for the values that are missing after
+        # an error
+        p = grammar()
+        p.ap('F',"NAME",lambda x: int(x[0]))
+        p.ap('F',"'-' NUM",lambda x: 1 // int(x[1]))
+        with self.assertRaises(ValueError):
+            p.parse("a = b;",errors=[])
+        with self.assertRaises(ValueError):
+            p.parse("a = ; c = b;",errors=[])
+        with self.assertRaises(ZeroDivisionError):
+            p.parse("a = 1 + ; c = 1 + -0;",errors=[])
+        errors = []
+        self.assertEqual(p.parse("a = ; c = (1 + ) + 2; d = 1;",
+                                 errors=errors),
+                         [('a',None),('c',None),('d',1)])
+        self.assertEqual(len(errors),2)
+
+    def test_aparse(self):
+        """ll.py: Test asynchronous parsing"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        def grammar(calls=False,**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"STMT*",lambda x: x[0],start_production=True)
+            p.ap('STMT',"NAME '=' E ';'",lambda x: (x[0],x[2]))
+            if calls:
+                # Not LL(1)
+                p.ap('STMT',"NAME '(' E ')' ';'",
+                     lambda x: ('call',x[0],x[2]))
+            p.ap('STMT',"'[' L? ']'",lambda x: x[1] or [])
+            p.addexpression('E',"F",[
+                ("'+'",1,'left',lambda x: x[0] + x[2]),
+                ("'*'",2,'left',lambda x: x[0] * x[2])])
+            p.ap('F',"NUM",lambda x: int(x[0]))
+            p.ap('F',"'(' E ')'",lambda x: x[1])
+            p.addlist('L',"NUM",len,"','")
+            return p
+        async def chunks(text,size):
+            for i in range(0,len(text),size):
+                yield text[i:i + size]
+        async def stream(data):
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return reader
+        for options in ({},{'lazy': True},{'k': 2,'calls': True},
+                        {'adaptive': True,'calls': True}):
+            p = grammar(**options)
+            text = "a = 1 + 2 * (3 + 4); [1, 2, 3] [] b = 6;" * 20
+            if options.get('calls'):
+                text += "f(5); g(6 * 7);"
+            expected = p.parse(text)
+            for size in (1,7,1000):
+                self.assertEqual(asyncio.run(p.aparse(chunks(text,size),
+                                                      every=size)),expected)
+            async def main():
+                return await p.aparse(await stream(text.encode('utf-16')),
+                                      encoding='utf-16')
+            self.assertEqual(asyncio.run(main()),expected)
+            with self.assertRaises(ll.ParsingError):
+                asyncio.run(p.aparse(chunks("a = 1 +;",3)))
+
+        # Other tasks have their turn while a long input is parsed
+        p = grammar()
+        text = "a = 1;" * 20000
+        async def main():
+            turns = []
+            async def other():
+                while True:
+                    turns.append(len(turns))
+                    await asyncio.sleep(0)
+            task = asyncio.create_task(other())
+            await asyncio.sleep(0)
+            result = await p.aparse(await stream(text.encode()),every=100)
+            task.cancel()
+            return result, len(turns)
+        result, turns = asyncio.run(main())
+        self.assertEqual(len(result),20000)
+        self.assertGreaterEqual(turns,400)
+
+        push = p.pushparser()
+        push.push(lexer.lex("a = 1; b"))
+        push.push(lexer.lex("= 2;"))
+        self.assertEqual(push.close(),[('a',1),('b',2)])
+        with self.assertRaises(ValueError):
+            push.push([])
+
+        # An empty start rule
+        for options in ({},{'lazy': True},{'k': 2},{'adaptive': True}):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"",lambda x: x,start_production=True)
+            push = p.pushparser()
+            push.feed("")
+            self.assertEqual(push.close(),[None,'EOF'])
+            self.assertEqual(asyncio.run(p.aparse(chunks("",1))),
+                             [None,'EOF'])
+            self.assertEqual(asyncio.run(p.aparse(chunks(" \n ",1))),
+                             [None,'EOF'])
+            with self.assertRaises(ll.ParsingError):
+                asyncio.run(p.aparse(chunks("a",1)))
+
+    def test_prefetch(self):
+        """ll.py: Test lexing ahead in a thread of its own"""
+        from pcc.cache import ResultCache
+        from pcc.limits import Limits, TokenLimitExceeded
+        from pcc.profiler import ParseProfile
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        lexer.addtoken(name='NAME',rule=r'[a-z]+')
+        def grammar(**options):
+            p = ll.LLParser(lexer,**options)
+            p.ap('S',"STMT*",lambda x: x[0],start_production=True)
+            p.ap('STMT',"NAME '=' E ';'",lambda x: (x[0],x[2]))
+            p.ap('STMT',"'[' NUM* ']'",lambda x: x[1])
+            if 'k' in options or 'adaptive' in options:
+                # Not LL(1)
+                p.ap('STMT',"NAME '(' E ')' ';'",
+                     lambda x: ('call',x[0],x[2]))
+            p.ap('E',"NUM",lambda x: int(x[0]))
+            p.ap('E',"NAME",lambda x: x[0])
+            return p
+        threads = threading.active_count()
+        for options in ({},{'k': 2},{'adaptive': True}):
+            p = grammar(**options)
+            text = "a = 1; [1 2 3] b = c; []" * 50
+            if options:
+                text += "f(5);"
+            expected = p.parse(text)
+            for size in (1,2,7,1000):
+                self.assertEqual(p.parse(text,prefetch=size),expected)
+            self.assertEqual(p.parse("",prefetch=10),[])
+            self.assertEqual(p.parse(text,prefetch=5,
+                                     profile=ParseProfile()),expected)
+            errors = []
+            self.assertEqual(p.parse("a = ; b = 1;",prefetch=1,
+                                     errors=errors),[('a',None),('b',1)])
+            self.assertEqual(len(errors),1)
+            # Errors stop the thread, wherever it has got to
+            with self.assertRaises(ll.ParsingError):
+                p.parse("a = = 1;" * 1000,prefetch=3)
+            with self.assertRaises(TokenLimitExceeded):
+                p.parse(text,prefetch=3,limits=Limits(max_tokens=10))
+
+        strict = Lexer(report_literals=False)
+        strict.addtoken(name='NUM',rule=r'[0-9]+')
+        p = ll.LLParser(strict)
+        p.ap('S',"NUM*",lambda x: x[0],start_production=True)
+        self.assertEqual(p.parse("1 2 3",prefetch=2),['1','2','3'])
+        for size in (1,3,100):
+            with self.assertRaises(ValueError):
+                p.parse("1 2 3 4 5 ~",prefetch=size)
+        with self.assertRaises(ValueError):
+            p.parse("1",prefetch=2,cache=ResultCache())
+        with self.assertRaises(ValueError):
+            grammar(context_lexing=True).parse("a = 1;",prefetch=2)
+
+        for i in range(100):
+            if threading.active_count() <= threads:
+                break
+            time.sleep(0.01)
+        self.assertEqual(threading.active_count(),threads)
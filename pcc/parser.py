@@ -26,6 +26,12 @@ value as the result for that expression.
 # <http://www.gnu.org/licenses/>.
 
 from abc import ABCMeta,abstractmethod
+import multiprocessing
+import os
+import re
+
+from pcc.lexer import LexingError, _text_chunks
+from pcc.symbols import Symbol, EPSILON
 
 def parser(lexer):
     """Create a Parser using the default algorithm."""
@@ -38,8 +44,14 @@ class GrammarError(Exception):
     pass
 
 class ParsingError(Exception):
-    "Exception raised by a ``parser.Parser`` object when a syntax error occurs."
-    pass
+    """Exception raised by a ``parser.Parser`` object when a syntax error occurs.
+
+    ``line``, ``position`` and ``offset`` (the index in the input) locate the
+    error, where the parser tells them - otherwise they are None.
+    """
+    line = None
+    position = None
+    offset = None
 
 class Parser(metaclass=ABCMeta):
     """CFG parser of arbitrary BNF-like grammars.
@@ -99,10 +111,87 @@ class Parser(metaclass=ABCMeta):
 
     """
 
+    # Implementations that have a 'parser generation' step set this to False
+    # until ``finalize`` has been called.
+    finalized = True
+
     def ap(self,*args,**kwargs):
         """A shorthand for ``addproduction``."""
         self.addproduction(*args,**kwargs)
 
+    def finalize(self):
+        """Prepare the parser to call ``parse``, once all productions have been
+        added. Implementations that need to do this override this method, and
+        call it automatically from ``parse`` if need be.
+        """
+        pass
+
+    def parse_many(self,inputs,workers=None,chunksize=None,ordered=True,
+                   factory=None):
+        """Parse each string in `inputs` with a pool of `workers` processes.
+
+        This is a generator. If `ordered` is True it yields one result for
+        each input, in the order of `inputs`; otherwise it yields
+        ``(index, result)`` pairs as soon as each result is ready, where
+        `index` is the position of the input in `inputs`. A ``ParsingError``
+        does not stop the batch - the exception object is yielded in place
+        of that input's result instead, as is the ``ParsingError`` for a
+        lexing error (see ``validate``.) Any other exception is raised.
+
+        `workers` defaults to the number of CPUs. The parser is set up once
+        per worker process, not once per input: by default the finalized
+        parser itself is handed to each worker when the pool starts, which
+        works even with lambda actions on platforms that can ``fork``.
+        Otherwise (or to build the parser in the worker instead) pass a
+        picklable, module-level `factory` function that returns an
+        equivalent parser. Inputs are sent to the workers in batches of
+        `chunksize`, which defaults to a size that gives each worker about
+        four batches. Results must be picklable.
+
+        With ``workers=1`` the inputs are parsed in this process.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if factory is None and not self.finalized:
+            # Finalize here, not once per worker.
+            self.finalize()
+
+        if workers <= 1:
+            parser = self if factory is None else factory()
+            for index, input in enumerate(inputs):
+                try:
+                    result = parser.parse(input)
+                except ParsingError as e:
+                    result = e
+                except LexingError as e:
+                    result = _syntax_error(e)
+                yield result if ordered else (index,result)
+            return
+
+        if chunksize is None:
+            if hasattr(inputs,'__len__'):
+                chunksize, extra = divmod(len(inputs),workers * 4)
+                if extra:
+                    chunksize += 1
+                chunksize = max(chunksize,1)
+            else:
+                chunksize = 64
+
+        if factory is None and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        initargs = (self,None) if factory is None else (None,factory)
+
+        with context.Pool(workers,_init_worker,initargs) as pool:
+            if ordered:
+                for index, result in pool.imap(_parse_one,enumerate(inputs),
+                                               chunksize):
+                    yield result
+            else:
+                yield from pool.imap_unordered(_parse_one,enumerate(inputs),
+                                               chunksize)
+
     @abstractmethod
     def addproduction(self,symbol,rule,action, start_production=False):
         """Add a production (rule) to the grammar of the parser. Instructs the
@@ -167,6 +256,23 @@ class Parser(metaclass=ABCMeta):
         literals, so it is generally suggested to wrap such keywords in a
         token specificically for that keyword instead.
 
+        **Repetition, Options and Groups**
+
+        A symbol of the rule may be followed by ``*`` (any number of times,
+        including none), ``+`` (at least once) or ``?`` (optional), and
+        symbols may be grouped with parentheses, as in ``"NUM (',' NUM)*"``.
+        (The operators need no spaces around them, and the quoted literals
+        ``'('``, ``'*'`` and so on are still literals.) The value passed to
+        `action` for a repeated part is the list of its values, for an
+        optional part its value or ``None``, and for a group the list of the
+        values of its symbols (or the value itself, for a group of one.)
+
+        Such parts are replaced by helper nonterminals named after `symbol`,
+        such as ``L_STAR1``, whose productions are added as well - which is
+        what FIRST and FOLLOW sets, parse trees and the like show. Parsers
+        are free to parse repetitions by looping rather than by recursion
+        (``pcc.ll.LLParser`` does.)
+
         """
         raise NotImplementedError("Attempt to call an abstract method.")
 
@@ -181,3 +287,294 @@ class Parser(metaclass=ABCMeta):
         """
         raise NotImplementedError("Attempt to call an abstract method.")
 
+    async def aparse(self,reader,every=1024,encoding='utf-8'):
+        """Parse the input that arrives from `reader` (an
+        ``asyncio.StreamReader``, or an asynchronous iterator of chunks - see
+        ``pcc.lexer.Lexer.alex``), and return what ``parse`` would have.
+
+        This implementation reads all of the input and then parses it with
+        ``parse``, which holds up the event loop until it is done (`every`
+        is for the parsers that do better.) ``pcc.peg.PEGParser`` lexes the
+        input as it arrives, giving other tasks a turn every `every` tokens,
+        and ``pcc.ll.LLParser`` parses it as it arrives too.
+        """
+        chunks = []
+        async for chunk in _text_chunks(reader,encoding,1 << 16):
+            chunks.append(chunk)
+        return self.parse("".join(chunks))
+
+    def validate(self,input):
+        """Check that `input` is in the language of the grammar, without
+        needing its value.
+
+        Returns None if it is, or otherwise the ``ParsingError`` (not raised)
+        for the first error, which lexing errors are reported as too. Errors
+        raised by the semantic actions are not caught.
+        """
+        try:
+            self._recognize(input)
+        except ParsingError as e:
+            return e
+        except LexingError as e:
+            return _syntax_error(e)
+        return None
+
+    def _recognize(self,input):
+        """Raise ``ParsingError`` (or ``pcc.lexer.LexingError``) unless
+        `input` is in the language, for ``validate``. This implementation
+        simply parses the input - actions and all - but parsers may
+        recognize it much more cheaply (as ``pcc.peg.PEGParser`` does, and
+        ``pcc.ll.LLParser`` has a ``validate`` of its own.)
+        """
+        self.parse(input)
+
+# The parts of a rule with repetition, options or groups: quoted literals,
+# the operators, and symbol names
+_RULE_PART = re.compile(r"'.'|[()*+?]|[^\s()*+?]+")
+_EBNF_OPERATOR = re.compile(r"[()*+?]")
+
+def _expand(symbol,rule,action,helpers,defined):
+    """Expand the repetitions, options and groups of the production `symbol`
+    -> `rule` with `action` (see ``Parser.addproduction``) into plain
+    productions.
+
+    Returns a list of ``(symbol, rule, action)`` productions: first the
+    production itself, with each such part of the rule replaced by a helper
+    nonterminal, and then the productions of the helpers that are new.
+    `helpers` maps the ``(kind, parts)`` key of every helper made so far to
+    its name, and is added to. `defined(name)` tells whether a name is
+    already used by the grammar. A rule without any of the operators is
+    returned as it is.
+
+    >>> helpers = {}
+    >>> for production in _expand('L',"'[' (NUM ','?)* ']'",None,helpers,
+    ...                           lambda name: False):
+    ...     print(production[:2])
+    ('L', "'[' L_STAR1 ']'")
+    ('L_OPT1', "','")
+    ('L_OPT1', '')
+    ('L_GROUP1', 'NUM L_OPT1')
+    ('L_STAR1', 'L_GROUP1 L_STAR1')
+    ('L_STAR1', '')
+    """
+    if not _EBNF_OPERATOR.search(re.sub(r"'.'","",rule)):
+        return [(symbol,rule,action)]
+    parts = _RULE_PART.findall(rule)
+    productions = []
+    position = 0
+
+    def helper(kind,items):
+        "The name of the helper of `kind` for `items`, made if need be."
+        key = (kind,tuple(items))
+        name = helpers.get(key)
+        if name is not None:
+            return name
+        number = 1
+        taken = set(helpers.values())
+        while True:
+            name = '{}_{}{}'.format(symbol,kind,number)
+            if name not in taken and not defined(name):
+                break
+            number += 1
+        if kind == 'GROUP':
+            productions.append((name," ".join(text for text, _ in items),
+                                _Collect(_first if len(items) == 1 else None,
+                                         _positions(items))))
+        elif kind == 'STAR':
+            text = items[0][0]
+            productions.append((name,"{} {}".format(text,name),_link))
+            productions.append((name,"",None))
+        elif kind == 'PLUS':
+            text = items[0][0]
+            star = helper('STAR',items)
+            productions.append((name,"{} {}".format(text,star),_link))
+        else: # OPT
+            productions.append((name,items[0][0],_first))
+            productions.append((name,"",None))
+        helpers[key] = name
+        return name
+
+    def sequence():
+        "The items ``(text, kind)`` of a sequence of parts, up to a ')'."
+        nonlocal position
+        items = []
+        while position < len(parts) and parts[position] != ')':
+            part = parts[position]
+            position += 1
+            if part == '(':
+                inner = sequence()
+                if position == len(parts) or not inner:
+                    raise GrammarError('Empty or unclosed group in rule '
+                                       '{!r}'.format(rule))
+                position += 1
+                if len(inner) == 1 and inner[0][1] is None:
+                    item = inner[0]
+                else:
+                    item = (helper('GROUP',inner),'GROUP')
+            elif part in '*+?':
+                raise GrammarError('{} without a symbol before it in rule '
+                                   '{!r}'.format(part,rule))
+            else:
+                item = (part,None)
+            while position < len(parts) and parts[position] in '*+?':
+                if item[1] in ('STAR','PLUS','OPT'):
+                    # Such as X*? - the helpers only repeat or omit
+                    # symbols with a value of their own.
+                    item = (helper('GROUP',[item]),'GROUP')
+                kind = {'*': 'STAR', '+': 'PLUS', '?': 'OPT'}[parts[position]]
+                position += 1
+                item = (helper(kind,[item]),kind)
+            items.append(item)
+        return items
+
+    items = sequence()
+    if position < len(parts):
+        raise GrammarError('Unbalanced ) in rule {!r}'.format(rule))
+    positions = _positions(items)
+    if positions and hasattr(action,'__call__'):
+        action = _Collect(action,positions)
+    return [(symbol," ".join(text for text, _ in items),action)] + productions
+
+def _positions(items):
+    "The positions of the repetitions among `items`, for ``_Collect``."
+    return tuple(index for index, (text, kind) in enumerate(items)
+                 if kind in ('STAR','PLUS'))
+
+def _link(values):
+    """The action of the productions ``X_STAR -> item X_STAR`` and ``X_PLUS ->
+    item X_STAR`` of a repetition, whose value is a link ``(item, rest)`` of a
+    chain, ended by None (or a list, when the parser loops - see
+    ``_items``)."""
+    return (values[0],values[1])
+
+def _first(values):
+    "The action of a production whose value is that of its first symbol."
+    return values[0]
+
+def _items(value):
+    """The list of the items of a repetition, from the value of its helper:
+    a chain of ``_link`` values, or a list made by a parser that loops, or
+    a chain that ends with such a list."""
+    if value.__class__ is list:
+        return value
+    items = []
+    while value.__class__ is tuple:
+        items.append(value[0])
+        value = value[1]
+    if value is not None:
+        items += value
+    return items
+
+class _Collect:
+    """The action of a production with repetitions at `positions`, which are
+    turned into lists (see ``_items``) before `action` is called - or, if it
+    is None, the values are the result."""
+    __slots__ = ('action','positions')
+
+    def __init__(self,action,positions):
+        self.action = action
+        self.positions = positions
+
+    def __call__(self,values):
+        for position in self.positions:
+            values[position] = _items(values[position])
+        if self.action is None:
+            return values
+        return self.action(values)
+
+# The parser of a ``Parser.parse_many`` worker process
+_worker_parser = None
+
+def _init_worker(parser,factory):
+    "Pool initializer for ``Parser.parse_many``."
+    global _worker_parser
+    if factory is not None:
+        parser = factory()
+        if not parser.finalized:
+            parser.finalize()
+    _worker_parser = parser
+
+def _parse_one(item):
+    "Parse one ``(index, input)`` pair for ``Parser.parse_many``."
+    index, input = item
+    try:
+        return index, _worker_parser.parse(input)
+    except ParsingError as e:
+        return index, e
+    except LexingError as e:
+        return index, _syntax_error(e)
+
+def _syntax_error(error):
+    "The ``ParsingError`` for the ``pcc.lexer.LexingError`` `error`."
+    result = ParsingError(str(error))
+    result.line, result.position = error.line, error.position
+    result.offset = error.offset
+    return result
+
+def _make_symbol(lexer,name):
+    """Helper function to symbolize the elements of a production's rule"""
+
+    # If it looks like a string literal, make a literal-like token
+    if len(name)==3 and name[0]=="'" and name[2]=="'":
+        # A quick reminder here that this token is NOT the same as
+        # the token called "LITERAL" that is generated automatically by the
+        # lexer when report_literals is True. This is a sort of Token Template,
+        # and if we get a Lexeme with the lexer's LITERAL token, we check to
+        # see if the matched lexeme text matche's this character.
+        return lexer._literal(name[1])
+
+    # If the name is in the lexer's token set, use that token
+    if name in lexer.tokens:
+        return lexer.tokens[name]
+
+    # Otherwise, we assume it's a Symbol. If it's not, then the Symbol
+    # regexp should catch it and barf, which is what we want.
+    return Symbol(name)
+
+def _left_recursion(productions):
+    """Return a left-recursive nonterminal of the grammar, or ``None``.
+
+    `productions` is a dictionary of nonterminal ``Symbol`` to a list of
+    ``(rule, action)`` pairs, as kept by the parsers in this package.
+    Top-down parsers (``pcc.ll``, ``pcc.peg``) loop forever on such symbols.
+    """
+    # Find the nullable nonterminals, by iterating to a fixed point.
+    nullable = set()
+    added_something_flag = True
+    while added_something_flag:
+        added_something_flag = False
+        for symbol, rules in productions.items():
+            if symbol in nullable:
+                continue
+            for rule,action in rules:
+                if all(s == EPSILON or s in nullable for s in rule):
+                    nullable.add(symbol)
+                    added_something_flag = True
+                    break
+
+    # 'left corners' of each nonterminal - the nonterminals that can be
+    # reached without consuming any input. A symbol in its own left
+    # corner is left-recursive.
+    corners = {symbol: set() for symbol in productions}
+    for symbol, rules in productions.items():
+        for rule,action in rules:
+            for rule_symbol in rule:
+                if rule_symbol.terminal():
+                    if rule_symbol != EPSILON:
+                        break
+                    continue
+                corners[symbol].add(rule_symbol)
+                if rule_symbol not in nullable:
+                    break
+
+    for symbol in productions:
+        seen = set()
+        todo = list(corners[symbol])
+        while todo:
+            corner = todo.pop()
+            if corner == symbol:
+                return symbol
+            if corner not in seen:
+                seen.add(corner)
+                todo.extend(corners[corner])
+    return None
@@ -0,0 +1,173 @@
+# parser_test.py - unit tests for parser.py
+
+"""This module provides unit tests for the ``pcc.parser``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import asyncio
+import unittest
+
+from pcc.lexer import Lexer
+from pcc.ll import LLParser
+from pcc.parser import Parser, ParsingError
+
+def make_parser():
+    """Build the expression grammar 4.28 of Aho, Ullman et al."""
+    lexer = Lexer()
+    lexer.addtoken(name='NUM',rule=r'[0-9]+')
+    p = LLParser(lexer)
+    p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+    p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+    p.ap('EP',"", lambda x: 0)
+    p.ap('T',"F TP", lambda x: x[0] * x[1])
+    p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+    p.ap('TP',"", lambda x: 1)
+    p.ap('F',"'(' E ')'", lambda x: x[1])
+    p.ap('F',"NUM", lambda x: int(x[0]))
+    return p
+
+class ParseManyTester(unittest.TestCase):
+    """Test harness for ``pcc.parser.Parser.parse_many``.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.inputs = ["{}*({}+1)".format(i,i) for i in range(100)]
+        self.inputs[17] = "1+"
+        self.inputs[60] = "(2"
+        self.expected = [i * (i + 1) for i in range(100)]
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def _check(self,results):
+        self.assertEqual(len(results),len(self.inputs))
+        for index, result in enumerate(results):
+            if index in (17,60):
+                self.assertTrue(isinstance(result,ParsingError))
+            else:
+                self.assertEqual(result,self.expected[index])
+
+    def test_ordered(self):
+        """parser.py: Test parse_many in input order"""
+        p = make_parser()
+        self._check(list(p.parse_many(self.inputs,workers=2)))
+        self._check(list(p.parse_many(iter(self.inputs),workers=2,
+                                      chunksize=7)))
+
+    def test_unordered(self):
+        """parser.py: Test parse_many as results complete"""
+        p = make_parser()
+        pairs = list(p.parse_many(self.inputs,workers=3,ordered=False))
+        self.assertEqual(sorted(index for index, result in pairs),
+                         list(range(len(self.inputs))))
+        self._check([result for index, result in sorted(pairs,
+                     key=lambda pair: pair[0])])
+
+    def test_factory(self):
+        """parser.py: Test parse_many with a per-worker parser factory"""
+        p = make_parser()
+        self._check(list(p.parse_many(self.inputs,workers=2,
+                                      factory=make_parser)))
+        self._check(list(p.parse_many(self.inputs,workers=1,
+                                      factory=make_parser)))
+
+    def test_in_process(self):
+        """parser.py: Test parse_many without worker processes"""
+        p = make_parser()
+        self._check(list(p.parse_many(self.inputs,workers=1)))
+        self.assertTrue(p.finalized)
+
+    def test_lexing_error(self):
+        """parser.py: Test parse_many with input that doesn't lex"""
+        lexer = Lexer(report_literals=False)
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = LLParser(lexer)
+        p.ap('S',"NUM*",lambda x: sum(int(n) for n in x[0]),
+             start_production=True)
+        inputs = ["1 2","3\n 4 ~ 5","6"]
+        for workers in (1,2):
+            results = list(p.parse_many(inputs,workers=workers))
+            self.assertEqual((results[0],results[2]),(3,6))
+            error = results[1]
+            self.assertIsInstance(error,ParsingError)
+            self.assertEqual((error.line,error.position,error.offset),
+                             (2,4,5))
+
+class ValidateTester(unittest.TestCase):
+    """Test harness for ``pcc.parser.Parser.validate``.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.parser = make_parser()
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def test_validate(self):
+        """parser.py: Test validating input by parsing it"""
+        # The base implementation (LLParser has a faster one of its own)
+        validate = lambda input: Parser.validate(self.parser,input)
+        self.assertIsNone(validate("1 + 2*3"))
+        self.assertIsInstance(validate("1 + * 3"),ParsingError)
+
+        # Lexing errors are syntax errors too
+        self.parser.lexer.report_literals = False
+        error = validate("12\n  + 3")
+        self.assertIsInstance(error,ParsingError)
+        self.assertEqual((error.line,error.position,error.offset),(2,3,5))
+
+        # Errors of the actions are not syntax errors
+        p = make_parser()
+        p.ap('F',"'[' NUM ']'", lambda x: int(x[1]) // 0)
+        self.assertIsNone(p.validate("[1] + 2"))
+        with self.assertRaises(ZeroDivisionError):
+            Parser.validate(p,"[1] + 2")
+
+class _Words(Parser):
+    "A parser that implements no more than the abstract methods."
+
+    def addproduction(self,symbol,rule,action,start_production=False):
+        pass
+
+    def parse(self,input):
+        return input.split()
+
+class AParseTester(unittest.TestCase):
+    """Test harness for ``pcc.parser.Parser.aparse``.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.input = "été 12 ça 4\n  xyz 99 " * 100
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def test_aparse(self):
+        """parser.py: Test parsing input from asynchronous sources"""
+        p = _Words()
+        expected = p.parse(self.input)
+        data = self.input.encode('utf-16')
+        async def chunks():
+            for i in range(0,len(data),5):
+                yield data[i:i + 5]
+        self.assertEqual(asyncio.run(p.aparse(chunks(),encoding='utf-16')),
+                         expected)
+        async def main():
+            reader = asyncio.StreamReader()
+            reader.feed_data(self.input.encode())
+            reader.feed_eof()
+            return await p.aparse(reader)
+        self.assertEqual(asyncio.run(main()),expected)
@@ -0,0 +1,352 @@
+"""peg.py - Packrat parser for Parsing Expression Grammars (PEGs)
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from pcc.parser import Parser, GrammarError, ParsingError, _make_symbol
+from pcc.parser import _left_recursion, _expand
+from pcc.symbols import Symbol, EOF, EPSILON, SymbolString, Lexeme
+from pcc.limits import _limit_lexemes
+from pcc.profiler import _describe
+
+from collections import OrderedDict
+import asyncio
+
+class PEGParser(Parser):
+    """Packrat parser with PEG-style ordered choice.
+
+    Productions are added with the same ``addproduction`` API as any other
+    ``pcc.parser.Parser``, but the meaning of several productions for one
+    symbol is different: they are tried *in the order they were added*, and
+    the first one that matches wins (this is PEG 'ordered choice'). There is
+    therefore no such thing as an ambiguous grammar, and grammars which
+    ``pcc.ll.LLParser`` rejects as not being LL(1) are perfectly acceptable
+    here, so long as they are not left-recursive.
+
+    Backtracking is made linear-time by memoizing the result of every
+    (nonterminal, token index) pair that is attempted. The memo table can be
+    bounded with `memo_size` (a maximum number of entries - ``None``, the
+    default, means unbounded), in which case entries are evicted according
+    to `eviction`: either ``'lru'`` (least recently used) or ``'fifo'``
+    (oldest first, which is cheaper and works well since the parser mostly
+    moves forward through the input).
+
+    Keep in mind that since alternatives are attempted speculatively, the
+    semantic actions of an alternative may be called even if that
+    alternative is later abandoned.
+
+    >>> from pcc.lexer import Lexer
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = PEGParser(l, memo_size=64)
+    >>> p.ap('S', "E", lambda x: x[0], start_production=True)
+    >>> p.ap('E', "NUM '+' E", lambda x: int(x[0]) + x[2])
+    >>> p.ap('E', "NUM", lambda x: int(x[0]))
+    >>> p.parse("1 + 2 + 3")
+    6
+
+    """
+
+    def __init__(self, lexer, memo_size=None, eviction='lru'):
+        if eviction not in _MEMO_POLICIES:
+            raise ValueError('Unknown eviction policy: {}'.format(eviction))
+        if memo_size is not None and memo_size < 1:
+            raise ValueError('memo_size must be at least 1 (or None)')
+        self.lexer = lexer
+        self.finalized = False
+        self.productions = {}
+        self.start = None
+        self.memo_size = memo_size
+        self.eviction = eviction
+        # The helper nonterminals of repetitions, options and groups
+        self.helpers = {}
+
+    def addproduction(self,symbol,rule,action, start_production=False):
+        if self.finalized:
+            raise ValueError("Can't add a production after finalizing the "
+                             "parser (maybe you called parse() too soon?")
+
+        productions = _expand(symbol,rule,action,self.helpers,
+                              lambda name: (Symbol(name) in self.productions
+                                            or name in self.lexer.tokens))
+        for symbol, rule, action in productions[1:]:
+            self._add(symbol,rule,action)
+        symbol, rule, action = productions[0]
+        self._add(symbol,rule,action,start_production)
+
+    def _add(self,symbol,rule,action,start_production=False):
+        "Add a production with a plain rule."
+        symbol = Symbol(symbol)
+
+        if symbol.name in self.lexer.tokens:
+            raise GrammarError('Symbol conflicts with Token name: {}'.format(
+                               symbol.name))
+
+        if self.start is not None and start_production:
+            raise GrammarError('A Start production has already been specified.')
+
+        rule_symbols=SymbolString([_make_symbol(self.lexer,x)
+                                  for x in rule.split()])
+
+        if len(rule_symbols) == 0:
+            rule_symbols = SymbolString((EPSILON,))
+
+        if start_production:
+            self.start = (symbol,rule_symbols+EOF,action)
+
+        # Order matters here - this list *is* the ordered choice.
+        if symbol not in self.productions:
+            self.productions[symbol] = []
+        self.productions[symbol].append((rule_symbols,action))
+
+        for implicit in rule_symbols:
+            if ( not implicit.terminal() and
+                 not implicit in self.productions
+               ):
+                self.productions[implicit] = []
+
+    def finalize(self):
+        """Check the grammar and prepare the parser to call ``parse``.
+
+        Raises ``GrammarError`` if there is no start production, if any
+        nonterminal has no productions, or if the grammar is left-recursive
+        (which a packrat parser can not handle).
+        """
+        if self.finalized:
+            raise ValueError('Attempt to finalize an already finalized parser.')
+
+        if self.start is None:
+            raise GrammarError('At least one production must be marked as the '
+                               'start production.')
+
+        for symbol, rules in self.productions.items():
+            if len(rules) == 0:
+                raise GrammarError('Symbol {} has no productions'.format(
+                                   symbol.name))
+
+        recursive = _left_recursion(self.productions)
+        if recursive is not None:
+            raise GrammarError('Grammar is left-recursive for symbol '
+                               '{}'.format(recursive.name))
+
+        self.finalized = True
+
+    def parse(self,input,cache=None,limits=None):
+        """Parse `input` with ordered choice and a (bounded) memo table.
+
+        `cache`, if given, is a ``pcc.cache.ResultCache`` holding the lexemes
+        (and if it says so, the results) of inputs parsed before.
+
+        `limits`, if given, are the ``pcc.limits.Limits`` of the parse (which
+        counts a step for each nonterminal it tries at a position that isn't
+        memoized); it raises ``pcc.limits.LimitExceeded`` as soon as it goes
+        over one. They can't be used together with `cache`.
+        """
+        if not self.finalized:
+            self.finalize()
+        if limits is not None:
+            if cache is not None:
+                raise ValueError("Can't limit a cached parse")
+            budget = limits.start()
+            return self._parse_lexed(_limit_lexemes(self.lexer.lex(input),
+                                                    budget),budget)
+        if cache is not None:
+            return cache.parse(self,input,self._parse_lexed)
+        return self._parse_lexed(self.lexer.lex(input))
+
+    async def aparse(self,reader,every=1024,encoding='utf-8'):
+        """Parse the input that arrives from `reader` (see
+        ``pcc.parser.Parser.aparse``), and return what ``parse`` would have.
+
+        The input is lexed as it arrives, giving other tasks a turn every
+        `every` tokens, but then parsed all at once, which holds up the event
+        loop until it is done.
+        """
+        if not self.finalized:
+            self.finalize()
+        lexemes = []
+        async for lexeme in self.lexer.alex(reader,encoding):
+            lexemes.append(lexeme)
+            if len(lexemes) % every == 0:
+                await asyncio.sleep(0)
+        return self._parse_lexed(lexemes)
+
+    def _parse_lexed(self,lexemes,budget=None):
+        """Parse the sequence of ``Lexeme`` objects `lexemes`, within
+        `budget` (a ``pcc.limits._Budget``) if given."""
+        lexemes = list(lexemes)
+        lexemes.append(Lexeme(EOF,"EOF",-1,-1))
+        memo = _MEMO_POLICIES[self.eviction](self.memo_size)
+        state = _PackratState(lexemes,self.productions,memo,budget)
+        start_symbol, start_rule, start_action = self.start
+        result = state.parse_rule(start_rule,start_action,0)
+        if result is _FAIL:
+            raise state.error()
+        return result[0]
+
+    def _recognize(self,input):
+        """``validate``: match the input like ``parse`` does, but without
+        calling any actions or keeping any values (see ``_Recognizer``)."""
+        if not self.finalized:
+            self.finalize()
+        lexemes = list(self.lexer.lex(input))
+        lexemes.append(Lexeme(EOF,"EOF",-1,-1))
+        memo = _MEMO_POLICIES[self.eviction](self.memo_size)
+        state = _Recognizer(lexemes,self.productions,memo)
+        if state.parse_rule(self.start[1],None,0) is _FAIL:
+            raise state.error()
+
+
+# Sentinel for a failed match. Results are otherwise (value, next_index).
+_FAIL = object()
+
+class _PackratState:
+    """The state of a single call to ``PEGParser.parse``."""
+
+    def __init__(self, lexemes, productions, memo, budget=None):
+        self.lexemes = lexemes
+        self.productions = productions
+        self.memo = memo
+        self.budget = budget
+        # The furthest index at which a terminal failed to match, and the
+        # terminals that were expected there (for error reporting).
+        self.fail_index = -1
+        self.fail_expected = []
+
+    def parse_symbol(self,symbol,index):
+        "Derive the nonterminal `symbol` starting at token `index`."
+        key = (symbol,index)
+        result = self.memo.get(key)
+        if result is not None:
+            return result
+        budget = self.budget
+        if budget is not None:
+            budget.steps += 1
+            budget.countdown -= 1
+            if budget.countdown <= 0:
+                budget.check(self.lexemes[index])
+
+        result = _FAIL
+        for rule,action in self.productions[symbol]:
+            result = self.parse_rule(rule,action,index)
+            if result is not _FAIL:
+                break
+        self.memo.put(key,result)
+        return result
+
+    def parse_rule(self,rule,action,index):
+        "Match the whole of `rule` starting at token `index`."
+        input_values = []
+        for symbol in rule:
+            if symbol.terminal():
+                if symbol == EPSILON:
+                    input_values.append(None)
+                    continue
+                lexeme = self.lexemes[index]
+                if lexeme.token != symbol:
+                    self._expected(symbol,index)
+                    return _FAIL
+                input_values.append(lexeme.match)
+                index += 1
+            else:
+                result = self.parse_symbol(symbol,index)
+                if result is _FAIL:
+                    return _FAIL
+                value, index = result
+                input_values.append(value)
+
+        if hasattr(action, '__call__'):
+            return (action(input_values),index)
+        else:
+            return (action,index)
+
+    def _expected(self,symbol,index):
+        "Record that `symbol` was expected (but not found) at `index`."
+        if index > self.fail_index:
+            self.fail_index = index
+            self.fail_expected = [symbol]
+        elif index == self.fail_index and symbol not in self.fail_expected:
+            self.fail_expected.append(symbol)
+
+    def error(self):
+        "Build the ``ParsingError`` describing the furthest failure."
+        found = self.lexemes[self.fail_index]
+        expected = " or ".join(_describe(s) for s in self.fail_expected)
+        return ParsingError('Expected {} but found {} on line {} at '
+            'position {}'.format(expected, found.match, found.line,
+            found.position))
+
+class _Recognizer(_PackratState):
+    """The state of a single call to ``PEGParser.validate``: matches rules
+    exactly as ``_PackratState`` does, but never calls their actions. The
+    result of a match is ``(None, next_index)``."""
+
+    def parse_rule(self,rule,action,index):
+        "Match the whole of `rule` starting at token `index`."
+        for symbol in rule:
+            if symbol.terminal():
+                if symbol == EPSILON:
+                    continue
+                if self.lexemes[index].token != symbol:
+                    self._expected(symbol,index)
+                    return _FAIL
+                index += 1
+            else:
+                result = self.parse_symbol(symbol,index)
+                if result is _FAIL:
+                    return _FAIL
+                index = result[1]
+        return (None,index)
+
+
+class _LRUMemo:
+    "Memo table that evicts the least recently used entry when full."
+
+    def __init__(self, size):
+        self.size = size
+        self.table = OrderedDict()
+
+    def get(self,key):
+        result = self.table.get(key)
+        if result is not None:
+            self.table.move_to_end(key)
+        return result
+
+    def put(self,key,value):
+        self.table[key] = value
+        if self.size is not None and len(self.table) > self.size:
+            self.table.popitem(last=False)
+
+class _FIFOMemo:
+    "Memo table that evicts the oldest entry when full."
+
+    def __init__(self, size):
+        self.size = size
+        self.table = {}
+
+    def get(self,key):
+        return self.table.get(key)
+
+    def put(self,key,value):
+        self.table[key] = value
+        if self.size is not None and len(self.table) > self.size:
+            # dicts preserve insertion order, so the first key is the oldest
+            del self.table[next(iter(self.table))]
+
+_MEMO_POLICIES = {'lru': _LRUMemo, 'fifo': _FIFOMemo}
@@ -0,0 +1,184 @@
+# peg_test.py - unit tests for peg.py
+
+"""This module provides unit tests for the ``pcc.peg``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import asyncio
+import unittest
+
+import pcc.peg as peg
+from pcc.lexer import Lexer
+from pcc.ll import LLParser
+from pcc.parser import GrammarError, ParsingError
+
+class PEGTester(unittest.TestCase):
+    """Test harness for ``pcc.peg.PEGParser`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.lexer = Lexer()
+        self.lexer.addtoken(name='NUM',rule=r'[0-9]+')
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def _sum_grammar(self,p):
+        p.ap('S', "E", lambda x: x[0], start_production=True)
+        p.ap('E', "NUM '+' E", lambda x: int(x[0]) + x[2])
+        p.ap('E', "NUM '-' E", lambda x: int(x[0]) - x[2])
+        p.ap('E', "NUM", lambda x: int(x[0]))
+
+    def test_ordered_choice(self):
+        """peg.py: Test a grammar that is not LL(1)"""
+        ll = LLParser(self.lexer)
+        self._sum_grammar(ll)
+        with self.assertRaises(GrammarError):
+            ll.finalize()
+
+        p = peg.PEGParser(self.lexer)
+        self._sum_grammar(p)
+        self.assertEqual(p.parse("1 + 2 + 3"),6)
+        self.assertEqual(p.parse("7"),7)
+        self.assertEqual(p.parse("10 - 4 + 1"),5)
+
+    def test_first_match_wins(self):
+        """peg.py: Test that earlier alternatives take priority"""
+        p = peg.PEGParser(self.lexer)
+        p.ap('S', "A", lambda x: x[0], start_production=True)
+        p.ap('A', "NUM", 'first')
+        p.ap('A', "NUM", 'second')
+        self.assertEqual(p.parse("1"),'first')
+
+    def test_memoization(self):
+        """peg.py: Test that backtracking does not re-derive symbols"""
+        calls = []
+        def count(x):
+            calls.append(x)
+            return x[1]
+        p = peg.PEGParser(self.lexer)
+        p.ap('S', "A", lambda x: x[0], start_production=True)
+        p.ap('A', "B 'x'", lambda x: x[0])
+        p.ap('A', "B 'y'", lambda x: x[0])
+        p.ap('A', "B", lambda x: x[0])
+        p.ap('B', "'(' A ')'", count)
+        p.ap('B', "NUM", lambda x: int(x[0]))
+
+        depth = 18
+        self.assertEqual(p.parse("(" * depth + "4" + ")" * depth),4)
+        # Without memoization this would be 3**depth calls.
+        self.assertEqual(len(calls),depth)
+
+    def test_bounded_memo(self):
+        """peg.py: Test parsing with a bounded memo table"""
+        for policy in ('lru','fifo'):
+            p = peg.PEGParser(self.lexer, memo_size=2, eviction=policy)
+            self._sum_grammar(p)
+            self.assertEqual(p.parse("1+2+3+4+5+6+7+8"),36)
+
+        memo = peg._LRUMemo(2)
+        memo.put('a',1)
+        memo.put('b',2)
+        memo.get('a')
+        memo.put('c',3)
+        self.assertEqual(set(memo.table),{'a','c'})
+
+        memo = peg._FIFOMemo(2)
+        memo.put('a',1)
+        memo.put('b',2)
+        memo.get('a')
+        memo.put('c',3)
+        self.assertEqual(set(memo.table),{'b','c'})
+
+        with self.assertRaises(ValueError):
+            peg.PEGParser(self.lexer, eviction='random')
+
+    def test_grammar_errors(self):
+        """peg.py: Test grammar error detection"""
+        p = peg.PEGParser(self.lexer)
+        p.ap('S', "E", lambda x: x[0], start_production=True)
+        p.ap('E', "E '+' NUM", lambda x: x[0] + int(x[2]))
+        p.ap('E', "NUM", lambda x: int(x[0]))
+        with self.assertRaises(GrammarError):
+            p.parse("1+2")
+
+        p = peg.PEGParser(self.lexer)
+        p.ap('S', "E", lambda x: x[0], start_production=True)
+        with self.assertRaises(GrammarError):
+            p.parse("1")
+
+    def test_syntax_error(self):
+        """peg.py: Test syntax error reporting"""
+        p = peg.PEGParser(self.lexer)
+        self._sum_grammar(p)
+        with self.assertRaises(ParsingError) as cm:
+            p.parse("1 + 2 3")
+        self.assertIn("found 3", str(cm.exception))
+        self.assertIn("position 7", str(cm.exception))
+
+    def test_repetition(self):
+        """peg.py: Test repetition, options and groups in rules"""
+        p = peg.PEGParser(self.lexer)
+        p.ap('S',"'[' (NUM (',' NUM)*)? ']'",
+             lambda x: [] if x[1] is None
+             else [int(x[1][0])] + [int(item[1]) for item in x[1][1]],
+             start_production=True)
+        self.assertEqual(p.parse("[1, 2, 3]"),[1,2,3])
+        self.assertEqual(p.parse("[]"),[])
+        with self.assertRaises(ParsingError):
+            p.parse("[1,]")
+
+    def test_validate(self):
+        """peg.py: Test validating input"""
+        p = peg.PEGParser(self.lexer)
+        self._sum_grammar(p)
+        self.assertIsNone(p.validate("1 + 2 - 3"))
+        self.assertIsInstance(p.validate("1 + + 2"),ParsingError)
+        self.assertIsInstance(p.validate("1 ~ 2"),ParsingError)
+
+        # No actions are run
+        lexer = Lexer(report_literals=False)
+        lexer.addtoken(name='WORD',rule=r'[0-9a-z]+')
+        lexer.addtoken(name='END',rule=r';')
+        calls = []
+        def number(x):
+            calls.append(x)
+            return int(x[0])
+        p = peg.PEGParser(lexer)
+        p.ap('S',"ITEM* END",lambda x: x[0],start_production=True)
+        p.ap('ITEM',"WORD",number)
+        with self.assertRaises(ValueError):
+            p.parse("1 abc;")
+        calls.clear()
+        self.assertIsNone(p.validate("1 abc;"))
+        self.assertIsNone(p.validate(";"))
+        self.assertEqual(calls,[])
+        error = p.validate("1 abc")
+        self.assertIsInstance(error,ParsingError)
+        self.assertIn('found EOF',str(error))
+
+        # Lexing errors are syntax errors too
+        error = p.validate("1\n ab ~ c;")
+        self.assertIsInstance(error,ParsingError)
+        self.assertEqual((error.line,error.position,error.offset),(2,5,6))
+
+    def test_aparse(self):
+        """peg.py: Test asynchronous parsing"""
+        p = peg.PEGParser(self.lexer)
+        self._sum_grammar(p)
+        async def chunks():
+            for chunk in ("1 + 2", "0 - 3 +", " 4"):
+                yield chunk
+        self.assertEqual(asyncio.run(p.aparse(chunks(),every=2)),
+                         p.parse("1 + 20 - 3 + 4"))
+        async def bad():
+            yield "1 + + 2"
+        with self.assertRaises(ParsingError):
+            asyncio.run(p.aparse(bad()))
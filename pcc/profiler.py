@@ -0,0 +1,167 @@
+"""profiler.py - Where the time goes when parsing
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from collections import defaultdict
+import marshal
+
+# pstats 'file name' of the entries of a ParseProfile
+_GRAMMAR = '<grammar>'
+
+class ParseProfile:
+    """Statistics collected by parsing with a profile, as in
+    ``LLParser.parse(input, profile=ParseProfile())``.
+
+    One profile may be passed to any number of ``parse`` calls of the same
+    parser, and accumulates over all of them. For every production (by id,
+    an index into ``productions``, the parser's list of ``(symbol, rule,
+    action)`` triples) it records:
+
+    * ``calls[id]`` - how many times the production was chosen.
+    * ``action_time[id]`` - seconds spent in its semantic action.
+    * ``cumulative_time[id]`` - seconds spent deriving it, everything
+      included (counted once for recursive productions).
+    * ``own_time[id]`` - the same, less the time spent deriving the
+      productions below it: its own lexing, table lookups and action.
+
+    ``cells[(symbol, token)]`` counts the hits of every parse table cell,
+    ``max_depth`` is the deepest nesting of productions reached, and
+    ``lex_time``, ``action_total`` and ``total_time`` are the seconds spent
+    lexing, in all semantic actions, and parsing overall.
+
+    ``report`` formats all of this as text, and ``dump_stats`` writes it in
+    the format of ``cProfile``, for ``pstats`` and similar tools.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM S", lambda x: int(x[0]) + x[1], start_production=True)
+    >>> p.ap('S', "", lambda x: 0)
+    >>> profile = ParseProfile()
+    >>> p.parse("1 2 3", profile=profile)
+    6
+    >>> profile.calls[0], profile.calls[1], profile.max_depth
+    (2, 1, 4)
+    """
+
+    def __init__(self):
+        self.productions = None
+        self.calls = defaultdict(int)
+        self.primitive_calls = defaultdict(int)
+        self.action_time = defaultdict(float)
+        self.cumulative_time = defaultdict(float)
+        self.own_time = defaultdict(float)
+        # callers[id][caller id] = [calls, primitive calls, own, cumulative]
+        self.callers = defaultdict(lambda: defaultdict(lambda: [0,0,0.0,0.0]))
+        self.cells = defaultdict(int)
+        self.max_depth = 0
+        self.lex_time = 0.0
+        self.lex_calls = 0
+        self.action_total = 0.0
+        self.total_time = 0.0
+        # How many derivations of each production are in progress
+        self.active = defaultdict(int)
+
+    def bind(self,productions):
+        """Attach the profile to a parser's list of productions. Called by the
+        parser - a profile can only be used with one parser.
+        """
+        if self.productions is None:
+            self.productions = productions
+        elif self.productions is not productions:
+            raise ValueError('A ParseProfile can only be used with one parser.')
+        # Left over if the last parse failed
+        self.active.clear()
+
+    def label(self,prod):
+        "Human readable name of production `prod`."
+        symbol, rule, action = self.productions[prod]
+        return '{} -> {}'.format(symbol, " ".join(
+            _describe(s) if s.terminal() else s.name for s in rule))
+
+    def report(self,sort='own',limit=None):
+        """Return a text report of the profile, with the productions sorted by
+        `sort` - one of ``'calls'``, ``'own'``, ``'cumulative'`` and
+        ``'action'`` - in descending order, and only the first `limit` of
+        them (and of the parse table cells) if it is given.
+        """
+        keys = {'calls': self.calls, 'own': self.own_time,
+                'cumulative': self.cumulative_time,
+                'action': self.action_time}
+        if sort not in keys:
+            raise ValueError('Unknown sort key: {}'.format(sort))
+        order = sorted(self.calls,key=lambda prod: keys[sort][prod],
+                       reverse=True)[:limit]
+
+        lines = ['{:.6f}s parsing: {:.6f}s lexing ({} lexemes), {:.6f}s in '
+                 'actions, maximum depth {}'.format(self.total_time,
+                 self.lex_time,self.lex_calls,self.action_total,
+                 self.max_depth),
+                 '',
+                 '{:>9} {:>10} {:>10} {:>10}  production'.format(
+                 'calls','own','cumul','action')]
+        for prod in order:
+            lines.append('{:>9} {:10.6f} {:10.6f} {:10.6f}  {}'.format(
+                self.calls[prod],self.own_time[prod],
+                self.cumulative_time[prod],self.action_time[prod],
+                self.label(prod)))
+
+        lines += ['','{:>9}  parse table cell'.format('hits')]
+        cells = sorted(self.cells.items(),key=lambda x: x[1],
+                       reverse=True)[:limit]
+        for (symbol,token), hits in cells:
+            lines.append('{:>9}  {}, {}'.format(hits,symbol,
+                         _describe(token)))
+        return "\n".join(lines)
+
+    def stats(self):
+        """Return the profile as a ``cProfile``-style dictionary, with one
+        entry per production (named by its id and text), plus one for the
+        lexer.
+        """
+        result = {}
+        for prod, calls in self.calls.items():
+            callers = {self._key(caller): tuple(edge) for caller, edge
+                       in self.callers[prod].items()}
+            result[self._key(prod)] = (self.primitive_calls[prod],calls,
+                                       self.own_time[prod],
+                                       self.cumulative_time[prod],callers)
+        if self.lex_calls:
+            result[('<lexer>',0,'lex')] = (self.lex_calls,self.lex_calls,
+                                           self.lex_time,self.lex_time,{})
+        return result
+
+    def dump_stats(self,file):
+        """Write ``stats()`` to the file named `file`, which can then be read
+        with ``pstats.Stats(file)``.
+        """
+        with open(file,'wb') as f:
+            marshal.dump(self.stats(),f)
+
+    def _key(self,prod):
+        return (_GRAMMAR,prod,self.label(prod))
+
+def _describe(token):
+    "Human readable name of a terminal."
+    if token.name == "LITERAL":
+        return "'{}'".format(token.rule.pattern.replace('\\',''))
+    return token.name
@@ -0,0 +1,105 @@
+# profiler_test.py - unit tests for profiler.py
+
+"""This module provides unit tests for the ``pcc.profiler``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import io
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+import pcc.ll as ll
+from pcc.lexer import Lexer
+from pcc.profiler import ParseProfile
+
+class ProfilerTester(unittest.TestCase):
+    """Test harness for ``pcc.profiler.ParseProfile`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        def slow(x):
+            time.sleep(0.01)
+            return int(x[0])
+        self.p = p = ll.LLParser(lexer)
+        p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+        p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+        p.ap('EP',"", lambda x: 0)
+        p.ap('T',"F TP", lambda x: x[0] * x[1])
+        p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+        p.ap('TP',"", lambda x: 1)
+        p.ap('F',"'(' E ')'", lambda x: x[1])
+        p.ap('F',"NUM", slow)
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def test_counts(self):
+        """profiler.py: Test production, cell and depth statistics"""
+        profile = ParseProfile()
+        self.assertEqual(self.p.parse("2+(3*4)",profile=profile),14)
+        self.assertEqual(self.p.parse("5",profile=profile),5)
+
+        ids = {profile.label(prod): prod for prod in profile.calls}
+        self.assertEqual(profile.calls[ids["F -> NUM"]],4)
+        self.assertEqual(profile.calls[ids["F -> '(' E ')'"]],1)
+        self.assertEqual(profile.calls[ids["EP -> _EPSILON"]],3)
+        # E -> T EP is used for the parenthesized E only
+        self.assertEqual(profile.primitive_calls[ids["E -> T EP"]],1)
+        num = [token for token in self.p.terminals if token.name == 'NUM'][0]
+        self.assertEqual(profile.cells[(ll.Symbol('F'),num)],4)
+        # 2+(3*4): the start production, then EP T F E T TP F
+        self.assertEqual(profile.max_depth,8)
+        self.assertEqual(profile.lex_calls,8 + 2)
+
+        # The slow action dominates, and shows up as such
+        self.assertGreater(profile.action_time[ids["F -> NUM"]],0.035)
+        self.assertGreaterEqual(profile.action_total,
+                                profile.action_time[ids["F -> NUM"]])
+        self.assertGreater(profile.cumulative_time[self.p.start_id],
+                           profile.action_total)
+        report = profile.report(sort='action',limit=3)
+        self.assertIn("F -> NUM",report.splitlines()[3])
+        with self.assertRaises(ValueError):
+            profile.report(sort='name')
+
+        # The hot path keeps no statistics
+        self.assertEqual(self.p.parse("2+3"),5)
+        self.assertEqual(profile.calls[ids["F -> NUM"]],4)
+
+    def test_pstats(self):
+        """profiler.py: Test the pstats-compatible dump"""
+        profile = ParseProfile()
+        self.p.parse("1*2+3",profile=profile)
+        handle, file = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            profile.dump_stats(file)
+            out = io.StringIO()
+            stats = pstats.Stats(file,stream=out)
+            stats.sort_stats('tottime').print_stats()
+            stats.print_callers()
+        finally:
+            os.remove(file)
+        self.assertIn("F -> NUM",out.getvalue())
+        self.assertIn("<lexer>",out.getvalue())
+
+    def test_other_parser(self):
+        """profiler.py: Test that a profile belongs to one parser"""
+        profile = ParseProfile()
+        self.p.parse("1",profile=profile)
+        other = ll.LLParser(self.p.lexer)
+        other.ap('S',"NUM",'x',start_production=True)
+        with self.assertRaises(ValueError):
+            other.parse("1",profile=profile)
@@ -0,0 +1,284 @@
+"""registry.py - Keep many grammars' parsers within a memory budget
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import hashlib
+import marshal
+import os
+import tempfile
+import threading
+import zlib
+
+from pcc.cache import _sizeof
+
+class ParserRegistry:
+    """A set of named parsers, finalized when first used and kept within a
+    memory budget of about `max_bytes`.
+
+    Each grammar is registered with a `factory`: a function of no arguments
+    that returns a new parser with the productions of the grammar (and a
+    lexer of its own), but not finalized yet. ``get`` finalizes the parser
+    the first time it is asked for, and keeps it until the parsers in memory
+    add up to more than `max_bytes` - at which point the least recently used
+    ones are dropped. An ``LLParser`` that is dropped leaves its ``tables()``
+    behind in a small compressed file in `directory` (by default, a
+    temporary directory that is removed along with the registry), and the
+    next ``get`` calls the factory again and finalizes the new parser from
+    that file, which is much quicker than working the tables out again for
+    a large grammar. (The factory is called again because the semantic
+    actions of a grammar, being code, are not written to disk.)
+
+    Memory is estimated from ``sys.getsizeof`` when a parser is finalized,
+    leaving out the grammar's tokens. Tokens with the same rule share the
+    same compiled regular expression anyway, whatever lexer they belong to
+    (see ``pcc.symbols.Token``), so similar grammars cost little more than
+    their tables. ``memory()`` estimates it again, per grammar.
+
+    A registry may be shared between threads. Parsers that are dropped while
+    a thread still uses them go on working for that thread.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> def numbers():
+    ...     l = Lexer()
+    ...     l.addtoken(name='NUM',rule=r'[0-9]+')
+    ...     p = LLParser(l)
+    ...     p.ap('S', "NUM S", lambda x: [int(x[0])] + x[1],
+    ...          start_production=True)
+    ...     p.ap('S', "", lambda x: [])
+    ...     return p
+    >>> registry = ParserRegistry(max_bytes=1 << 20)
+    >>> registry.register('numbers', numbers)
+    >>> registry.parse('numbers', "1 2 3")
+    [1, 2, 3]
+    >>> registry.evict('numbers')
+    >>> registry.parse('numbers', "4 5")
+    [4, 5]
+    >>> registry.stats()['loads']
+    1
+    """
+
+    def __init__(self, max_bytes=256 << 20, directory=None):
+        if max_bytes < 0:
+            raise ValueError('max_bytes must not be negative')
+        self.max_bytes = max_bytes
+        if directory is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix='pcc-')
+            directory = self._tempdir.name
+        self.directory = directory
+        # Finalized with the factory, restored from the disk, and found in
+        # memory, respectively
+        self.builds = 0
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.size = 0
+        # name -> _Entry
+        self._entries = {}
+        # name -> _Entry of the parsers in memory, least recently used first
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,name):
+        return name in self._entries
+
+    def register(self,name,factory):
+        """Add the grammar `name`, whose parsers are made by `factory`.
+        Registering a name again replaces the grammar (and drops its parser
+        and tables)."""
+        path = os.path.join(self.directory,'{}.tables'.format(
+            hashlib.blake2b(name.encode('utf-8','surrogatepass'),
+                            digest_size=16).hexdigest()))
+        with self._lock:
+            old = self._entries.pop(name,None)
+            if old is not None:
+                self._drop(name,old)
+                old.remove_file()
+            self._entries[name] = _Entry(factory,path)
+
+    def unregister(self,name):
+        "Remove the grammar `name`. Raises ``KeyError`` if there is none."
+        with self._lock:
+            entry = self._entries.pop(name)
+            self._drop(name,entry)
+            entry.remove_file()
+
+    def get(self,name):
+        """Return the finalized parser of the grammar `name`, making it if it
+        isn't in memory. Raises ``KeyError`` for unknown names."""
+        with self._lock:
+            entry = self._entries[name]
+            parser = entry.parser
+            if parser is not None:
+                self._resident.move_to_end(name)
+                self.hits += 1
+                return parser
+        # Only one thread makes the parser of a grammar, but any number of
+        # grammars can be made at once.
+        with entry.lock:
+            with self._lock:
+                parser = entry.parser
+                if parser is not None:
+                    self._resident.move_to_end(name)
+                    self.hits += 1
+                    return parser
+            parser, loaded = self._make(entry)
+            size = _sizeof(parser)
+            with self._lock:
+                if self._entries.get(name) is not entry:
+                    # Replaced or removed meanwhile - hand the parser out,
+                    # but don't keep it.
+                    return parser
+                if loaded:
+                    self.loads += 1
+                else:
+                    self.builds += 1
+                entry.parser = parser
+                entry.size = size
+                self.size += size
+                self._resident[name] = entry
+                self._shrink()
+                return parser
+
+    def parse(self,name,input,**options):
+        """Parse `input` with the grammar `name`, passing any `options` on to
+        the parser's ``parse``."""
+        return self.get(name).parse(input,**options)
+
+    def evict(self,name):
+        """Drop the parser of the grammar `name` from memory (writing its
+        tables to disk, if need be.) Raises ``KeyError`` for unknown
+        names."""
+        with self._lock:
+            entry = self._entries[name]
+            if entry.parser is not None:
+                self._evict(name,entry)
+
+    def memory(self):
+        """Return a dictionary of the estimated bytes of memory used by the
+        parser of each grammar that is in memory. As a parser's memory can
+        grow with use (the prediction cache of an adaptive parser, say), the
+        estimates are made again, and the budget enforced with them."""
+        with self._lock:
+            resident = [(name,entry,entry.parser) for name, entry
+                        in self._resident.items()]
+        sizes = [(name,entry,_sizeof(parser)) for name, entry, parser
+                 in resident]
+        with self._lock:
+            for name, entry, size in sizes:
+                if self._resident.get(name) is entry:
+                    self.size += size - entry.size
+                    entry.size = size
+            self._shrink()
+            return {name: entry.size for name, entry
+                    in self._resident.items()}
+
+    def stats(self):
+        "Return the statistics of the registry as a dictionary."
+        with self._lock:
+            return {'grammars': len(self._entries),
+                    'resident': len(self._resident), 'size': self.size,
+                    'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'builds': self.builds, 'loads': self.loads,
+                    'evictions': self.evictions}
+
+    def _make(self,entry):
+        """Make the finalized parser of `entry`, from its tables on disk if
+        they are there and still fit the grammar. Returns the parser, and
+        whether it was made from the tables."""
+        parser = entry.factory()
+        tables = entry.read()
+        if tables is not None:
+            try:
+                parser.finalize(tables)
+                return parser, True
+            except ValueError:
+                # The factory makes some other grammar now
+                entry.remove_file()
+                parser = entry.factory()
+        parser.finalize()
+        return parser, False
+
+    def _shrink(self):
+        """Evict the least recently used parsers until the rest fit the
+        budget - but keep the most recently used one, even if it is bigger
+        than the budget all by itself. Called with the lock held."""
+        while self.size > self.max_bytes and len(self._resident) > 1:
+            name = next(iter(self._resident))
+            self._evict(name,self._resident[name])
+
+    def _evict(self,name,entry):
+        "Evict the parser of `entry`. Called with the lock held."
+        if not entry.saved and hasattr(entry.parser,'tables'):
+            entry.write(entry.parser.tables())
+        self._drop(name,entry)
+        self.evictions += 1
+
+    def _drop(self,name,entry):
+        "Forget the parser of `entry`. Called with the lock held."
+        if self._resident.pop(name,None) is not None:
+            self.size -= entry.size
+        entry.parser = None
+        entry.size = 0
+
+class _Entry:
+    """A grammar of a ``ParserRegistry``: its factory, its parser (if it is
+    in memory), and the file for its tables."""
+
+    def __init__(self,factory,path):
+        self.factory = factory
+        self.path = path
+        self.parser = None
+        self.size = 0
+        # Whether the tables are in the file (which, in a directory of the
+        # caller's, may be left from an earlier run - they are checked
+        # against the grammar when used.)
+        self.saved = os.path.exists(path)
+        self.lock = threading.Lock()
+
+    def write(self,tables):
+        "Write `tables` to the file, compressed."
+        data = zlib.compress(marshal.dumps(tables),1)
+        with open(self.path + '.tmp','wb') as file:
+            file.write(data)
+        os.replace(self.path + '.tmp',self.path)
+        self.saved = True
+
+    def read(self):
+        "Return the tables in the file, or None if there are none."
+        if not self.saved:
+            return None
+        try:
+            with open(self.path,'rb') as file:
+                return marshal.loads(zlib.decompress(file.read()))
+        except (OSError,ValueError,EOFError,TypeError,zlib.error):
+            self.saved = False
+            return None
+
+    def remove_file(self):
+        self.saved = False
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,172 @@
+# registry_test.py - unit tests for registry.py
+
+"""This module provides unit tests for the ``pcc.registry``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+import pcc.ll as ll
+import pcc.peg as peg
+from pcc.lexer import Lexer
+from pcc.registry import ParserRegistry
+
+class RegistryTester(unittest.TestCase):
+    """Test harness for ``pcc.registry.ParserRegistry`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        self.made = []
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        self.tempdir.cleanup()
+
+    def _factory(self,tenant,parser_class=ll.LLParser,**options):
+        """A factory of the grammar of `tenant`: lists of numbers, and of
+        names that start with the tenant's prefix."""
+        def factory():
+            self.made.append(tenant)
+            lexer = Lexer()
+            lexer.addtoken(name='WS',rule=r'\s+',silent=True)
+            lexer.addtoken(name='NUM',rule=r'[0-9]+')
+            lexer.addtoken(name='NAME',rule=tenant + r'[a-z]*')
+            p = parser_class(lexer,**options)
+            p.ap('S',"L",lambda x: x[0],start_production=True)
+            p.ap('L',"ITEM L",lambda x: [x[0]] + x[1])
+            p.ap('L',"",lambda x: [])
+            p.ap('ITEM',"NUM",lambda x: int(x[0]))
+            p.ap('ITEM',"NAME",lambda x: (tenant,x[0]))
+            p.ap('ITEM',"'(' L ')'",lambda x: x[1])
+            return p
+        return factory
+
+    def test_registry(self):
+        """registry.py: Test getting, evicting and restoring parsers"""
+        r = ParserRegistry(directory=self.tempdir.name)
+        for tenant in 'abc':
+            r.register(tenant,self._factory(tenant))
+        self.assertEqual(len(r),3)
+        self.assertIn('a',r)
+        self.assertEqual(self.made,[])
+        self.assertEqual(r.parse('a',"1 (ab 2)"),[1,[('a','ab'),2]])
+        self.assertIs(r.get('a'),r.get('a'))
+        self.assertEqual(self.made,['a'])
+
+        # Evicted parsers come back from their tables
+        r.evict('a')
+        self.assertEqual(len(os.listdir(self.tempdir.name)),1)
+        self.assertEqual(r.parse('a',"3 a"),[3,('a','a')])
+        stats = r.stats()
+        self.assertEqual((stats['builds'],stats['loads'],stats['hits']),
+                         (1,1,2))
+        with self.assertRaises(ll.ParsingError):
+            r.parse('a',"b")
+
+        # A new grammar under the same name replaces the old one
+        r.register('a',self._factory('b'))
+        self.assertEqual(r.parse('a',"b"),[('b','b')])
+        r.evict('a')
+        self.assertEqual(r.parse('a',"b 1"),[('b','b'),1])
+
+        # So do tables of another grammar left in the directory
+        r = ParserRegistry(directory=self.tempdir.name)
+        r.register('a',self._factory('c'))
+        self.assertEqual(r.parse('a',"c"),[('c','c')])
+        self.assertEqual(r.stats()['builds'],1)
+
+        r.unregister('a')
+        self.assertNotIn('a',r)
+        with self.assertRaises(KeyError):
+            r.get('a')
+        with self.assertRaises(KeyError):
+            r.unregister('a')
+
+        # Any kind of parser can be registered
+        r = ParserRegistry()
+        for name, factory in (
+                ('lazy',self._factory('a',lazy=True)),
+                ('adaptive',self._factory('a',adaptive=True)),
+                ('peg',self._factory('a',peg.PEGParser))):
+            r.register(name,factory)
+            for i in range(2):
+                self.assertEqual(r.parse(name,"1 (a)"),[1,[('a','a')]])
+                r.evict(name)
+        self.assertEqual(r.stats()['loads'],2)
+
+    def test_budget(self):
+        """registry.py: Test the memory budget"""
+        r = ParserRegistry()
+        r.register('a',self._factory('a'))
+        r.get('a')
+        size = r.memory()['a']
+        self.assertGreater(size,1000)
+
+        # Room for a little over two parsers
+        r = ParserRegistry(max_bytes=int(size * 2.5))
+        for tenant in 'abcdef':
+            r.register(tenant,self._factory(tenant))
+        r.get('a')
+        r.get('b')
+        r.get('a')
+        r.get('c')
+        self.assertEqual(set(r.memory()),{'a','c'})
+        self.assertLessEqual(r.stats()['size'],r.max_bytes)
+        for tenant in 'defabc':
+            self.assertEqual(r.parse(tenant,"1 " + tenant),
+                             [1,(tenant,tenant)])
+        stats = r.stats()
+        self.assertEqual(stats['evictions'],7)
+        self.assertEqual(stats['builds'] + stats['loads'],9)
+        self.assertEqual(stats['resident'],2)
+
+        # One parser is kept even if it doesn't fit
+        r = ParserRegistry(max_bytes=0)
+        r.register('a',self._factory('a'))
+        r.register('b',self._factory('b'))
+        self.assertEqual(r.parse('a',"a"),[('a','a')])
+        self.assertEqual(list(r.memory()),['a'])
+        self.assertEqual(r.parse('b',"b"),[('b','b')])
+        self.assertEqual(list(r.memory()),['b'])
+
+    def test_tokens(self):
+        """registry.py: Test sharing the rules of tokens between grammars"""
+        a = self._factory('a')()
+        b = self._factory('b')()
+        self.assertIs(a.lexer.tokens['NUM'].rule,b.lexer.tokens['NUM'].rule)
+        self.assertIsNot(a.lexer.tokens['NAME'].rule,
+                         b.lexer.tokens['NAME'].rule)
+        self.assertIs(a.lexer._literal('(').rule,b.lexer._literal('(').rule)
+
+    def test_threads(self):
+        """registry.py: Test sharing a registry between threads"""
+        r = ParserRegistry(max_bytes=1)
+        tenants = 'abcd'
+        for tenant in tenants:
+            r.register(tenant,self._factory(tenant))
+        errors = []
+        def work(offset):
+            for i in range(40):
+                tenant = tenants[(i + offset) % len(tenants)]
+                if r.parse(tenant,"{} 1".format(tenant)) != [(tenant,tenant),
+                                                            1]:
+                    errors.append(tenant)
+        threads = [threading.Thread(target=work,args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors,[])
+        stats = r.stats()
+        self.assertEqual(stats['hits'] + stats['builds'] + stats['loads'],160)
+        self.assertLessEqual(stats['resident'],1)
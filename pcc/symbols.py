@@ -21,6 +21,8 @@
 
 import re
 import itertools
+import threading
+import weakref
 
 SYMBOL_MATCH_RULE = r'[a-zA-Z][_a-zA-Z0-9]*'
 _SYMBOL_REGEXP = re.compile(SYMBOL_MATCH_RULE)
@@ -75,7 +77,7 @@ class Token(Symbol):
 
     def __init__(self, name, rule, silent = False):
         super().__init__(name)
-        self.rule = re.compile(rule)
+        self.rule = _compile(rule)
         self.silent = silent
 
     def terminal(self):
@@ -99,6 +101,25 @@ class Token(Symbol):
         return "<pcc.symbols.Token({},r'{}')>".format(
                 self.name,self.rule.pattern)
 
+# Compiled Token rules by pattern, shared by every Token (of any lexer) with
+# the same rule for as long as one of them is alive. Unlike the cache of the
+# ``re`` module, this one never evicts a rule that is in use, which matters
+# to processes with many grammars.
+_RULES = weakref.WeakValueDictionary()
+_RULES_LOCK = threading.Lock()
+
+def _compile(rule):
+    """``re.compile(rule)``, returning the same object for every Token with
+    the same `rule` string."""
+    if not isinstance(rule,str):
+        return re.compile(rule)
+    compiled = _RULES.get(rule)
+    if compiled is None:
+        compiled = re.compile(rule)
+        with _RULES_LOCK:
+            compiled = _RULES.setdefault(rule,compiled)
+    return compiled
+
 class SymbolString:
     """An ordered collection of ``Symbol`` objects.
 
@@ -145,14 +166,16 @@ class SymbolString:
 class Lexeme:
     """Input (string) that has been matched to some ``Token``.
 
-    Every ``Lexeme`` object has the fields ``token``, ``match``, ``line``, and
-    ``position``.
+    Every ``Lexeme`` object has the fields ``token``, ``match``, ``line``,
+    ``position`` and ``offset``. ``offset`` is the index of the start of the
+    match in the whole input string, if known (otherwise it is None).
     """
-    def __init__(self, token, match, line, position):
+    def __init__(self, token, match, line, position, offset=None):
         self.token = token
         self.match = match
         self.line = line
         self.position = position
+        self.offset = offset
 
 
 EPSILON = Token("fake",r"")
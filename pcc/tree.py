@@ -0,0 +1,497 @@
+"""tree.py - Compact, array-backed concrete syntax trees
+"""
+# Copyright 2012 Erich Blume <blume.erich@gmail.com>
+# ===========================
+#
+# This file is part of pcc
+#
+# pcc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pcc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pcc, in a file called COPYING.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, takewhile
+from operator import sub
+
+from pcc.symbols import EPSILON, Lexeme
+
+# Rule 'shape' codes, see ParseTree._shape
+_TERMINAL = 0
+_NONTERMINAL = 1
+_EPSILON = 2
+
+class ParseTree:
+    """Concrete syntax tree stored in flat arrays.
+
+    A ``ParseTree`` is produced by a parser's ``parsetree`` method (see for
+    instance ``pcc.ll.LLParser.parsetree``) without running any semantic
+    actions. There is one node per production that was derived, and the
+    nodes are numbered in post-order - children always come before their
+    parent, and the root is the last node. Node ``n`` is described by:
+
+    * ``prod[n]`` - the production id, an index into ``productions``, which
+      is the parser's list of ``(symbol, rule, action)`` triples.
+    * ``start[n]``, ``end[n]`` - the span of the node, as indices into
+      ``lexemes`` (the list of all ``Lexeme`` objects read by the parser,
+      ending with the EOF lexeme.)
+    * ``first[n]`` - the offset of the first node of the subtree rooted at
+      ``n``. The children of ``n`` are found by walking backwards from
+      ``n - 1``, skipping over each child's subtree (see ``children``).
+
+    The tree only stores the last three relative to the parent ``p`` of
+    each node, in ``head[n] = start[n] - start[p]``, ``lead[n] = first[n] -
+    first[p]`` and ``tail[n]``, the number of lexemes between the end of
+    ``n`` and the start of the next child of ``p`` (or the end of ``p``, for
+    its last child.) The root counts as the child of a node that spans all
+    of ``lexemes`` and starts at node 0. The other arrays are worked out
+    the first time they are used. A subtree stored this way stays the same
+    wherever it is copied to, and however the input around it changes,
+    which is what ``pcc.ll.LLParser.reparse`` relies on.
+
+    The arrays and lexemes are shared with the trees that ``reparse`` makes
+    from this one, which change them in place, so the ones a tree returns
+    are copies (made once). Trees that share them should not be used from
+    more than one thread at a time.
+
+    ``fold`` evaluates the original semantic actions (or replacements for
+    them) over the tree as many times as needed, without parsing again.
+
+    >>> from pcc.lexer import Lexer
+    >>> from pcc.ll import LLParser
+    >>> l = Lexer()
+    >>> l.addtoken(name='NUM',rule=r'[0-9]+')
+    >>> p = LLParser(l)
+    >>> p.ap('S', "NUM S", lambda x: int(x[0]) + x[1], start_production=True)
+    >>> p.ap('S', "", lambda x: 0)
+    >>> tree = p.parsetree("1 2 3")
+    >>> len(tree)
+    4
+    >>> tree.fold()
+    6
+    >>> tree.fold({'S': lambda x: [x[0]] + x[1] if x[0] else []})
+    ['1', '2', '3']
+    >>> tree.head[0], tree.tail[0], tree.start[0], tree.end[0]
+    (1, 0, 3, 3)
+    """
+
+    def __init__(self, productions, lexemes=None):
+        self.productions = productions
+        self._store = _Store(lexemes if lexemes is not None else [])
+        # (tree, change): this tree is `tree` with `change` made to it (see
+        # _checkout), or None if the store holds this tree.
+        self._undo = None
+        # Where the lexemes have moved since they were lexed (see _lexeme):
+        # from each index in _marks on, by the move at the same place in
+        # _moves.
+        self._marks = []
+        self._moves = []
+        # The copies and arrays worked out for this tree, by name
+        self._views = {}
+
+    def __len__(self):
+        self._checkout()
+        return len(self._store.prod)
+
+    @property
+    def root(self):
+        "The node id of the root of the tree."
+        return len(self) - 1
+
+    @property
+    def lexemes(self):
+        "The list of all ``Lexeme`` objects read by the parser."
+        lexemes = self._views.get('lexemes')
+        if lexemes is None:
+            self._checkout()
+            if self._marks:
+                lexemes = [self._lexeme(index)
+                           for index in range(len(self._store.lexemes))]
+            else:
+                lexemes = self._store.lexemes[:]
+            self._views['lexemes'] = lexemes
+        return lexemes
+
+    @property
+    def prod(self):
+        "The array of the production id of each node."
+        return self._copy('prod')
+
+    @property
+    def head(self):
+        "The array of the start of each node, from the start of its parent."
+        return self._copy('head')
+
+    @property
+    def tail(self):
+        "The array of the lexemes after each node, up to its next sibling."
+        return self._copy('tail')
+
+    @property
+    def lead(self):
+        "The array of the first node of each node, from that of its parent."
+        return self._copy('lead')
+
+    @property
+    def start(self):
+        "The array of the index of the first lexeme of each node."
+        return self._locate()[0]
+
+    @property
+    def end(self):
+        "The array of the index after the last lexeme of each node."
+        return self._locate()[1]
+
+    @property
+    def first(self):
+        "The array of the first node of the subtree of each node."
+        return self._locate()[2]
+
+    def symbol(self,node):
+        "The nonterminal ``Symbol`` derived by `node`."
+        self._checkout()
+        return self.productions[self._store.prod[node]][0]
+
+    def rule(self,node):
+        "The rule (a ``SymbolString``) of the production used by `node`."
+        self._checkout()
+        return self.productions[self._store.prod[node]][1]
+
+    def text(self,node):
+        "The matched text of the lexemes spanned by `node`, space separated."
+        return " ".join(lexeme.match for lexeme in
+                        self._copy('lexemes')[self.start[node]:self.end[node]])
+
+    def children(self,node):
+        "Return a list of the child node ids of `node`, in order."
+        first = self.first
+        result = []
+        child = node - 1
+        while child >= first[node]:
+            result.append(child)
+            child = first[child] - 1
+        result.reverse()
+        return result
+
+    def fold(self,actions=None):
+        """Run semantic actions bottom-up over the tree and return the value
+        of the root, just as the parser's ``parse`` would have.
+
+        `actions` optionally maps nonterminal names to replacement actions,
+        which are called (or used as constants) exactly like the actions given
+        to ``addproduction``. Productions of other nonterminals use their
+        original action. The tree is evaluated in a single pass over its
+        arrays, without recursion.
+        """
+        productions = self.productions
+        lexemes = self._copy('lexemes')
+        start = self.start
+        end = self.end
+        shapes = {}
+        resolved = {}
+        # (value, end) of every node whose parent has not been evaluated
+        stack = []
+
+        for node, prod in enumerate(self.prod):
+            shape = shapes.get(prod)
+            if shape is None:
+                symbol, rule, action = productions[prod]
+                if actions is not None and symbol.name in actions:
+                    action = actions[symbol.name]
+                shape = shapes[prod] = _shape(rule)
+                resolved[prod] = (hasattr(action, '__call__'), action)
+            callable_action, action = resolved[prod]
+
+            codes, count = shape
+            if count:
+                children = stack[-count:]
+                del stack[-count:]
+            child = 0
+            cursor = start[node]
+            values = []
+            for code in codes:
+                if code == _TERMINAL:
+                    values.append(lexemes[cursor].match)
+                    cursor += 1
+                elif code == _NONTERMINAL:
+                    value, cursor = children[child]
+                    child += 1
+                    values.append(value)
+                else:
+                    values.append(None)
+
+            if callable_action:
+                stack.append((action(values),end[node]))
+            else:
+                stack.append((action,end[node]))
+
+        return stack[-1][0]
+
+    def _checkout(self):
+        """Make the store hold this tree, by making the changes that lead to
+        it from the tree it holds, and keeping the ones that lead back."""
+        if self._undo is None:
+            return
+        trees = [self]
+        while trees[-1]._undo is not None:
+            trees.append(trees[-1]._undo[0])
+        for tree in reversed(trees[:-1]):
+            newer, change = tree._undo
+            newer._undo = (tree,_apply(self._store,change))
+            tree._undo = None
+
+    def _copy(self,name):
+        "A copy of the array (or list) `name` of the store, for this tree."
+        view = self._views.get('_' + name)
+        if view is None:
+            self._checkout()
+            view = self._views['_' + name] = getattr(self._store,name)[:]
+        return view
+
+    def _locate(self):
+        "Return the ``start``, ``end`` and ``first`` arrays of the nodes."
+        spans = self._views.get('spans')
+        if spans is not None:
+            return spans
+        self._checkout()
+        store = self._store
+        head, tail, lead = store.head, store.tail, store.lead
+        count = len(store.prod)
+        start = array('l',[0]) * count
+        end = array('l',[0]) * count
+        first = array('l',[0]) * count
+        # The ancestors of the node, innermost last, with the start of their
+        # child after it (their own end, if there is none)
+        stack = []
+        parent_start, limit, parent_first = 0, len(store.lexemes), 0
+        for node in range(count - 1, -1, -1):
+            while stack and first[stack[-1][0]] > node:
+                stack.pop()
+            if stack:
+                entry = stack[-1]
+                parent = entry[0]
+                parent_start, limit = start[parent], entry[1]
+                parent_first = first[parent]
+                entry[1] = start[node] = parent_start + head[node]
+            else:
+                start[node] = head[node]
+            end[node] = limit - tail[node]
+            first[node] = parent_first + lead[node]
+            stack.append([node,end[node]])
+        spans = self._views['spans'] = (start, end, first)
+        return spans
+
+    def _lexeme(self,index):
+        """The lexeme at `index` in ``lexemes``, with its line, position and
+        offset moved to where it is in the input now."""
+        lexeme = self._store.lexemes[index]
+        mark = bisect_right(self._marks,index) - 1
+        if mark < 0 or lexeme.offset is None:
+            return lexeme
+        offset, line, positions = self._moves[mark]
+        if not (offset or line or positions):
+            return lexeme
+        return Lexeme(lexeme.token,lexeme.match,lexeme.line + line,
+                      lexeme.position + positions.get(lexeme.line,0),
+                      lexeme.offset + offset)
+
+    # The methods below work on the store, which must hold this tree.
+
+    def _add(self,prod,start,end,first):
+        """Append the node of production `prod` spanning ``lexemes[start:end]``,
+        whose subtree starts at node `first` - its children are the last
+        nodes added. Until its own parent is added, the node keeps `start`,
+        `end` and `first` in place of ``head``, ``tail`` and ``lead``.
+        """
+        store = self._store
+        head, tail, lead = store.head, store.tail, store.lead
+        child = len(store.prod) - 1
+        limit = end
+        while child >= first:
+            previous = lead[child] - 1
+            tail[child] = limit - tail[child]
+            limit = head[child]
+            head[child] -= start
+            lead[child] -= first
+            child = previous
+        store.prod.append(prod)
+        head.append(start)
+        tail.append(end)
+        lead.append(first)
+
+    def _close(self):
+        "Make the last node added the root of the tree."
+        store = self._store
+        store.tail[-1] = len(store.lexemes) - store.tail[-1]
+
+    def _graft(self,tree,node,first,start,end):
+        """Add `node` of `tree` (whose subtree starts at node `first`) as if
+        it had just been parsed from ``lexemes[start:end]``, as ``_add``
+        would."""
+        store = self._store
+        count = len(store.prod)
+        nodes = slice(first,node + 1)
+        store.prod.extend(tree._store.prod[nodes])
+        store.head.extend(tree._store.head[nodes])
+        store.tail.extend(tree._store.tail[nodes])
+        store.lead.extend(tree._store.lead[nodes])
+        store.head[-1] = start
+        store.tail[-1] = end
+        store.lead[-1] = count
+
+    def _replace(self,node,first,tree,siblings,start,length,lexemes):
+        """Return the tree made from this one by putting the nodes of `tree`
+        in place of the subtree of `node` (which starts at node `first`),
+        and `lexemes` in place of the `length` lexemes from `start` on.
+        `siblings` are the nodes after the subtree whose parent starts
+        before it, which move with the lexemes after `start`.
+
+        The new tree takes over the store, and this one keeps the change
+        back to it.
+        """
+        store = self._store
+        nodes = tree._store
+        nodes.head[-1] = store.head[node]
+        nodes.tail[-1] = store.tail[node]
+        nodes.lead[-1] = store.lead[node]
+        added = len(nodes.prod) - (node + 1 - first)
+        result = ParseTree(self.productions)
+        result._store = store
+        self._undo = (result,_apply(store,(first,node + 1 - first,
+            (nodes.prod,nodes.head,nodes.tail,nodes.lead),
+            [sibling + added for sibling in siblings],
+            len(lexemes) - length,start,length,lexemes)))
+        return result
+
+    def _children(self,node,start,end,first):
+        """The children of `node`, which spans ``lexemes[start:end]`` and
+        whose subtree starts at node `first`, as a list of ``(child, start,
+        end, first)`` tuples in order."""
+        store = self._store
+        head, tail, lead = store.head, store.tail, store.lead
+        result = []
+        child = node - 1
+        limit = end
+        while child >= first:
+            child_first = first + lead[child]
+            child_start = start + head[child]
+            result.append((child,child_start,limit - tail[child],
+                           child_first))
+            limit = child_start
+            child = child_first - 1
+        result.reverse()
+        return result
+
+    def _descend(self,node,start,end,first,test):
+        """Follow the last children of `node` (given as for ``_children``)
+        for as long as they are derived by the same production as `node`
+        and ``test(start, end)`` holds for them, and return the last one
+        reached as a ``(node, start, end, first)`` tuple.
+
+        The nodes of a repetition such as ``X_STAR -> item X_STAR`` are
+        nested as deep as the repetition is long, so they are skipped over
+        with sums over the arrays rather than one by one. `test` must not
+        go from false to true further down.
+        """
+        found = (node,start,end,first)
+        if first >= node:
+            return found
+        store = self._store
+        prod = store.prod[node]
+        size = 16
+        while True:
+            node, start, end, first = found
+            below = store.prod[max(node - size,0):node]
+            if below.count(prod) == len(below):
+                count = len(below)
+            else:
+                count = len(list(takewhile(prod.__eq__,reversed(below))))
+            if count == 0:
+                return found
+            nodes = slice(node - count,node)
+            if count == size:
+                bottom = (start + sum(store.head[nodes]),
+                          end - sum(store.tail[nodes]))
+                if test(*bottom):
+                    found = (node - count,) + bottom + (
+                        first + sum(store.lead[nodes]),)
+                    size *= 2
+                    continue
+            starts = list(accumulate(reversed(store.head[nodes]),
+                                     initial=start))
+            ends = list(accumulate(reversed(store.tail[nodes]),sub,
+                                   initial=end))
+            # The number of levels down that test holds for
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if test(starts[mid],ends[mid]):
+                    lo = mid
+                else:
+                    hi = mid - 1
+            if lo == 0:
+                return found
+            return (node - lo,starts[lo],ends[lo],
+                    first + sum(store.lead[node-lo:node]))
+
+class _Store:
+    """The arrays and lexemes of a ``ParseTree``, and of the trees that
+    ``pcc.ll.LLParser.reparse`` makes from it. They hold one of those trees
+    at a time (see ``ParseTree._checkout``.)"""
+    __slots__ = ('prod','head','tail','lead','lexemes')
+
+    def __init__(self,lexemes):
+        self.prod = array('l')
+        self.head = array('l')
+        self.tail = array('l')
+        self.lead = array('l')
+        self.lexemes = lexemes
+
+def _apply(store,change):
+    """Make `change` to `store`, and return the change that undoes it.
+
+    A change is ``(first, count, nodes, siblings, delta, start, length,
+    lexemes)``: the `count` nodes from `first` on are replaced by `nodes`,
+    a tuple of ``prod``, ``head``, ``tail`` and ``lead`` arrays, and the
+    `length` lexemes from `start` on by `lexemes`. Then ``head`` of each of
+    `siblings` (numbered after the change) goes up by `delta`, and ``lead``
+    by the number of nodes added.
+    """
+    first, count, nodes, siblings, delta, start, length, lexemes = change
+    arrays = (store.prod,store.head,store.tail,store.lead)
+    old = tuple(array[first:first+count] for array in arrays)
+    for array, replacement in zip(arrays,nodes):
+        array[first:first+count] = replacement
+    added = len(nodes[0]) - count
+    head, lead = store.head, store.lead
+    for sibling in siblings:
+        head[sibling] += delta
+        lead[sibling] += added
+    old_lexemes = store.lexemes[start:start+length]
+    store.lexemes[start:start+length] = lexemes
+    return (first,len(nodes[0]),old,[sibling - added for sibling in siblings],
+            -delta,start,len(lexemes),old_lexemes)
+
+def _shape(rule):
+    """Return the tuple of symbol codes of `rule`, and how many of them are
+    nonterminals.
+    """
+    codes = []
+    for symbol in rule:
+        if symbol == EPSILON:
+            codes.append(_EPSILON)
+        elif symbol.terminal():
+            codes.append(_TERMINAL)
+        else:
+            codes.append(_NONTERMINAL)
+    return tuple(codes), codes.count(_NONTERMINAL)
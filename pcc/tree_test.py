@@ -0,0 +1,200 @@
+# tree_test.py - unit tests for tree.py
+
+"""This module provides unit tests for the ``pcc.tree``
+module.
+
+As with all unit test modules, the tests it contains can be executed in many
+ways, but most easily by going to the project root dir and executing
+``python3 setup.py nosetests``.
+"""
+
+import unittest
+
+from pcc.lexer import Lexer
+import pcc.ll as ll
+from pcc.ll import LLParser
+from pcc.parser import ParsingError
+
+class ParseTreeTester(unittest.TestCase):
+    """Test harness for ``pcc.tree.ParseTree`` class.
+
+    """
+
+    def setUp(self):
+        """Create the testing environment"""
+        # Grammar 4.28 in Aho, Ullman et al (except NUM instead of id)
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = LLParser(lexer)
+        p.ap('E','T EP', lambda x: x[0] + x[1], start_production=True)
+        p.ap('EP',"'+' T EP", lambda x: x[1] + x[2])
+        p.ap('EP',"", lambda x: 0)
+        p.ap('T',"F TP", lambda x: x[0] * x[1])
+        p.ap('TP',"'*' F TP", lambda x: x[1] * x[2])
+        p.ap('TP',"", lambda x: 1)
+        p.ap('F',"'(' E ')'", lambda x: x[1])
+        p.ap('F',"NUM", lambda x: int(x[0]))
+        self.parser = p
+
+    def tearDown(self):
+        """Remove the testing environment"""
+        pass
+
+    def test_fold(self):
+        """tree.py: Test folding the original actions over a tree"""
+        for input in ("2+3*4", "5", "1+1+1+1+1+1+1", "(5+2)",
+                      "1+((((((((((3))))))))))", "(1+2)*(3+4)*5"):
+            tree = self.parser.parsetree(input)
+            self.assertEqual(tree.fold(),self.parser.parse(input))
+            self.assertEqual(tree.fold(),self.parser.parse(input))
+
+    def test_fold_actions(self):
+        """tree.py: Test folding replacement actions over a tree"""
+        tree = self.parser.parsetree("2+3*4")
+        count = tree.fold({'F': 1, 'E': lambda x: x[0] + x[1],
+                           'EP': lambda x: x[1] + x[2] if x[0] else 0,
+                           'T': lambda x: x[0] + x[1],
+                           'TP': lambda x: x[1] + x[2] if x[0] else 0})
+        self.assertEqual(count,3)
+
+    def test_structure(self):
+        """tree.py: Test navigating a tree"""
+        tree = self.parser.parsetree("(1+2)*3")
+        root = tree.root
+        self.assertEqual(tree.symbol(root).name,'E')
+        self.assertEqual(tree.start[root],0)
+        self.assertEqual(tree.end[root],len(tree.lexemes))
+        self.assertEqual(tree.lexemes[-1].match,"EOF")
+
+        t, ep = tree.children(root)
+        self.assertEqual(tree.symbol(t).name,'T')
+        self.assertEqual(tree.text(t),"( 1 + 2 ) * 3")
+        self.assertEqual(tree.symbol(ep).name,'EP')
+        self.assertEqual(tree.start[ep],tree.end[ep])
+
+        f, tp = tree.children(t)
+        self.assertEqual(tree.text(f),"( 1 + 2 )")
+        self.assertEqual(tree.text(tp),"* 3")
+        self.assertEqual(str(tree.rule(f)),"LITERAL E LITERAL")
+        self.assertEqual(len(tree.children(f)),1)
+
+        for node in range(len(tree)):
+            self.assertTrue(tree.first[node] <= node)
+            for child in tree.children(node):
+                self.assertTrue(tree.start[node] <= tree.start[child])
+                self.assertTrue(tree.end[child] <= tree.end[node])
+
+    def test_error(self):
+        """tree.py: Test syntax errors while building a tree"""
+        with self.assertRaises(ParsingError):
+            self.parser.parsetree("(1+2")
+
+    def _check_reparse(self,tree,start,end,text):
+        new_input = tree.input[:start] + text + tree.input[end:]
+        new = self.parser.reparse(tree,start,end,text)
+        fresh = self.parser.parsetree(new_input)
+        self.assertEqual(new.input,new_input)
+        self.assertEqual(list(new.prod),list(fresh.prod))
+        self.assertEqual(list(new.start),list(fresh.start))
+        self.assertEqual(list(new.end),list(fresh.end))
+        self.assertEqual(list(new.first),list(fresh.first))
+        self.assertEqual([(x.match,x.line,x.position,x.offset)
+                          for x in new.lexemes],
+                         [(x.match,x.line,x.position,x.offset)
+                          for x in fresh.lexemes])
+        self.assertEqual(new.fold(),fresh.fold())
+        return new
+
+    def test_reparse(self):
+        """tree.py: Test incremental reparsing after edits"""
+        input = "(1+2)*3 + 4*(5+6)\n+ 7 + (8)\n* 9"
+        tree = self.parser.parsetree(input)
+        for start,end,text in ((0,0,"2*"), (1,2,"10"), (2,3,"1+1"),
+                               (5,7,""), (len(input),len(input),"+1"),
+                               (8,9,"+\n\n"), (17,18,"  "), (0,len(input),"3"),
+                               (10,10," "), (13,16,"(5+6)*2")):
+            self._check_reparse(tree,start,end,text)
+
+        # A sequence of edits, each applied to the last result
+        for start,end,text in ((0,0,"1+"), (3,4,"(2+3)"), (10,10,"*4"),
+                               (4,4,"\n")):
+            tree = self._check_reparse(tree,start,end,text)
+
+        with self.assertRaises(ParsingError):
+            self.parser.reparse(tree,0,1,"+")
+
+    def test_reparse_reuse(self):
+        """tree.py: Test that reparsing reuses untouched subtrees"""
+        input = "+".join("({}*2)".format(i) for i in range(200))
+        tree = self.parser.parsetree(input)
+
+        calls = []
+        original = ll._rd_tree_rule
+        def counting(*args,**kwargs):
+            calls.append(args[1])
+            return original(*args,**kwargs)
+        ll._rd_tree_rule = counting
+        try:
+            middle = input.index("(100*")
+            new = self.parser.reparse(tree,middle+1,middle+4,"7")
+        finally:
+            ll._rd_tree_rule = original
+
+        self.assertEqual(new.fold(),tree.fold() - 186)
+        # Far fewer productions were parsed than the tree has nodes
+        self.assertTrue(len(calls) < len(new) / 10)
+
+    def test_reparse_versions(self):
+        """tree.py: Test that reparsed trees leave the old ones intact"""
+        inputs = ["(1+2)*3 + 4"]
+        trees = [self.parser.parsetree(inputs[0])]
+        for start,end,text in ((1,2,"10"), (0,0,"2*"), (8,10,"")):
+            trees.append(self.parser.reparse(trees[-1],start,end,text))
+            inputs.append(inputs[-1][:start] + text + inputs[-1][end:])
+        # A second edit of an old tree
+        trees.append(self.parser.reparse(trees[1],0,0,"(3)*"))
+        inputs.append("(3)*" + inputs[1])
+
+        for index in (0,2,4,1,3,0):
+            tree = trees[index]
+            fresh = self.parser.parsetree(inputs[index])
+            self.assertEqual(tree.input,inputs[index])
+            self.assertEqual(len(tree),len(fresh))
+            self.assertEqual(list(tree.head),list(fresh.head))
+            self.assertEqual(list(tree.tail),list(fresh.tail))
+            self.assertEqual(list(tree.lead),list(fresh.lead))
+            self.assertEqual(tree.text(tree.root),fresh.text(fresh.root))
+            self.assertEqual(tree.fold(),fresh.fold())
+            self._check_reparse(tree,0,0,"1*")
+
+    def test_reparse_lexemes(self):
+        """tree.py: Test the lexemes of reparsed trees"""
+        input = "1 + 2\n* 3 + 4"
+        tree = self.parser.parsetree(input)
+        self.assertIsNone(tree.lexemes[-1].offset)
+        new = self._check_reparse(tree,0,1,"5")
+        self.assertIsNone(new.lexemes[-1].offset)
+        # Lexemes that did not move are the same objects
+        for old, lexeme in zip(tree.lexemes[1:],new.lexemes[1:]):
+            self.assertIs(old,lexeme)
+        new = self._check_reparse(tree,4,5,"(22\n)")
+        self.assertIs(new.lexemes[1],tree.lexemes[1])
+        self.assertEqual(new.lexemes[-2].line,3)
+
+    def test_long_list(self):
+        """tree.py: Test trees of lists longer than the recursion limit"""
+        lexer = Lexer()
+        lexer.addtoken(name='NUM',rule=r'[0-9]+')
+        p = LLParser(lexer)
+        p.ap('S',"ITEM*",lambda x: sum(x[0]),start_production=True)
+        p.ap('ITEM',"NUM ';'",lambda x: int(x[0]))
+        input = "1;" * 5000
+        self.assertEqual(p.parse(input),5000)
+        tree = p.parsetree(input)
+        self.assertEqual(tree.fold(),5000)
+        new = p.reparse(tree,5000,5001,"7")
+        self.assertEqual(new.fold(),5006)
+        self.assertEqual(list(new.end),list(p.parsetree(new.input).end))
+        new = p.reparse(new,0,0,"2;")
+        self.assertEqual(new.fold(),5008)
+        self.assertEqual(len(new),len(tree) + 2)